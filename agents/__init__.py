@@ -1,7 +1,13 @@
 """
 OpenAI Agent for SFDC Campaign Clarity
 """
-from .campaign_agent import CampaignAgent
 
 __all__ = ['CampaignAgent']
 
+
+def __getattr__(name):
+    # Loaded on first access: the agent imports openai, pandas and simple_salesforce
+    if name == 'CampaignAgent':
+        from .campaign_agent import CampaignAgent
+        return CampaignAgent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,7 +8,7 @@ This agent orchestrates the campaign analysis workflow:
 """
 import json
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -282,16 +282,10 @@ Provide all available information in a well-organized, RingCentral-chat-friendly
             
             # Execute each tool call
             for tool_call in message.tool_calls:
-                tool_name = tool_call.function.name
-                tool_args = json.loads(tool_call.function.arguments)
-                
-                print(f"  🔧 Calling tool: {tool_name}")
-                
-                # Execute the tool
-                if tool_name in self.tool_functions:
-                    tool_result = self.tool_functions[tool_name](**tool_args)
-                else:
-                    tool_result = {"error": f"Unknown tool: {tool_name}"}
+                tool_result = self._execute_tool(
+                    tool_call.function.name,
+                    tool_call.function.arguments
+                )
                 
                 # Add tool result to messages
                 messages.append({
@@ -314,6 +308,157 @@ Provide all available information in a well-organized, RingCentral-chat-friendly
             "response": "I've reached the maximum number of processing steps. Please try again."
         }
     
+    def _execute_tool(self, tool_name: str, arguments: str) -> Dict[str, Any]:
+        """
+        Execute one tool call requested by the model
+        
+        Args:
+            tool_name: Name of the tool function
+            arguments: JSON encoded arguments from the model
+            
+        Returns:
+            Tool result dictionary
+        """
+        tool_args = json.loads(arguments or "{}")
+        
+        print(f"  🔧 Calling tool: {tool_name}")
+        
+        if tool_name in self.tool_functions:
+            return self.tool_functions[tool_name](**tool_args)
+        return {"error": f"Unknown tool: {tool_name}"}
+    
+    def _stream_completion(
+        self,
+        messages: list,
+        on_delta: Callable[[str], None],
+        on_discard: Optional[Callable[[int], None]] = None
+    ):
+        """
+        Run one streamed completion, forwarding text deltas as they arrive
+        
+        Once the completion starts calling tools its text is no longer
+        forwarded, and text already forwarded is taken back through on_discard.
+        
+        Args:
+            messages: Conversation messages
+            on_delta: Called with each chunk of answer text
+            on_discard: Called with the number of characters to take back
+            
+        Returns:
+            Tuple of (content, tool_calls) where tool_calls are plain dicts
+        """
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=self.tools,
+            tool_choice="auto",
+            stream=True
+        )
+        
+        content = []
+        tool_calls = {}
+        forwarded = 0
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                if not tool_calls:
+                    forwarded += len(delta.content)
+                    on_delta(delta.content)
+            
+            # Tool calls arrive in fragments keyed by index
+            for fragment in delta.tool_calls or []:
+                call = tool_calls.setdefault(fragment.index, {
+                    "id": None,
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""}
+                })
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function:
+                    call["function"]["name"] += fragment.function.name or ""
+                    call["function"]["arguments"] += fragment.function.arguments or ""
+        
+        if tool_calls and forwarded and on_discard:
+            on_discard(forwarded)
+        
+        return "".join(content), [tool_calls[i] for i in sorted(tool_calls)]
+    
+    def run_stream(
+        self,
+        user_message: str,
+        on_delta: Callable[[str], None],
+        intent: str = 'full_analysis',
+        on_discard: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run the agent like run(), streaming the final answer through on_delta
+        
+        Tool calling rounds are resolved as usual; text of the final completion
+        is passed to on_delta as soon as each token arrives. Text of a round
+        that ends up calling tools is taken back through on_discard.
+        
+        Args:
+            user_message: The user's input message
+            on_delta: Called with each chunk of answer text
+            intent: User intent - 'basic_info', 'ai_description', or 'full_analysis'
+            on_discard: Called with the number of characters to take back
+            
+        Returns:
+            Dictionary containing the agent's full response and metadata
+        """
+        try:
+            intent_instructions = self._get_intent_instructions(intent)
+            full_instructions = self.base_system_instructions + "\n\n" + intent_instructions
+            
+            messages = [
+                {"role": "system", "content": full_instructions},
+                {"role": "user", "content": user_message}
+            ]
+            
+            for iteration in range(1, 11):
+                content, tool_calls = self._stream_completion(messages, on_delta, on_discard)
+                
+                # If no tool calls, the streamed text was the answer
+                if not tool_calls:
+                    return {
+                        "success": True,
+                        "response": content,
+                        "iterations": iteration
+                    }
+                
+                messages.append({
+                    "role": "assistant",
+                    "content": content or None,
+                    "tool_calls": tool_calls
+                })
+                
+                for tool_call in tool_calls:
+                    tool_result = self._execute_tool(
+                        tool_call["function"]["name"],
+                        tool_call["function"]["arguments"]
+                    )
+                    messages.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call["id"],
+                        "content": json.dumps(tool_result)
+                    })
+            
+            return {
+                "success": False,
+                "error": "Maximum iterations reached",
+                "response": "I've reached the maximum number of processing steps. Please try again."
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Agent execution failed: {str(e)}",
+                "response": f"I encountered an error: {str(e)}"
+            }
+    
     def analyze_campaign(self, campaign_id: str) -> Dict[str, Any]:
         """
         Analyze a campaign by ID (convenience method)
@@ -8,15 +8,41 @@ __name__ = 'localConfig'
 __package__ = 'ringcentral_bot_framework'
 
 import copy
+import os
 import re
-from agents import CampaignAgent
-
-# Initialize the Campaign Clarity Agent
-campaign_agent = CampaignAgent()
+import threading
+from ringcentral_bot_framework.core.tracing import span, traced
+
+# The Campaign Clarity Agent pulls in openai, pandas and simple_salesforce,
+# so it is created on the first campaign request instead of at import time.
+# Validation handshakes and help/identity messages never load them.
+_campaign_agent = None
+_campaign_agent_lock = threading.Lock()
+
+
+def get_campaign_agent():
+    """Return the shared CampaignAgent, creating it on first use"""
+    global _campaign_agent
+    if _campaign_agent is None:
+        with _campaign_agent_lock:
+            if _campaign_agent is None:
+                with span('agent.init'):
+                    from agents import CampaignAgent
+                    agent = CampaignAgent()
+                # Time Salesforce lookups and AI generation as separate stages in /metrics
+                agent.tool_functions = {
+                    name: traced(f'agent.tool.{name}')(func)
+                    for name, func in agent.tool_functions.items()
+                }
+                _campaign_agent = agent
+    return _campaign_agent
 
 # Store last campaign ID per group for context
 last_campaign_by_group = {}
 
+# Stream agent answers into the "thinking" post instead of waiting for the full reply
+STREAM_REPLIES = os.getenv('STREAM_REPLIES', 'yes') != 'no'
+
 def botJoinPrivateChatAction(bot, groupId, user, dbAction):
     """
     This is invoked when the bot is added to a private group.
@@ -266,12 +292,15 @@ Just mention me with ![:Person]({bot.id}) and your request!"""
             'full_analysis': f'📊 Performing full analysis of campaign `{campaign_id}`...\n\nThis may take a few seconds.'
         }
         
-        bot.sendMessage(
-            groupId,
-            {
-                'text': thinking_messages.get(intent, f'🔍 Analyzing campaign `{campaign_id}`...')
-            }
-        )
+        thinking_message = {
+            'text': thinking_messages.get(intent, f'🔍 Analyzing campaign `{campaign_id}`...')
+        }
+        stream = None
+        if STREAM_REPLIES:
+            # Answer tokens are edited into this post as they arrive
+            stream = bot.streamMessage(groupId, thinking_message)
+        else:
+            bot.sendMessage(groupId, thinking_message)
         
         try:
             # If this is a follow-up, inject the campaign ID into the message for the agent
@@ -291,7 +320,20 @@ Just mention me with ![:Person]({bot.id}) and your request!"""
                 print(f"  💬 Transformed message: '{clean_text}' → '{agent_message}'")
             
             # Call the agent with intent
-            result = campaign_agent.run(agent_message, intent=intent)
+            campaign_agent = get_campaign_agent()
+            if stream:
+                with span('agent.run'):
+                    result = campaign_agent.run_stream(
+                        agent_message,
+                        stream.write,
+                        intent=intent,
+                        on_discard=stream.drop
+                    )
+                stream.close(format_agent_response_for_chat(result))
+                return
+            
+            with span('agent.run'):
+                result = campaign_agent.run(agent_message, intent=intent)
             
             # Format and send response
             formatted_response = format_agent_response_for_chat(result)
@@ -304,7 +346,10 @@ Just mention me with ![:Person]({bot.id}) and your request!"""
             
         except Exception as e:
             error_message = f"❌ **Error analyzing campaign**\n\nSomething went wrong: {str(e)}\n\nPlease check the campaign ID and try again, or contact support if the issue persists."
-            bot.sendMessage(groupId, {'text': error_message})
+            if stream:
+                stream.close(error_message)
+            else:
+                bot.sendMessage(groupId, {'text': error_message})
     
     else:
         # No campaign ID found - provide guidance
@@ -0,0 +1,146 @@
+'''
+cold start benchmark, each run is a fresh python process like a new lambda container:
+import framework and bot.py config, init, then handle
+1. a webhook validation-token handshake
+2. a non campaign message (help), bot reply posted to a local stub server
+
+python dev/benchmark/cold_start.py [runs]
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+heavyModules = ['openai', 'pandas', 'simple_salesforce', 'openpyxl', 'boto3']
+botId = '100'
+
+child = '''
+import time
+t0 = time.perf_counter()
+import sys, json
+sys.path.insert(0, ROOT)
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core.common import path_import
+conf = path_import('localConfig', ROOT + '/bot.py')
+t1 = time.perf_counter()
+framework = frameworkInit(conf)
+t2 = time.perf_counter()
+framework.router({
+  'pathParameters': {'action': 'bot-webhook'},
+  'headers': {'validation-token': 'vt'},
+  'body': None
+})
+t3 = time.perf_counter()
+framework.router({
+  'pathParameters': {'action': 'bot-webhook'},
+  'headers': {},
+  'body': {
+    'uuid': 'u-1',
+    'ownerId': BOT_ID,
+    'body': {
+      'id': 'p-1',
+      'eventType': 'PostAdded',
+      'type': 'TextMessage',
+      'groupId': 'g1',
+      'creatorId': 'c1',
+      'text': '![:Person](' + BOT_ID + ') help'
+    }
+  }
+})
+t4 = time.perf_counter()
+sys.stderr.write('RESULT ' + json.dumps({
+  'import': t1 - t0,
+  'init': t2 - t1,
+  'handshake': t3 - t2,
+  'message': t4 - t3,
+  'loaded': [m for m in HEAVY if m in sys.modules]
+}) + '\\n')
+'''
+
+stubRequests = []
+
+class StubHandler(BaseHTTPRequestHandler):
+
+  def reply(self):
+    stubRequests.append(self.path)
+    length = int(self.headers.get('Content-Length') or 0)
+    self.rfile.read(length)
+    body = json.dumps({'id': 'stub-post'}).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = reply
+
+  def log_message(self, *args):
+    pass
+
+def prepareDb(folder):
+  p = os.path.join(folder, 'bot')
+  os.makedirs(p)
+  with open(os.path.join(p, botId + '.json'), 'w') as f:
+    json.dump({
+      'id': botId,
+      'token': {'access_token': 'x', 'owner_id': botId},
+      'data': {}
+    }, f)
+
+def runOnce(env):
+  start = time.perf_counter()
+  code = child.replace('ROOT', repr(root)).replace('BOT_ID', repr(botId)).replace('HEAVY', repr(heavyModules))
+  out = subprocess.run(
+    [sys.executable, '-c', code],
+    env=env,
+    stdout=subprocess.DEVNULL,
+    stderr=subprocess.PIPE,
+    text=True
+  )
+  total = time.perf_counter() - start
+  lines = [l for l in out.stderr.splitlines() if l.startswith('RESULT ')]
+  if not lines:
+    raise Exception(out.stderr)
+  res = json.loads(lines[-1][7:])
+  res['process'] = total
+  return res
+
+def main():
+  runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  folder = tempfile.mkdtemp()
+  prepareDb(os.path.join(folder, 'filedb'))
+  env = dict(
+    os.environ,
+    RINGCENTRAL_BOT_CLIENT_ID='x',
+    RINGCENTRAL_BOT_CLIENT_SECRET='y',
+    RINGCENTRAL_USER_CLIENT_ID='x',
+    RINGCENTRAL_USER_CLIENT_SECRET='y',
+    RINGCENTRAL_SERVER=f'http://127.0.0.1:{server.server_port}',
+    RINGCENTRAL_BOT_SERVER='http://localhost',
+    FILEDB_FOLDER_NAME=os.path.join(folder, 'filedb'),
+    DB_TYPE='filedb',
+    ENV='production'
+  )
+  try:
+    results = [runOnce(env) for i in range(runs)]
+  finally:
+    server.shutdown()
+    shutil.rmtree(folder)
+  keys = ['process', 'import', 'init', 'handshake', 'message']
+  print(f'cold start, {runs} runs, median ms')
+  for key in keys:
+    values = sorted(map(lambda r: r[key], results))
+    print(f'  {key:10} {values[len(values) // 2] * 1000:8.1f}')
+  print('  heavy modules loaded:', ', '.join(results[0]['loaded']) or 'none')
+  print('  rest calls per run:', len(stubRequests) // runs)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,83 @@
+'''
+gunicorn settings for `SERVER_MODE=production python dev/server/server.py`
+or `gunicorn -c dev/server/gunicorn.conf.py --pythonpath dev/server server:app`
+graceful reload: `kill -HUP <master pid>`, new workers start,
+old workers finish in flight requests within SERVER_GRACEFUL_TIMEOUT
+'''
+import os
+import sys
+import multiprocessing
+
+port = '9898'
+host = 'localhost'
+try:
+  port = os.environ['PORT']
+  host = os.environ['HOST']
+except:
+  pass
+
+SERVER_WORKERS = multiprocessing.cpu_count() * 2 + 1
+SERVER_THREADS = 4
+SERVER_TIMEOUT = 60
+SERVER_GRACEFUL_TIMEOUT = 30
+# restart worker after this many requests, 0 to never restart
+SERVER_MAX_REQUESTS = 0
+try:
+  SERVER_WORKERS = int(os.environ['SERVER_WORKERS'])
+except:
+  pass
+try:
+  SERVER_THREADS = int(os.environ['SERVER_THREADS'])
+except:
+  pass
+try:
+  SERVER_TIMEOUT = int(os.environ['SERVER_TIMEOUT'])
+except:
+  pass
+try:
+  SERVER_GRACEFUL_TIMEOUT = int(os.environ['SERVER_GRACEFUL_TIMEOUT'])
+except:
+  pass
+try:
+  SERVER_MAX_REQUESTS = int(os.environ['SERVER_MAX_REQUESTS'])
+except:
+  pass
+
+bind = f'{host}:{port}'
+workers = SERVER_WORKERS
+threads = SERVER_THREADS
+worker_class = 'gthread'
+timeout = SERVER_TIMEOUT
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT
+keepalive = 5
+max_requests = SERVER_MAX_REQUESTS
+max_requests_jitter = SERVER_MAX_REQUESTS // 10
+# framework starts threads (job poller, post retry, filedb flush), init in each worker
+preload_app = False
+accesslog = '-'
+
+def on_starting(server):
+  '''
+  memory mode filedb keeps a separate index per worker,
+  workers would overwrite each other's records on flush,
+  webhook dedup defaults to the shared db table with several workers,
+  since each worker only sees its own in memory claims
+  '''
+  if server.cfg.workers <= 1:
+    return
+  memory = os.environ.get('DB_TYPE', 'filedb') == 'filedb' and os.environ.get('FILEDB_MODE') == 'memory'
+  if memory:
+    server.log.error(
+      'FILEDB_MODE=memory does not work with several workers, set SERVER_WORKERS=1 or use file mode, sqlite or dynamodb'
+    )
+    sys.exit(1)
+  if os.environ.get('WEBHOOK_DEDUP') == 'no':
+    return
+  if not os.environ.get('WEBHOOK_DEDUP_SHARED'):
+    # workers init the framework after fork, they read it from env
+    os.environ['WEBHOOK_DEDUP_SHARED'] = 'yes'
+    server.log.info('several workers, WEBHOOK_DEDUP_SHARED=yes')
+  elif os.environ['WEBHOOK_DEDUP_SHARED'] != 'yes':
+    server.log.warning(
+      'WEBHOOK_DEDUP_SHARED is not yes with several workers, a redelivered webhook may run again in another worker'
+    )
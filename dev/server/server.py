@@ -1,8 +1,36 @@
-from flask import Flask, request
+'''
+bot server
+dev: python dev/server/server.py, single process flask server with reloader
+production: SERVER_MODE=production python dev/server/server.py,
+prefork gunicorn workers (see gunicorn.conf.py), each worker imports `server:app`
+'''
 from dotenv import load_dotenv
 load_dotenv()
 import os, sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../..')
+import importlib.util
+
+SERVER_MODE = 'dev'
+try:
+  SERVER_MODE = os.environ['SERVER_MODE']
+except:
+  pass
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+if __name__ == '__main__' and SERVER_MODE == 'production':
+  if importlib.util.find_spec('gunicorn') is None:
+    sys.exit('SERVER_MODE=production needs gunicorn, run `pip install gunicorn` or unset SERVER_MODE')
+  # framework is never initialized in the master process,
+  # its background threads would not survive fork
+  os.execvp(sys.executable, [
+    sys.executable, '-m', 'gunicorn',
+    '--config', os.path.join(here, 'gunicorn.conf.py'),
+    '--pythonpath', here,
+    'server:app'
+  ])
+
+from flask import Flask, request
+sys.path.append(here + '/../..')
 from ringcentral_bot_framework import frameworkInit
 import config as conf
 # import ringcentral_bot_framework_extension_world_time as wt
@@ -29,16 +57,17 @@ def act(action):
       headers = response['headers']
   return resp, response['statusCode'], headers
 
-port = 9898
-host = 'localhost'
-try:
-  port = os.environ['PORT']
-  host = os.environ['HOST']
-except:
-  pass
-app.run(
-  host=host,
-  port=port,
-  debug=True,
-  load_dotenv=True
-)
+if __name__ == '__main__':
+  port = 9898
+  host = 'localhost'
+  try:
+    port = os.environ['PORT']
+    host = os.environ['HOST']
+  except:
+    pass
+  app.run(
+    host=host,
+    port=port,
+    debug=True,
+    load_dotenv=True
+  )
@@ -13,6 +13,17 @@ from .user_webhook import initUserWebhook
 from .interactive import initInteractive
 from .route import initRouter
 from .flask_request_parser import flaskRequestParser
+from .aio import initAsyncRouter, initAsgiApp
+from .http_pool import poolStats
+from . import group_index
+from .dedup import Dedup
+from .metrics import initMetricsView
+from .health import initHealthView, initReadyView
+from .tracing import stageStats
+from .jobs import JobQueue, initJobsView, JOB_POLL_ON_START
+from .token_manager import getTokenManager
+from .extensions import ExtensionDispatcher
+from . import unit_of_work
 import pydash as _
 
 def frameworkInit(config, extensions = None):
@@ -20,23 +31,26 @@ def frameworkInit(config, extensions = None):
   init bot framwork from config object and extensions array
   '''
   extensions = extensions or _.get(config, 'extensions') or []
+  dispatcher = ExtensionDispatcher(extensions)
   conf = initConfig(config)
   dbAction = initDBAction(conf)
-  BotClass, getBot, removeBot = initBotClass(conf, dbAction)
+  jobQueue = JobQueue(dbAction)
+  BotClass, getBot, removeBot = initBotClass(conf, dbAction, jobQueue)
   UserClass, getUser, removeUser = initUserClass(conf, dbAction)
-  botAuth, renewBot = initBotAuthHandler(conf, BotClass, dbAction)
+  botAuth, renewBot = initBotAuthHandler(conf, BotClass, dbAction, jobQueue)
+  dedup = Dedup(dbAction)
   botWebhook = initBotWebhook(
-    conf, dbAction, BotClass, UserClass, getBot, getUser, extensions
+    conf, dbAction, BotClass, UserClass, getBot, getUser, dispatcher, dedup
   )
   dataView = initDataView(conf, dbAction)
   userAuth = initUserAuth(
     conf, BotClass, getBot, UserClass, dbAction
   )
   userWebhook = initUserWebhook(
-    conf, BotClass, getBot, UserClass, getUser, dbAction
+    conf, BotClass, getBot, UserClass, getUser, dbAction, dedup
   )
   onInteractive = initInteractive(
-    conf, getBot, dbAction, extensions
+    conf, getBot, dbAction, dispatcher
   )
 
   routes = {
@@ -46,7 +60,11 @@ def frameworkInit(config, extensions = None):
     'bot-webhook': botWebhook,
     'user-webhook': userWebhook,
     'data': dataView,
-    'interactive': onInteractive
+    'interactive': onInteractive,
+    'metrics': initMetricsView(lambda: BotFrameWork.stats()),
+    'health': initHealthView(),
+    'ready': initReadyView(dbAction),
+    'jobs': initJobsView(jobQueue)
   }
 
   router = initRouter(routes)
@@ -73,6 +91,11 @@ def frameworkInit(config, extensions = None):
       * for remove, {'id': xxx} or {'ids': [...]}
       * for update, {'id': xxx, 'update': {...}}
       * for get, singleUser:{'id': xxx}, allUser: None, query: { 'key': 'xx', 'value': 'yy' }
+      * for batchGet, {'ids': [...]}, return list of found records
+      * for batchAdd, {'items': [{'id': 'xxx', ...}, ...]}
+      * for batchRemove, {'ids': [...]}
+      * for page, {'limit': n, 'cursor': lastId}, return {'items': [...], 'cursor': next cursor or None}
+      * for lease, {'id': xxx, 'key': 'field', 'until': t, 'now': t, 'create'?: bool}, set field to until if it is missing or before now, atomic, return True if set
       """
       return dbAction(tableName, action, data)
 
@@ -90,6 +113,93 @@ def frameworkInit(config, extensions = None):
       '''
       return removeBot(id)
 
+    @staticmethod
+    def botCacheStats():
+      '''
+      bot record cache counters: size, hits, misses, evictions, hitRate
+      '''
+      return BotClass.cache.stats()
+
+    @staticmethod
+    def httpPoolStats():
+      '''
+      shared http pool counters: requests, errors, connectionsOpened, connectionsReused
+      '''
+      return poolStats()
+
+    @staticmethod
+    def botWorkerStats():
+      '''
+      background bot handler pool counters, used when BOT_WEBHOOK_ASYNC=yes:
+      queueDepth, active, rejected, failed, waitSeconds, durationSeconds
+      '''
+      return _.assign(
+        botWebhook.workerPool.stats(),
+        {
+          'ordered': botWebhook.orderedExecutor.stats()
+        }
+      )
+
+    @staticmethod
+    def rateLimitStats():
+      '''
+      outbound post limiter counters: waited, waitSeconds, throttled,
+      retryPending, retried, dropped
+      '''
+      return BotClass.rateLimiter.stats()
+
+    @staticmethod
+    def tokenStats():
+      '''
+      user token refresh counters: refreshed, collapsed, failed, inflight
+      '''
+      return getTokenManager().stats()
+
+    @staticmethod
+    def dedupStats():
+      '''
+      webhook dedup counters: checked, duplicates, hitRate, size
+      '''
+      return dedup.stats()
+
+    @staticmethod
+    def unitOfWorkStats():
+      '''
+      events run in unit of work, db reads saved, writes deferred and flushed
+      '''
+      return unit_of_work.stats()
+
+    @staticmethod
+    def stageStats():
+      '''
+      traced stage counters: {stage: {count, errors, sum, avg}}
+      '''
+      return stageStats()
+
+    @staticmethod
+    def stats():
+      '''
+      all framework counters, also exported by /metrics route
+      '''
+      return {
+        'bot_cache': BotFrameWork.botCacheStats(),
+        'http_pool': BotFrameWork.httpPoolStats(),
+        'bot_worker': BotFrameWork.botWorkerStats(),
+        'rate_limit': BotFrameWork.rateLimitStats(),
+        'dedup': BotFrameWork.dedupStats(),
+        'tokens': BotFrameWork.tokenStats(),
+        'unit_of_work': BotFrameWork.unitOfWorkStats(),
+        'jobs': jobQueue.stats()
+      }
+
+    @staticmethod
+    def jobQueue():
+      '''
+      durable delayed job queue:
+      jobQueue().register(type, handler), jobQueue().schedule(type, payload, delaySeconds)
+      '''
+      return jobQueue
+
     @staticmethod
     def getUser(id):
       '''
@@ -97,6 +207,14 @@ def frameworkInit(config, extensions = None):
       '''
       return getUser(id)
 
+    @staticmethod
+    def botGroupUsers(botId, groupId = None):
+      '''
+      user ids in one group of bot, or in all groups of bot if groupId is None,
+      from the bot group index, seeded from users on first use
+      '''
+      return group_index.getGroupUsers(dbAction, botId, groupId)
+
     @staticmethod
     def removeUser(id):
       '''
@@ -138,13 +256,28 @@ def frameworkInit(config, extensions = None):
         'statusCode': number
       }
       '''
-      for extension in extensions:
-        if hasattr(extension, 'route') and _.predicates.is_function(extension.route):
-          res = extension.route(event, BotFrameWork)
-          if not res is None:
-            return res
+      if dispatcher.has('route'):
+        res = dispatcher.route(event, BotFrameWork)
+        if not res is None:
+          return res
       return router(event)
 
+    @staticmethod
+    async def arouter(event):
+      '''
+      async version of router, same event and result format,
+      config hooks and extension functions could be coroutines
+      '''
+      return await arouter(event)
+
+    @staticmethod
+    def asgiApp():
+      '''
+      return asgi app, run with any asgi server, like:
+      uvicorn.run(framework.asgiApp())
+      '''
+      return initAsgiApp(BotFrameWork.arouter)
+
     @staticmethod
     def flaskRequestParser(request, action):
       '''
@@ -160,5 +293,10 @@ def frameworkInit(config, extensions = None):
       '''
       return flaskRequestParser(request, action)
 
+  arouter = initAsyncRouter(BotFrameWork.router)
+  if JOB_POLL_ON_START:
+    # resume jobs saved before restart
+    jobQueue.startPolling()
+
   return BotFrameWork
 
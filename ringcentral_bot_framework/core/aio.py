@@ -0,0 +1,192 @@
+"""
+async support
+run the sync event pipeline from an asyncio event loop,
+and allow config hooks / extension functions to be coroutines
+"""
+import os
+import inspect
+import threading
+import functools
+import json
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import pydash as _
+from .unit_of_work import syncPoint
+
+ASYNC_WORKER_COUNT = 64
+# threads for blocking calls awaited by coroutines, like bot.asendMessage
+ASYNC_HELPER_COUNT = 32
+try:
+  ASYNC_WORKER_COUNT = int(os.environ['ASYNC_WORKER_COUNT'])
+except:
+  pass
+try:
+  ASYNC_HELPER_COUNT = int(os.environ['ASYNC_HELPER_COUNT'])
+except:
+  pass
+
+local = threading.local()
+executorHolder = {}
+executorLock = threading.Lock()
+
+def getExecutor(name = 'executor'):
+  '''
+  shared thread pools,
+  executor: the sync pipeline runs in it when called from arouter,
+  its threads wait for coroutine hooks running in the event loop,
+  helper: blocking calls awaited by those hooks, a separate pool,
+  so hooks never wait for a thread held by the pipeline
+  '''
+  with executorLock:
+    if not name in executorHolder:
+      executorHolder[name] = ThreadPoolExecutor(
+        max_workers=ASYNC_WORKER_COUNT if name == 'executor' else ASYNC_HELPER_COUNT,
+        thread_name_prefix='rc-bot-aio' if name == 'executor' else 'rc-bot-aio-helper'
+      )
+    return executorHolder[name]
+
+def resolveAwaitable(res):
+  '''
+  if res is awaitable, wait for it and return the value,
+  when running under arouter, the coroutine runs in the main event loop,
+  otherwise it runs in a new event loop
+  '''
+  if not inspect.isawaitable(res):
+    return res
+
+  # asyncio is imported on first async use, sync deployments skip its import cost
+  import asyncio
+
+  async def wrap():
+    return await res
+
+  loop = getattr(local, 'loop', None)
+  if not loop is None and loop.is_running():
+    # main loop does not see unit of work of this thread
+    syncPoint()
+    try:
+      return asyncio.run_coroutine_threadsafe(wrap(), loop).result()
+    finally:
+      syncPoint()
+  return asyncio.run(wrap())
+
+def callHook(func, *args):
+  '''
+  call config hook or extension function, sync or async
+  '''
+  return resolveAwaitable(func(*args))
+
+def runWithLoop(loop, func, *args):
+  local.loop = loop
+  try:
+    return func(*args)
+  finally:
+    local.loop = None
+
+async def runInThread(func, *args, **kwargs):
+  '''
+  run blocking function in the helper thread pool, return awaitable result,
+  coroutines it resolves run in their own event loop
+  '''
+  import asyncio
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(
+    getExecutor('helper'),
+    functools.partial(func, *args, **kwargs)
+  )
+
+def initAsyncRouter(router):
+  async def arouter(event):
+    '''
+    async version of router, the sync pipeline runs in thread pool,
+    coroutine hooks run in current event loop
+    '''
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+      getExecutor(),
+      functools.partial(runWithLoop, loop, router, event)
+    )
+  return arouter
+
+def asgiEvent(scope, body):
+  '''
+  parse asgi scope and body to event format
+  '''
+  path = scope.get('path') or '/'
+  action = path.strip('/').split('/')[-1]
+  query = parse_qs(scope.get('query_string', b'').decode('utf-8'))
+  headers = {}
+  for k, v in scope.get('headers') or []:
+    headers[k.decode('latin-1')] = v.decode('latin-1')
+  body = body.decode('utf-8')
+  if body and 'application/x-www-form-urlencoded' in (headers.get('content-type') or ''):
+    body = parse_qs(body)
+  return {
+    'pathParameters': {
+      'action': action
+    },
+    'queryStringParameters': query,
+    'body': body,
+    'headers': headers
+  }
+
+def initAsgiApp(arouter):
+  '''
+  return asgi app, use with uvicorn/hypercorn etc.
+  '''
+  async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+      while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+          await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+          await send({'type': 'lifespan.shutdown.complete'})
+          return
+
+    if scope['type'] != 'http':
+      return
+
+    body = b''
+    more = True
+    while more:
+      message = await receive()
+      body += message.get('body', b'')
+      more = message.get('more_body', False)
+
+    response = await arouter(asgiEvent(scope, body))
+    resp = _.get(response, 'body') or ''
+    # iterator body (e.g. data viewer) is streamed chunk by chunk
+    isStream = hasattr(resp, '__next__')
+    if not isStream and not _.predicates.is_string(resp) and not isinstance(resp, bytes):
+      resp = json.dumps(resp)
+    if _.predicates.is_string(resp):
+      resp = resp.encode('utf-8')
+    headers = []
+    for k, v in (_.get(response, 'headers') or {}).items():
+      if not v is None:
+        headers.append((str(k).lower().encode('latin-1'), str(v).encode('latin-1')))
+    await send({
+      'type': 'http.response.start',
+      'status': _.get(response, 'statusCode') or 200,
+      'headers': headers
+    })
+    if isStream:
+      while True:
+        # chunks may read db, produce them off the event loop
+        chunk = await runInThread(next, resp, None)
+        if chunk is None:
+          break
+        await send({
+          'type': 'http.response.body',
+          'body': chunk.encode('utf-8') if _.predicates.is_string(chunk) else chunk,
+          'more_body': True
+        })
+      resp = b''
+    await send({
+      'type': 'http.response.body',
+      'body': resp
+    })
+
+  return app
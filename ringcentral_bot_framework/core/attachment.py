@@ -0,0 +1,137 @@
+"""
+attachment fetcher
+streams download through the shared http session into a spooled temp file
+(memory first, disk past ATTACHMENT_SPOOL_BYTES), with size and time limits,
+content type sniffed from the first bytes
+"""
+import os
+import time
+import tempfile
+from .http_pool import getSession, HttpError, HTTP_TIMEOUT
+from .tracing import span
+
+ATTACHMENT_MAX_BYTES = 20 * 1024 * 1024
+# seconds for the whole download
+ATTACHMENT_TIMEOUT = 60.0
+ATTACHMENT_SPOOL_BYTES = 1024 * 1024
+try:
+  ATTACHMENT_MAX_BYTES = int(os.environ['ATTACHMENT_MAX_BYTES'])
+except:
+  pass
+try:
+  ATTACHMENT_TIMEOUT = float(os.environ['ATTACHMENT_TIMEOUT'])
+except:
+  pass
+try:
+  ATTACHMENT_SPOOL_BYTES = int(os.environ['ATTACHMENT_SPOOL_BYTES'])
+except:
+  pass
+
+chunkSize = 64 * 1024
+
+# (prefix, offset, content type)
+signatures = [
+  (b'\x89PNG\r\n\x1a\n', 0, 'image/png'),
+  (b'\xff\xd8\xff', 0, 'image/jpeg'),
+  (b'GIF87a', 0, 'image/gif'),
+  (b'GIF89a', 0, 'image/gif'),
+  (b'WEBP', 8, 'image/webp'),
+  (b'BM', 0, 'image/bmp'),
+  (b'%PDF-', 0, 'application/pdf'),
+  (b'PK\x03\x04', 0, 'application/zip'),
+  (b'\x1f\x8b', 0, 'application/gzip')
+]
+
+class AttachmentError(Exception):
+  pass
+
+class AttachmentTooLarge(AttachmentError):
+  pass
+
+class AttachmentTimeout(AttachmentError):
+  pass
+
+def sniffType(head):
+  '''
+  content type from magic bytes, None if unknown
+  '''
+  for prefix, offset, contentType in signatures:
+    if head[offset:offset + len(prefix)] == prefix:
+      return contentType
+  return None
+
+class Attachment:
+  '''
+  downloaded attachment, file is rewound and ready to read,
+  use as context manager or call close() to drop temp file
+  '''
+
+  def __init__(self, file, size, contentType, name):
+    self.file = file
+    self.size = size
+    self.contentType = contentType
+    self.name = name
+
+  def read(self):
+    self.file.seek(0)
+    return self.file.read()
+
+  def close(self):
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+def fetchAttachment(
+  url,
+  name = '',
+  maxBytes = None,
+  timeout = None,
+  headers = None
+):
+  '''
+  download url into Attachment,
+  raise AttachmentTooLarge / AttachmentTimeout / HttpError
+  '''
+  maxBytes = ATTACHMENT_MAX_BYTES if maxBytes is None else maxBytes
+  timeout = ATTACHMENT_TIMEOUT if timeout is None else timeout
+  deadline = time.monotonic() + timeout
+  file = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_BYTES)
+  try:
+    with span('attachment.fetch'):
+      with getSession().get(
+        url,
+        headers=headers,
+        stream=True,
+        timeout=min(timeout, HTTP_TIMEOUT)
+      ) as r:
+        if not r.ok:
+          raise HttpError(r)
+        length = r.headers.get('Content-Length')
+        if not length is None and length.isdigit() and int(length) > maxBytes:
+          raise AttachmentTooLarge(f'{length} bytes, max {maxBytes}')
+        size = 0
+        head = b''
+        for chunk in r.iter_content(chunkSize):
+          size = size + len(chunk)
+          if size > maxBytes:
+            raise AttachmentTooLarge(f'over {maxBytes} bytes')
+          if time.monotonic() > deadline:
+            raise AttachmentTimeout(f'not done in {timeout}s')
+          if len(head) < 16:
+            head = head + chunk[0:16]
+          file.write(chunk)
+        headerType = (r.headers.get('Content-Type') or '').split(';')[0].strip()
+    file.seek(0)
+    return Attachment(
+      file,
+      size,
+      sniffType(head) or headerType or 'application/octet-stream',
+      name
+    )
+  except Exception:
+    file.close()
+    raise
@@ -1,11 +1,21 @@
 
 from os import environ
-from ringcentral_client import RestClient
 from .common import debug, printError
-from .self_run import selfTrigger
+from .self_run import lambdaName
+from .jobs import RetryJob
+from .aio import runInThread
+from .http_pool import PooledRestClient
+from .cache import TTLCache
+from .rate_limit import getRateLimiter
+from .post_stream import PostStream, textMessage
+from .subscription import createSubscription, renewSubscription, findSubscriptions
+from .attachment import fetchAttachment
+from .broadcast import broadcast
+from .unit_of_work import memoize, forget, afterFlush
 from pydash.predicates import is_dict
 from pydash.objects import omit
 import json
+import copy
 
 try:
   RINGCENTRAL_BOT_CLIENT_ID = environ['RINGCENTRAL_BOT_CLIENT_ID']
@@ -16,16 +26,42 @@ try:
 except Exception as e:
   printError(e, 'load env')
 
-def initBotClass(conf, dbAction):
+# seconds before retrying subscribe of a just created bot
+BOT_RENEW_DELAY = 50
+BOT_SUBSCRIPTION_EXPIRES_IN = 500000000
+
+# bot records cached per process, a bot changed or removed by another process
+# is seen here only after BOT_CACHE_TTL seconds
+BOT_CACHE_SIZE = 1000
+BOT_CACHE_TTL = 30
+try:
+  BOT_CACHE_SIZE = int(environ['BOT_CACHE_SIZE'])
+except:
+  pass
+try:
+  BOT_CACHE_TTL = int(environ['BOT_CACHE_TTL'])
+except:
+  pass
+
+def initBotClass(conf, dbAction, jobQueue):
+  botCache = TTLCache(BOT_CACHE_SIZE, BOT_CACHE_TTL)
+  rateLimiter = getRateLimiter()
+
+  def uncache(id):
+    # again after deferred writes land, so no stale record is cached meanwhile
+    botCache.delete(id)
+    afterFlush(lambda: botCache.delete(id))
+
   class Bot:
 
     def __init__(
       self,
       id=None,
       token=None,
-      data=None
+      data=None,
+      subscription=None
     ):
-      self.rc = RestClient(
+      self.rc = PooledRestClient(
         RINGCENTRAL_BOT_CLIENT_ID,
         RINGCENTRAL_BOT_CLIENT_SECRET,
         RINGCENTRAL_SERVER
@@ -38,6 +74,8 @@ def initBotClass(conf, dbAction):
         self.data = data
       if not id is None:
         self.id = id
+      # {id, expirationTime, filters} of webhook subscription
+      self.subscription = subscription
 
     eventFilters = conf.botFilters()
     id = ''
@@ -45,7 +83,9 @@ def initBotClass(conf, dbAction):
     data = {}
 
     def writeToDb(self, item=False):
+      uncache(self.id)
       if is_dict(item):
+        uncache(item.get('id'))
         dbAction('bot', 'add', item)
       else:
         dbAction('bot', 'update', {
@@ -100,60 +140,79 @@ def initBotClass(conf, dbAction):
         'data': self.data
       })
 
+    def subscribeFailed(self, e, event, type):
+      debug(e)
+      errStr = str(e)
+      if event is None:
+        printError(e, type)
+      elif 'OAU-232' in errStr or 'SUB-406' in errStr or 'Not allowed subscribe' in errStr:
+        self.retrySubscribe(event)
+      else:
+        printError(e, type)
+
+    def saveSubscription(self, subscription):
+      self.subscription = subscription
+      uncache(self.id)
+      dbAction('bot', 'update', {
+        'id': self.id,
+        'update': {
+          'subscription': subscription
+        }
+      })
+
     def setupWebhook(self, event):
       try:
-        self.rc.post('/restapi/v1.0/subscription', {
-          'eventFilters': self.eventFilters,
-          'expiresIn': 500000000,
-          'deliveryMode': {
-            'transportType': 'WebHook',
-            'address': RINGCENTRAL_BOT_SERVER + '/bot-webhook'
-          }
-        })
+        self.saveSubscription(createSubscription(
+          self.rc,
+          RINGCENTRAL_BOT_SERVER + '/bot-webhook',
+          self.eventFilters,
+          BOT_SUBSCRIPTION_EXPIRES_IN
+        ))
       except Exception as e:
-        debug(e)
-        errStr = str(e)
-        if 'OAU-232' in errStr or 'SUB-406' in errStr or 'Not allowed subscribe' in errStr:
-          printError('bot subscribe fail, will do subscribe one minutes later')
-          event['wait'] = 50
-          event['botId'] = self.id
-          event['token'] = self.token
-          event['pathParameters']['action'] = 'renew-bot'
-          selfTrigger(event, conf, dbAction, Bot)
-        else:
-          printError(e, 'setupWebhook')
+        self.subscribeFailed(e, event, 'setupWebhook')
 
     def renewWebHooks(self, event, removeOnly = False):
+      '''
+      renew cached subscription in place, see subscription.renewSubscription,
+      removeOnly: delete all bot subscriptions
+      '''
+      address = RINGCENTRAL_BOT_SERVER + '/bot-webhook'
       try:
-        r = self.rc.get('/restapi/v1.0/subscription')
-        r = json.loads(r.text)['records']
-        filtered = list(filter(
-          lambda x: x['deliveryMode']['address'] == RINGCENTRAL_BOT_SERVER + '/bot-webhook',
-          r
+        if removeOnly:
+          for sub in findSubscriptions(self.rc, address):
+            self.delSubscription(sub['id'])
+          self.subscription = None
+          return
+        self.saveSubscription(renewSubscription(
+          self.rc,
+          self.subscription,
+          address,
+          self.eventFilters,
+          BOT_SUBSCRIPTION_EXPIRES_IN
         ))
-        debug(
-          'bot subs list',
-          ','.join(list(map(lambda g: g['id'], filtered)))
-        )
-        if not removeOnly:
-          self.setupWebhook(event)
-        for sub in filtered:
-          self.delSubscription(sub['id'])
 
       except Exception as e:
-        debug(e)
-        errStr = str(e)
-        if event is None:
-          printError(e, 'renewWebHooks')
-        elif 'OAU-232' in errStr or 'SUB-406' in errStr or 'Not allowed subscribe' in errStr:
-          printError('bot subscribe fail, will do subscribe one minutes later')
-          event['wait'] = 50
-          event['botId'] = self.id
-          event['token'] = self.token
-          event['pathParameters']['action'] = 'renew-bot'
-          selfTrigger(event, conf, dbAction, Bot)
-        else:
-          printError(e, 'renewWebHooks')
+        if isinstance(e, RetryJob):
+          raise
+        self.subscribeFailed(e, event, 'renewWebHooks')
+
+    def retrySubscribe (self, event):
+      '''
+      new bot may not subscribe yet, retry later in durable job queue,
+      when already running as the job, raise so job queue backs off
+      '''
+      if is_dict(event) and event.get('job'):
+        raise RetryJob('bot subscribe fail')
+      printError('bot subscribe fail, will do subscribe one minutes later')
+      jobQueue.schedule(
+        'renew-bot',
+        {
+          'botId': self.id,
+          'token': self.token
+        },
+        BOT_RENEW_DELAY,
+        'renew-bot_' + str(self.id)
+      )
 
     def delSubscription (self, id):
       debug('del bot sub id:', id)
@@ -163,21 +222,52 @@ def initBotClass(conf, dbAction):
         printError(e, 'delSubscription')
 
     def sendMessage (self, groupId, messageObj):
+      '''
+      post under rate limit, on 429/503 the post is queued and retried
+      in background after earlier queued posts of the group
+      (inline in lambda, which may freeze after response),
+      return response, None if queued or failed
+      '''
       try:
         url = f'/restapi/v1.0/glip/groups/{groupId}/posts'
-        self.rc.post(
-          url,
-          messageObj
+        return rateLimiter.call(
+          self.id,
+          groupId,
+          lambda: self.rc.post(url, messageObj),
+          not lambdaName()
         )
       except Exception as e:
         printError(e, 'sendMessage')
 
+    def broadcast (self, groupIds, messageObj):
+      '''
+      post messageObj to many groups concurrently (BROADCAST_CONCURRENCY),
+      each post under rate limit like sendMessage,
+      return {
+        'sent': n, 'queued': n, 'failed': n,
+        'groups': {groupId: {'status': 'sent' | 'queued' | 'failed', 'postId' or 'error'}}
+      }
+      '''
+      def post(groupId):
+        url = f'/restapi/v1.0/glip/groups/{groupId}/posts'
+        return rateLimiter.call(
+          self.id,
+          groupId,
+          lambda: self.rc.post(url, messageObj),
+          not lambdaName()
+        )
+      res = broadcast(post, groupIds)
+      if res['failed'] > 0:
+        printError(f'{res["failed"]} of {len(res["groups"])} groups failed', 'broadcast')
+      return res
+
     def sendAdaptiveCard (self, groupId, messageObj):
       try:
         url = f'/restapi/v1.0/glip/chats/{groupId}/adaptive-cards'
-        return self.rc.post(
-          url,
-          messageObj
+        return rateLimiter.call(
+          self.id,
+          groupId,
+          lambda: self.rc.post(url, messageObj)
         )
       except Exception as e:
         printError(e, 'sendMessage')
@@ -185,13 +275,33 @@ def initBotClass(conf, dbAction):
     def updateAdaptiveCard (self, postId, messageObj):
       try:
         url = f'/restapi/v1.0/glip/adaptive-cards/{postId}'
-        return self.rc.put(
-          url,
-          messageObj
+        return rateLimiter.call(
+          self.id,
+          None,
+          lambda: self.rc.put(url, messageObj)
         )
       except Exception as e:
         printError(e, 'sendMessage')
 
+    def updateMessage (self, groupId, postId, messageObj):
+      try:
+        url = f'/restapi/v1.0/glip/chats/{groupId}/posts/{postId}'
+        return rateLimiter.call(
+          self.id,
+          groupId,
+          lambda: self.rc.patch(url, messageObj)
+        )
+      except Exception as e:
+        printError(e, 'updateMessage')
+
+    def streamMessage (self, groupId, messageObj, render = textMessage, card = False):
+      '''
+      post messageObj (or adaptive card if card is True), return PostStream,
+      stream.write(text) edits the post with throttled updates,
+      render(text) builds message object of each edit
+      '''
+      return PostStream(self, groupId, messageObj, render, card)
+
     def rename (self, newName):
       return self.rc.put(
         '/restapi/v1.0/account/~/extension/~',
@@ -200,13 +310,29 @@ def initBotClass(conf, dbAction):
         }
       )
 
-    def setAvatar (self, data, name):
-      files = {'image': (name, data, 'image/png')}
+    def setAvatar (self, data, name, contentType = 'image/png'):
+      '''
+      data: bytes or file object, e.g. fetched attachment file
+      '''
+      files = {'image': (name, data, contentType)}
       return self.rc.put(
         '/restapi/v1.0/account/~/extension/~/profile-image',
         files = files
       )
 
+    def fetchAttachment(self, attachment, maxBytes = None):
+      '''
+      download post attachment {contentUri, name} with size and time limits,
+      return Attachment, close it when done:
+      with bot.fetchAttachment(attachment) as file:
+        file.contentType, file.size, file.read()
+      '''
+      return fetchAttachment(
+        attachment['contentUri'],
+        attachment.get('name') or '',
+        maxBytes
+      )
+
     def validate (self, returnData=False):
       try:
         res = self.platform.get('/restapi/v1.0/account/~/extension/~')
@@ -219,27 +345,64 @@ def initBotClass(conf, dbAction):
         return False
 
     def destroy(self):
+      uncache(self.id)
       self.renewWebHooks(None, True)
       removeBot(self.id)
 
-  def getBot(id):
+    async def arequest(self, method, *args, **kwargs):
+      '''
+      awaitable rest call, method: get, post, put, patch, delete
+      '''
+      return await runInThread(getattr(self.rc, method), *args, **kwargs)
+
+    async def asendMessage(self, groupId, messageObj):
+      return await runInThread(self.sendMessage, groupId, messageObj)
+
+    async def abroadcast(self, groupIds, messageObj):
+      return await runInThread(self.broadcast, groupIds, messageObj)
+
+    async def asendAdaptiveCard(self, groupId, messageObj):
+      return await runInThread(self.sendAdaptiveCard, groupId, messageObj)
+
+    async def aupdateAdaptiveCard(self, postId, messageObj):
+      return await runInThread(self.updateAdaptiveCard, postId, messageObj)
+
+    async def avalidate(self, returnData=False):
+      return await runInThread(self.validate, returnData)
+
+  def loadBot(id):
+    '''
+    new Bot from a copy of cached record, threads never share one instance
+    '''
     if not id:
       return False
-    botData = dbAction('bot', 'get', {
-      'id': id
-    })
-    if is_dict(botData):
-      return Bot(
-        botData['id'],
-        botData['token'],
-        botData['data']
-      )
+    botData = botCache.get(id)
+    if botData is None:
+      botData = dbAction('bot', 'get', {
+        'id': id
+      })
+      if not is_dict(botData):
+        return False
+      botCache.set(id, copy.deepcopy(botData))
     else:
-      return False
+      botData = copy.deepcopy(botData)
+    return Bot(
+      botData['id'],
+      botData['token'],
+      botData['data'],
+      botData.get('subscription')
+    )
+
+  getBot = memoize('bot', loadBot)
 
   def removeBot(id):
+      uncache(id)
+      forget('bot', id)
       return dbAction('bot', 'remove', {
         'id': id
       })
 
+  Bot.cache = botCache
+  Bot.rateLimiter = rateLimiter
+
   return Bot, getBot, removeBot
@@ -1,11 +1,11 @@
 """
 bot auth
 """
-import time
 from .common import result, debug, getQueryParam
-from pydash.predicates import is_number, is_string
+from pydash.predicates import is_string
+from .aio import callHook
 
-def initBotAuthHandler(conf, Bot, dbAction):
+def initBotAuthHandler(conf, Bot, dbAction, jobQueue):
   def botAuth(event):
     bot = Bot()
     code = getQueryParam(event, 'code')
@@ -15,17 +15,14 @@ def initBotAuthHandler(conf, Bot, dbAction):
       bot.authPrivateBot(event['body'])
 
     bot.renewWebHooks(event)
-    conf.botAuthAction(bot, dbAction)
+    callHook(conf.botAuthAction, bot, dbAction)
     return result('Bot added')
 
   def renewBot (event):
     """
-    for self call renewbot async
+    retry bot subscribe, run by job queue
     """
-    debug('self tringgering renew bot')
-    if is_number(event['wait']):
-      time.sleep(event['wait'])
-
+    debug('renew bot', event['botId'])
     bot = Bot()
     bot.id = event['botId']
     bot.token = event['token']
@@ -38,4 +35,16 @@ def initBotAuthHandler(conf, Bot, dbAction):
     bot.renewWebHooks(event)
     return result('Bot renew done')
 
+  def renewBotJob (payload):
+    renewBot({
+      'job': True,
+      'pathParameters': {
+        'action': 'renew-bot'
+      },
+      'botId': payload['botId'],
+      'token': payload['token']
+    })
+
+  jobQueue.register('renew-bot', renewBotJob)
+
   return botAuth, renewBot
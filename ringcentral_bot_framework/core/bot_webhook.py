@@ -1,8 +1,55 @@
 from .common import result, debug
 import time
 from pydash import get, is_dict
-from .extensions import runExtensionFunction
 from .hidden_cmd import hiddenCmd
+from .aio import callHook
+from .worker_pool import WorkerPool, KeyedExecutor
+from .tracing import span, traced
+from .unit_of_work import unitOfWork, LazyObject
+import os
+
+# yes: reply webhook at once, run bot handlers in background worker pool
+# do not enable in AWS Lambda, background work is frozen after response
+# queued events are only in memory, lost on crash or restart since the webhook is acked
+BOT_WEBHOOK_ASYNC = False
+BOT_WORKER_COUNT = 8
+BOT_WORKER_QUEUE_SIZE = 1000
+try:
+  BOT_WEBHOOK_ASYNC = os.environ['BOT_WEBHOOK_ASYNC'] == 'yes'
+except:
+  pass
+try:
+  BOT_WORKER_COUNT = int(os.environ['BOT_WORKER_COUNT'])
+except:
+  pass
+try:
+  BOT_WORKER_QUEUE_SIZE = int(os.environ['BOT_WORKER_QUEUE_SIZE'])
+except:
+  pass
+
+# async mode: events with same key run in order, different keys run in parallel
+# group: key by groupId, group,creator: key by groupId and creatorId, none: no order
+BOT_ORDER_BY = 'group'
+BOT_KEY_QUEUE_SIZE = 100
+try:
+  BOT_ORDER_BY = os.environ['BOT_ORDER_BY']
+except:
+  pass
+try:
+  BOT_KEY_QUEUE_SIZE = int(os.environ['BOT_KEY_QUEUE_SIZE'])
+except:
+  pass
+
+def orderKey(message, body):
+  '''
+  ordering key of event, None means no ordering
+  '''
+  if BOT_ORDER_BY == 'none':
+    return None
+  key = (get(message, 'ownerId'), get(body, 'groupId') or get(body, 'id'))
+  if BOT_ORDER_BY == 'group,creator':
+    key = key + (get(body, 'creatorId'),)
+  return key
 
 def initBotWebhook(
   conf,
@@ -11,8 +58,10 @@ def initBotWebhook(
   User,
   getBot,
   getUser,
-  extensions
+  dispatcher,
+  dedup
 ):
+  @traced('bot_webhook')
   def botWebhook(event):
     message = get(event, 'body')
     body = get(message, 'body')
@@ -24,30 +73,73 @@ def initBotWebhook(
     if not is_dict(body) :
       return defaultResponse
 
+    if dedup.isDuplicate('bot', message):
+      debug('bot webhook duplicate event', get(message, 'uuid'))
+      return defaultResponse
+
+    if not BOT_WEBHOOK_ASYNC:
+      handleEvent(event)
+    elif not dispatch(orderKey(message, body), event):
+      # running it here would overtake queued events of same group,
+      # let RingCentral redeliver it later instead
+      dedup.release('bot', message)
+      return result('bot webhook busy', 503, {
+        'headers': {
+          'Retry-After': '5'
+        }
+      })
+    return defaultResponse
+
+  def dispatch(key, event):
+    if key is None:
+      return workerPool.submit(handleEvent, event)
+    return orderedExecutor.submit(key, handleEvent, event)
+
+  @traced('bot_webhook.handle')
+  def handleEvent(event):
+    '''
+    one unit of work per event: records read once, writes flushed at the end,
+    failed event is released from dedup so its redelivery runs again
+    '''
+    message = get(event, 'body')
+    try:
+      with unitOfWork(dbAction):
+        runHandlers(event)
+    except:
+      dedup.release('bot', message)
+      raise
+    dedup.done('bot', message)
+
+  def runHandlers(event):
+    message = get(event, 'body')
+    body = get(message, 'body')
     botId = get(message, 'ownerId')
     eventType = get(body, 'eventType')
     msgType = get(body, 'type')
     groupId = get(body, 'groupId') or get(body, 'id')
-    bot = getBot(botId)
+    with span('bot_webhook.get_bot'):
+      bot = getBot(botId)
     creatorId = get(body, 'creatorId')
     if not isinstance(bot, Bot):
-      return defaultResponse
+      return
 
-    user = getUser(creatorId)
-    if user == False:
-      user = User()
+    def loadUser():
+      with span('bot_webhook.get_user'):
+        return getUser(creatorId) or User()
+
+    # loaded only if a handler uses it
+    user = LazyObject(loadUser)
     if eventType == 'GroupJoined':
-      conf.botJoinPrivateChatAction(bot, groupId, user, dbAction)
+      callHook(conf.botJoinPrivateChatAction, bot, groupId, user, dbAction)
 
     elif eventType == 'PostAdded' and msgType == 'TextMessage':
       # for bot self post, ignore
       if creatorId == botId:
-        return defaultResponse
+        return
       text = get(body, 'text') or ''
       if hiddenCmd(bot, groupId, text, event):
-        return defaultResponse
-      handledByExtension = runExtensionFunction(
-        extensions,
+        return
+      handledByExtension = dispatcher.run(
         'botGotPostAddAction',
         bot,
         groupId,
@@ -57,26 +149,30 @@ def initBotWebhook(
         dbAction,
         event
       )
-      conf.botGotPostAddAction(
-        bot,
-        groupId,
-        creatorId,
-        user,
-        text,
-        dbAction,
-        handledByExtension,
-        event
-      )
+      with span('bot_webhook.post_added_action'):
+        callHook(
+          conf.botGotPostAddAction,
+          bot,
+          groupId,
+          creatorId,
+          user,
+          text,
+          dbAction,
+          handledByExtension,
+          event
+        )
 
     elif eventType == 'Delete':
-      conf.botDeleteAction(
+      callHook(
+        conf.botDeleteAction,
         bot,
         message,
         dbAction
       )
 
     elif eventType == 'GroupLeft':
-      conf.botGroupLeftAction(
+      callHook(
+        conf.botGroupLeftAction,
         bot,
         message,
         dbAction
@@ -84,8 +180,7 @@ def initBotWebhook(
 
     else:
       text = get(body, 'text') or ''
-      handledByExtension = runExtensionFunction(
-        extensions,
+      handledByExtension = dispatcher.run(
         'defaultEventHandler',
         bot,
         groupId,
@@ -95,7 +190,8 @@ def initBotWebhook(
         dbAction,
         event
       )
-      conf.defaultEventHandler(
+      callHook(
+        conf.defaultEventHandler,
         bot,
         groupId,
         creatorId,
@@ -106,6 +202,12 @@ def initBotWebhook(
         event
       )
 
-    return defaultResponse
-
+  workerPool = WorkerPool(
+    BOT_WORKER_COUNT,
+    BOT_WORKER_QUEUE_SIZE,
+    'rc-bot-webhook'
+  )
+  orderedExecutor = KeyedExecutor(workerPool, BOT_KEY_QUEUE_SIZE)
+  botWebhook.workerPool = workerPool
+  botWebhook.orderedExecutor = orderedExecutor
   return botWebhook
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+message fan-out to many groups
+posts run in a shared bounded thread pool, each still under the rate limiter,
+result reports every group: sent, queued (429/503, retried in background) or failed
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .post_stream import postId
+from .tracing import span
+
+BROADCAST_CONCURRENCY = 16
+try:
+  BROADCAST_CONCURRENCY = int(os.environ['BROADCAST_CONCURRENCY'])
+except:
+  pass
+
+executorHolder = {}
+executorLock = threading.Lock()
+
+def getExecutor():
+  '''
+  process wide pool, bounds posts in flight across all broadcasts
+  '''
+  with executorLock:
+    if not 'executor' in executorHolder:
+      executorHolder['executor'] = ThreadPoolExecutor(
+        max_workers=BROADCAST_CONCURRENCY,
+        thread_name_prefix='rc-bot-broadcast'
+      )
+    return executorHolder['executor']
+
+def sendOne(post, groupId):
+  try:
+    res = post(groupId)
+    if res is None:
+      return {
+        'status': 'queued'
+      }
+    return {
+      'status': 'sent',
+      'postId': postId(res)
+    }
+  except Exception as e:
+    return {
+      'status': 'failed',
+      'error': str(e)
+    }
+
+def broadcast(post, groupIds):
+  '''
+  run post(groupId) for each group concurrently,
+  post returns response, None if queued for retry, raises on failure,
+  return {
+    'sent': n, 'queued': n, 'failed': n,
+    'groups': {groupId: {'status', 'postId' or 'error'}}
+  }
+  '''
+  groupIds = list(dict.fromkeys(groupIds))
+  with span('broadcast'):
+    if len(groupIds) == 1:
+      results = [sendOne(post, groupIds[0])]
+    else:
+      executor = getExecutor()
+      futures = list(map(lambda g: executor.submit(sendOne, post, g), groupIds))
+      results = list(map(lambda f: f.result(), futures))
+  res = {
+    'sent': 0,
+    'queued': 0,
+    'failed': 0,
+    'groups': {}
+  }
+  for groupId, r in zip(groupIds, results):
+    res[r['status']] = res[r['status']] + 1
+    res['groups'][groupId] = r
+  return res
@@ -0,0 +1,94 @@
+"""
+in-process cache
+bounded, thread safe, lru eviction with ttl
+"""
+import time
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+
+  def __init__(self, maxSize=1000, ttl=300):
+    '''
+    maxSize: max items to keep, least recently used evicted first
+    ttl: seconds an item lives, 0 disables the cache
+    '''
+    self.maxSize = maxSize
+    self.ttl = ttl
+    self.items = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def enabled(self):
+    return self.ttl > 0 and self.maxSize > 0
+
+  def get(self, key):
+    '''
+    return cached value or None
+    '''
+    if not self.enabled():
+      return None
+    with self.lock:
+      item = self.items.get(key)
+      if item is None:
+        self.misses = self.misses + 1
+        return None
+      value, expire = item
+      if expire < time.monotonic():
+        del self.items[key]
+        self.misses = self.misses + 1
+        return None
+      self.items.move_to_end(key)
+      self.hits = self.hits + 1
+      return value
+
+  def set(self, key, value):
+    if not self.enabled():
+      return
+    with self.lock:
+      self.items[key] = (value, time.monotonic() + self.ttl)
+      self.items.move_to_end(key)
+      while len(self.items) > self.maxSize:
+        self.items.popitem(last=False)
+        self.evictions = self.evictions + 1
+
+  def add(self, key, value):
+    '''
+    set only if key not cached or expired, return True if set
+    '''
+    if not self.enabled():
+      return True
+    with self.lock:
+      item = self.items.get(key)
+      if not item is None and item[1] >= time.monotonic():
+        self.items.move_to_end(key)
+        return False
+      self.items[key] = (value, time.monotonic() + self.ttl)
+      self.items.move_to_end(key)
+      while len(self.items) > self.maxSize:
+        self.items.popitem(last=False)
+        self.evictions = self.evictions + 1
+      return True
+
+  def delete(self, key):
+    with self.lock:
+      self.items.pop(key, None)
+
+  def clear(self):
+    with self.lock:
+      self.items.clear()
+
+  def stats(self):
+    with self.lock:
+      total = self.hits + self.misses
+      return {
+        'size': len(self.items),
+        'maxSize': self.maxSize,
+        'ttl': self.ttl,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'hitRate': self.hits / total if total else 0
+      }
@@ -62,8 +62,11 @@ def result(
     'body': msg or '',
   }, options)
 
+# renew event is sent this many seconds before subscription expires
+SUBSCRIBE_THRESHOLD = 59
+
 def subscribeInterval():
-  return '/restapi/v1.0/subscription/~?threshold=59&interval=15'
+  return f'/restapi/v1.0/subscription/~?threshold={SUBSCRIBE_THRESHOLD}&interval=15'
 
 def defaultEventHandler(event):
   return {
@@ -75,4 +78,28 @@ def getQueryParam(event, key):
   v = _.get(event, f'queryStringParameters.{key}')
   if _.predicates.is_list(v):
     return v[0]
-  return v
\ No newline at end of file
+  return v
+
+def leaseFree(record, data):
+  '''
+  lease db action check: record has no lease in data['key'] or it ended before data['now'],
+  a missing record is only leased with data['create']
+  '''
+  if not _.predicates.is_dict(record):
+    return bool(data.get('create'))
+  v = record.get(data['key'])
+  try:
+    return v is None or float(v) < float(data['now'])
+  except (TypeError, ValueError):
+    return True
+
+def leased(record, data):
+  '''
+  record after lease db action took it
+  '''
+  record = dict(record) if _.predicates.is_dict(record) else {
+    'id': str(data['id'])
+  }
+  _.assign(record, data.get('update') or {})
+  record[data['key']] = data['until']
+  return record
@@ -6,6 +6,31 @@ import os
 from os.path import dirname, realpath, join
 import pydash as _
 from .common import path_import, assign_module, printError
+from .group_index import indexTable
+from .jobs import jobTable
+from . import dedup
+
+def frameworkTables():
+  '''
+  tables framework itself needs, added to conf.dbTables() if missing
+  '''
+  tables = [
+    indexTable(),
+    jobTable()
+  ]
+  if dedup.WEBHOOK_DEDUP_SHARED:
+    tables.append(dedup.eventTable())
+  return tables
+
+def withFrameworkTables(dbTables):
+  def tables():
+    res = dbTables()
+    names = list(map(lambda x: x['name'], res))
+    for t in frameworkTables():
+      if not t['name'] in names:
+        res = res + [t]
+    return res
+  return tables
 
 def initConfig(conf):
   try:
@@ -14,6 +39,7 @@ def initConfig(conf):
     defaultConfig = path_import('ringcentral_bot_framework.core.defaultConfig', configPath)
     configAll = defaultConfig
     configAll = assign_module(configAll, conf)
+    configAll.dbTables = withFrameworkTables(configAll.dbTables)
   except Exception as e:
     printError(e)
 
@@ -7,6 +7,8 @@ __name__ = 'defaultConfig'
 __package__ = 'ringcentral_bot_framework.core'
 
 import copy
+import pydash as _
+from . import group_index
 
 '''
 use extensions
@@ -64,23 +66,34 @@ def botGroupLeftAction(
   """
   got message that bot has left chat group
   could do some clean up work here
-  default: remove group id ref in all user database
+  default: remove group id ref from users of the group,
+  found by bot group index
   """
-  users = dbAction('user', 'get')
+  groupId = _.get(message, 'body.groupId') or _.get(message, 'body.id')
+  userIds = group_index.removeGroup(dbAction, bot.id, groupId)
+  if userIds is None:
+    users = dbAction('user', 'get') or []
+  elif len(userIds) == 0:
+    return
+  else:
+    users = dbAction('user', 'batchGet', {
+      'ids': userIds
+    }) or []
   for user in users:
-    id = user['id']
-    groups = user['groups']
+    groups = user.get('groups') or {}
     keys = groups.keys()
     ngroups = copy.deepcopy(groups)
-    for groupId in keys:
-      if groups[groupId] == bot.id:
-        ngroups.pop(groupId, None)
-    dbAction('user', 'update', {
-      'id': id,
-      'update': {
-        'groups': ngroups
-      }
-    })
+    for gid in keys:
+      if groups[gid] == bot.id and (groupId is None or gid == groupId):
+        ngroups.pop(gid, None)
+    if len(ngroups) != len(groups):
+      # only groups, token may have been refreshed since the read
+      dbAction('user', 'update', {
+        'id': user['id'],
+        'update': {
+          'groups': ngroups
+        }
+      })
 
 
 def botDeleteAction(bot, message, dbAction):
@@ -154,13 +167,16 @@ def userEventAction(
   default: post to chatgroup about the event
   if you only have bot app, it is not needed
   """
-  groups = user.groups
-  keys = groups.keys()
-  for groupId in keys:
-    botId = groups[groupId]
+  if eventType == 'PostAdded':
+    return
+  # group ids of each bot, one concurrent broadcast per bot
+  botGroups = {}
+  for groupId, botId in user.groups.items():
+    botGroups.setdefault(botId, []).append(groupId)
+  for botId, groupIds in botGroups.items():
     bot = getBot(botId)
-    if bot != False and eventType != 'PostAdded':
-      bot.sendMessage(groupId, {
+    if bot != False:
+      bot.broadcast(groupIds, {
         'text': f'![:Person]({user.id}), got event "{eventType}"'
       })
 
@@ -258,6 +274,19 @@ def dbWrapper(tableName, action, data = None):
   * for remove, {'id': xxx} or {'ids': [...]}
   * for update, {'id': xxx, 'update': {...}}
   * for get, singleUser:{'id': xxx}, allUser: None, query: { 'key': 'xx', 'value': 'yy' }
+  * for batchGet, {'ids': [...]}, return list of found records, missing ids skipped
+  * for batchAdd, {'items': [{'id': 'xxx', ...}, ...]}, add or replace all items
+  * for batchRemove, {'ids': [...]}
+  * batch actions only called when dbBatchSupported() returns True,
+  * otherwise framework runs them as single record actions
+  * for page, {'limit': n, 'cursor': lastId, 'key'?: 'xx', 'value'?: 'yy'},
+  * return {'items': [...], 'cursor': next cursor or None},
+  * only called when dbPageSupported() returns True, otherwise framework pages over get
+  * for lease, {'id': xxx, 'key': 'field', 'until': t, 'now': t, 'create'?: bool, 'update'?: {...}},
+  * set field to until (and merge update) only if field is missing or before now,
+  * missing record only created when create is True, return True if set,
+  * must be atomic, only called when dbLeaseSupported() returns True,
+  * otherwise framework runs it as get then add
   """
 
   # todo prepare/check database
@@ -296,4 +325,26 @@ def dbName():
   return db name
   * set DB_TYPE=custom in .env to activate
   '''
-  return 'custom'
\ No newline at end of file
+  return 'custom'
+
+def dbBatchSupported():
+  '''
+  return True if custom `dbWrapper` handles batchGet, batchAdd, batchRemove
+  and remove with {'ids': [...]}
+  * set DB_TYPE=custom in .env to activate
+  '''
+  return False
+
+def dbPageSupported():
+  '''
+  return True if custom `dbWrapper` handles page action
+  * set DB_TYPE=custom in .env to activate
+  '''
+  return False
+
+def dbLeaseSupported():
+  '''
+  return True if custom `dbWrapper` handles lease action atomically
+  * set DB_TYPE=custom in .env to activate
+  '''
+  return False
@@ -1,9 +1,16 @@
 '''
 data viewer
+/data?tableName=user&limit=50&cursor=xxx&fields=id,groups&id=a,b&key=k&value=v&format=json
+one page of records at a time, streamed record by record,
+token/secret fields always redacted
 '''
 import pydash as _
 from .common import result, getQueryParam
+from .self_run import lambdaName
+from urllib.parse import urlencode
+import html
 import json
+import re
 import os
 
 disabled = True
@@ -12,17 +19,149 @@ try:
 except:
   pass
 
+# no: always return whole page as one string
+DATA_VIEWER_STREAM = True
+try:
+  DATA_VIEWER_STREAM = os.environ['DATA_VIEWER_STREAM'] != 'no'
+except:
+  pass
+
+DATA_VIEWER_PAGE_SIZE = 50
+DATA_VIEWER_MAX_PAGE_SIZE = 500
+try:
+  DATA_VIEWER_PAGE_SIZE = int(os.environ['DATA_VIEWER_PAGE_SIZE'])
+except:
+  pass
+
+sensitiveKey = re.compile(r'token|secret|password', re.IGNORECASE)
+redacted = '[redacted]'
+
+def redact(obj):
+  '''
+  copy of obj with values of sensitive keys replaced
+  '''
+  if _.predicates.is_dict(obj):
+    return {
+      k: redacted if sensitiveKey.search(str(k)) else redact(v)
+      for k, v in obj.items()
+    }
+  if _.predicates.is_list(obj):
+    return list(map(redact, obj))
+  return obj
+
+def project(record, fields):
+  '''
+  keep only fields, dotted paths allowed: fields=id,data.name
+  '''
+  if not fields:
+    return record
+  res = {}
+  for field in fields:
+    v = _.get(record, field)
+    if not v is None:
+      _.set_(res, field, v)
+  return res
+
+def splitParam(v):
+  return list(filter(None, map(lambda x: x.strip(), (v or '').split(','))))
+
+def pageParams(event):
+  limit = DATA_VIEWER_PAGE_SIZE
+  try:
+    limit = int(getQueryParam(event, 'limit'))
+  except:
+    pass
+  return {
+    'tableName': getQueryParam(event, 'tableName') or 'bot',
+    'limit': max(1, min(limit, DATA_VIEWER_MAX_PAGE_SIZE)),
+    'cursor': getQueryParam(event, 'cursor'),
+    'ids': splitParam(getQueryParam(event, 'id')),
+    'fields': splitParam(getQueryParam(event, 'fields')),
+    'key': getQueryParam(event, 'key'),
+    'value': getQueryParam(event, 'value'),
+    'format': getQueryParam(event, 'format') or 'html'
+  }
+
+def loadPage(dbAction, params):
+  '''
+  {items, cursor} of requested ids, or of one page of table
+  '''
+  if len(params['ids']):
+    items = dbAction(params['tableName'], 'batchGet', {
+      'ids': params['ids'][0:params['limit']]
+    })
+    return {
+      'items': items,
+      'cursor': None
+    } if _.predicates.is_list(items) else False
+  query = {
+    'limit': params['limit'],
+    'cursor': params['cursor']
+  }
+  if params['key']:
+    query['key'] = params['key']
+    query['value'] = params['value'] or ''
+  return dbAction(params['tableName'], 'page', query)
+
+def nextLink(params, cursor):
+  query = {
+    'tableName': params['tableName'],
+    'limit': params['limit'],
+    'cursor': cursor
+  }
+  for name in ['key', 'value']:
+    if params[name]:
+      query[name] = params[name]
+  if len(params['fields']):
+    query['fields'] = ','.join(params['fields'])
+  return '?' + urlencode(query)
+
+def renderJson(page, params):
+  yield '{"items":['
+  for i, item in enumerate(page['items']):
+    yield (',' if i else '') + json.dumps(item)
+  yield '],"cursor":' + json.dumps(page['cursor']) + '}'
+
+def renderHtml(page, params):
+  yield f'<h3>{html.escape(params["tableName"])}</h3><pre>'
+  for item in page['items']:
+    yield html.escape(json.dumps(item, indent=2)) + '\n'
+  yield '</pre>'
+  if page['cursor'] is None:
+    yield '<p>end</p>'
+  else:
+    yield f'<a href="{html.escape(nextLink(params, page["cursor"]))}">next</a>'
+
 def initDataView(configAll, dbAction):
   def dataView(event):
-    tables = list(map(lambda x: x['name'], configAll.dbTables()))
     if disabled:
       return result('Data viewer diabled, set DATA_VIEWER_ENABLED=yes to enable it')
-    tableName = getQueryParam(event, 'tableName') or 'bot'
-    if not tableName in tables:
+    params = pageParams(event)
+    table = _.find(configAll.dbTables(), lambda x: x['name'] == params['tableName'])
+    if table is None:
       return result('tableName not right', 400)
-    res = dbAction(tableName, 'get')
-    return result(
-      '<pre>' + json.dumps(res, indent=2) + '</pre>',
-      400
-    )
-  return dataView
\ No newline at end of file
+    fields = list(map(lambda x: x['name'], table.get('schemas') or []))
+    if params['key'] and not params['key'] in fields:
+      return result('key not right, query only schema fields', 400)
+    page = loadPage(dbAction, params)
+    if not _.predicates.is_dict(page):
+      return result('db error', 500)
+
+    def transform(item):
+      return redact(project(item, params['fields']))
+
+    page = {
+      # records are transformed as they are written out
+      'items': map(transform, page['items']),
+      'cursor': page['cursor']
+    }
+    isJson = params['format'] == 'json'
+    body = renderJson(page, params) if isJson else renderHtml(page, params)
+    if not DATA_VIEWER_STREAM or lambdaName():
+      body = ''.join(body)
+    return result(body, 200, {
+      'headers': {
+        'Content-Type': 'application/json' if isJson else 'text/html; charset=UTF-8'
+      }
+    })
+  return dataView
@@ -2,16 +2,107 @@
 db wrapper
 """
 import os
-from os.path import dirname, realpath, join, isabs
 import pydash as _
-import importlib.util
+from importlib import import_module
+from functools import wraps
 from .filedb import initDB, dbName
-from .common import debug, path_import
+from .common import debug, leaseFree, leased
+from .tracing import span
+from .unit_of_work import withUnitOfWork
+
+batchActions = ['batchGet', 'batchAdd', 'batchRemove']
+
+def withBatchFallback(dbAction):
+  '''
+  for custom db wrapper without batch support,
+  run batch actions as single record actions
+  '''
+  def action(tableName, action, data = None):
+    if action == 'batchGet':
+      res = map(
+        lambda id: dbAction(tableName, 'get', { 'id': id }),
+        dict.fromkeys(data['ids'])
+      )
+      return list(filter(_.predicates.is_dict, res))
+    elif action == 'batchAdd':
+      for item in data['items']:
+        dbAction(tableName, 'add', item)
+      return action
+    elif action == 'batchRemove' or (action == 'remove' and not _.get(data, 'ids') is None):
+      for id in data['ids']:
+        dbAction(tableName, 'remove', { 'id': id })
+      return action
+    return dbAction(tableName, action, data)
+  return action
+
+def withPageFallback(dbAction):
+  '''
+  for custom db wrapper without page support,
+  page over get all (or query) result sorted by id
+  '''
+  def action(tableName, action, data = None):
+    if action != 'page':
+      return dbAction(tableName, action, data)
+    query = None
+    if not _.get(data, 'key') is None:
+      query = {
+        'key': data['key'],
+        'value': data['value']
+      }
+    records = dbAction(tableName, 'get', query)
+    if not _.predicates.is_list(records):
+      return False
+    records = sorted(records, key=lambda r: str(r.get('id')))
+    limit = int(_.get(data, 'limit') or 100)
+    cursor = _.get(data, 'cursor')
+    if not cursor is None:
+      records = list(filter(lambda r: str(r.get('id')) > str(cursor), records))
+    items = records[0:limit]
+    return {
+      'items': items,
+      'cursor': str(items[-1].get('id')) if len(records) > limit else None
+    }
+  return action
+
+def withLeaseFallback(dbAction):
+  '''
+  for custom db wrapper without lease support,
+  lease as get then add, not atomic across processes
+  '''
+  def action(tableName, action, data = None):
+    if action != 'lease':
+      return dbAction(tableName, action, data)
+    old = dbAction(tableName, 'get', {
+      'id': data['id']
+    })
+    if not leaseFree(old, data):
+      return False
+    dbAction(tableName, 'add', leased(old, data))
+    return True
+  return action
+
+def withTracing(dbAction):
+  '''
+  time each db action under stage db.{tableName}.{action}
+  '''
+  @wraps(dbAction)
+  def action(tableName, action, data = None):
+    with span(f'db.{tableName}.{action}'):
+      return dbAction(tableName, action, data)
+  return action
+
+def initBuiltInDb(conf, dbType):
+  '''
+  import and init only the selected backend,
+  so e.g. boto3 is never loaded for filedb
+  '''
+  db = import_module('ringcentral_bot_framework.core.' + dbType)
+  return db.initDB(conf), db.dbName
 
 def initDBAction(conf):
-  builtInDbs = ['filedb', 'dynamodb']
+  builtInDbs = ['filedb', 'dynamodb', 'sqlite']
   dbType = 'filedb'
-  dbAction = initDB(conf)
+  dbAction = None
   DBNAME = dbName
 
   try:
@@ -19,25 +110,28 @@ def initDBAction(conf):
   except:
     pass
 
-  pdbName = 'ringcentral_bot_framework.custom_db'
-
   try:
     if dbType in builtInDbs:
-      dir_path = dirname(realpath(__file__))
-      dbPath = join(dir_path, dbType + '.py')
-      pdbName = 'ringcentral_bot_framework.core.' + dbType
-      db = path_import(pdbName, dbPath)
-      dbAction = db.initDB(conf)
-      DBNAME = db.dbName
+      dbAction, DBNAME = initBuiltInDb(conf, dbType)
     elif dbType == 'custom':
       DBNAME = conf.dbName()
       dbAction = conf.dbWrapper
+      if not conf.dbBatchSupported():
+        dbAction = withBatchFallback(dbAction)
+      if not conf.dbPageSupported():
+        dbAction = withPageFallback(dbAction)
+      if not conf.dbLeaseSupported():
+        dbAction = withLeaseFallback(dbAction)
 
   except Exception as e:
     debug(e)
 
+  if dbAction is None:
+    # unknown DB_TYPE or backend failed to init
+    dbAction = initDB(conf)
+    DBNAME = dbName
   type2 = 'custom'
   if dbType in builtInDbs:
     type2 = 'built-in'
   print('Use database', type2, DBNAME)
-  return dbAction
\ No newline at end of file
+  return withUnitOfWork(withTracing(dbAction))
@@ -0,0 +1,203 @@
+"""
+webhook dedup
+RingCentral redelivers webhooks when reply is slow,
+remember handled notification uuid so same event only handled once,
+event is claimed while handled, released if handler fails so redelivery runs it
+"""
+import os
+import time
+import threading
+import pydash as _
+from .cache import TTLCache
+from .common import printError
+
+# yes: skip webhook notifications already handled
+WEBHOOK_DEDUP = True
+WEBHOOK_DEDUP_TTL = 600
+WEBHOOK_DEDUP_SIZE = 10000
+# yes: also record handled events in db, for multiple server processes
+WEBHOOK_DEDUP_SHARED = False
+# seconds other processes skip an event being handled,
+# after that a process that died while handling it no longer blocks redelivery
+WEBHOOK_DEDUP_PROCESSING_TTL = 60
+# seconds between purges of expired events from db, shared mode only
+WEBHOOK_DEDUP_PURGE_INTERVAL = 600
+try:
+  WEBHOOK_DEDUP = os.environ['WEBHOOK_DEDUP'] != 'no'
+except:
+  pass
+try:
+  WEBHOOK_DEDUP_TTL = int(os.environ['WEBHOOK_DEDUP_TTL'])
+except:
+  pass
+try:
+  WEBHOOK_DEDUP_SIZE = int(os.environ['WEBHOOK_DEDUP_SIZE'])
+except:
+  pass
+try:
+  WEBHOOK_DEDUP_SHARED = os.environ['WEBHOOK_DEDUP_SHARED'] == 'yes'
+except:
+  pass
+try:
+  WEBHOOK_DEDUP_PROCESSING_TTL = int(os.environ['WEBHOOK_DEDUP_PROCESSING_TTL'])
+except:
+  pass
+try:
+  WEBHOOK_DEDUP_PURGE_INTERVAL = int(os.environ['WEBHOOK_DEDUP_PURGE_INTERVAL'])
+except:
+  pass
+
+purgePageSize = 500
+
+tableName = 'webhookEvent'
+
+def eventTable():
+  return {
+    'name': tableName,
+    'schemas': [
+      {
+        'name': 'id',
+        'type': 'string',
+        'primary': True
+      },
+      {
+        # dynamodb deletes expired events by this field
+        'name': 'expire',
+        'type': 'number',
+        'ttl': True
+      }
+    ]
+  }
+
+def eventKey(prefix, message):
+  '''
+  notification uuid, or event type + post/group id when uuid missing
+  '''
+  uuid = _.get(message, 'uuid')
+  if uuid:
+    return f'{prefix}_{uuid}'
+  body = _.get(message, 'body')
+  id = _.get(body, 'id')
+  if not id:
+    return None
+  return '_'.join(map(str, [
+    prefix,
+    _.get(message, 'ownerId') or '',
+    _.get(body, 'eventType') or _.get(message, 'event') or '',
+    id
+  ]))
+
+class Dedup:
+
+  def __init__(self, dbAction):
+    self.dbAction = dbAction
+    self.cache = TTLCache(WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_TTL)
+    self.lock = threading.Lock()
+    self.purgeLock = threading.Lock()
+    self.purgedAt = time.time()
+    self.purgeCursor = None
+    self.checked = 0
+    self.duplicates = 0
+
+  def claimInDb(self, key):
+    '''
+    lease event record, False if another process holds or handled it
+    '''
+    now = time.time()
+    return self.dbAction(tableName, 'lease', {
+      'id': key,
+      'key': 'expire',
+      'until': now + WEBHOOK_DEDUP_PROCESSING_TTL,
+      'now': now,
+      'create': True
+    })
+
+  def isDuplicate(self, prefix, message):
+    '''
+    return True if event already seen, otherwise claim it,
+    call done() after it is handled or release() if handling failed
+    '''
+    if not WEBHOOK_DEDUP:
+      return False
+    key = eventKey(prefix, message)
+    if key is None:
+      return False
+    duplicate = not self.cache.add(key, True)
+    if not duplicate and WEBHOOK_DEDUP_SHARED and not self.claimInDb(key):
+      duplicate = True
+      self.cache.delete(key)
+    with self.lock:
+      self.checked = self.checked + 1
+      if duplicate:
+        self.duplicates = self.duplicates + 1
+    return duplicate
+
+  def done(self, prefix, message):
+    '''
+    event handled, skip its redeliveries for WEBHOOK_DEDUP_TTL
+    '''
+    key = eventKey(prefix, message)
+    if not WEBHOOK_DEDUP or not WEBHOOK_DEDUP_SHARED or key is None:
+      return
+    self.dbAction(tableName, 'update', {
+      'id': key,
+      'update': {
+        'expire': time.time() + WEBHOOK_DEDUP_TTL
+      }
+    })
+    self.purge()
+
+  def release(self, prefix, message):
+    '''
+    forget event, so its redelivery is handled
+    '''
+    key = eventKey(prefix, message)
+    if not WEBHOOK_DEDUP or key is None:
+      return
+    self.cache.delete(key)
+    if WEBHOOK_DEDUP_SHARED:
+      self.dbAction(tableName, 'remove', {
+        'id': key
+      })
+
+  def purge(self, force = False):
+    '''
+    remove expired events, one page per WEBHOOK_DEDUP_PURGE_INTERVAL,
+    one thread at a time, dynamodb also expires them by ttl
+    '''
+    now = time.time()
+    if not force and now - self.purgedAt < WEBHOOK_DEDUP_PURGE_INTERVAL:
+      return
+    if not self.purgeLock.acquire(blocking=False):
+      return
+    try:
+      self.purgedAt = now
+      res = self.dbAction(tableName, 'page', {
+        'limit': purgePageSize,
+        'cursor': self.purgeCursor
+      })
+      if not _.predicates.is_dict(res):
+        return
+      # next run goes on from here, back to start after last page
+      self.purgeCursor = res.get('cursor')
+      ids = list(map(
+        lambda r: r['id'],
+        filter(lambda r: float(r.get('expire') or 0) < now, res.get('items') or [])
+      ))
+      if len(ids):
+        self.dbAction(tableName, 'batchRemove', {
+          'ids': ids
+        })
+    except Exception as e:
+      printError(e, 'webhook dedup purge')
+    finally:
+      self.purgeLock.release()
+
+  def stats(self):
+    with self.lock:
+      return {
+        'checked': self.checked,
+        'duplicates': self.duplicates,
+        'hitRate': self.duplicates / self.checked if self.checked else 0,
+        'size': self.cache.stats()['size']
+      }
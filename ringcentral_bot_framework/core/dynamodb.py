@@ -6,16 +6,18 @@ __package__ = 'ringcentral_bot_framework.core'
 
 import pydash as _
 import sys, os
-import boto3
 import json
 from .common import debug
 from os.path import join
 from functools import reduce
+import threading
+import queue
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 from pydash.predicates import is_string
 from pydash.strings import starts_with
 
-boto3.setup_default_session(region_name=os.environ['AWS_REGION'])
-client = boto3.client('dynamodb')
 prefix = 'ringcentral_dynamo1'
 DYNAMODB_ReadCapacityUnits=1
 DYNAMODB_WriteCapacityUnits=1
@@ -27,74 +29,222 @@ try:
 except:
   pass
 
+DYNAMODB_WAIT_DELAY = 2
+DYNAMODB_WAIT_MAX_ATTEMPTS = 60
+try:
+  DYNAMODB_WAIT_DELAY = int(os.environ['DYNAMODB_WAIT_DELAY'])
+except:
+  pass
+try:
+  DYNAMODB_WAIT_MAX_ATTEMPTS = int(os.environ['DYNAMODB_WAIT_MAX_ATTEMPTS'])
+except:
+  pass
+
+# parallel scan segments for get all / query, 1 means sequential scan
+DYNAMODB_SCAN_SEGMENTS = 1
+DYNAMODB_SCAN_WORKERS = 16
+try:
+  DYNAMODB_SCAN_SEGMENTS = int(os.environ['DYNAMODB_SCAN_SEGMENTS'])
+except:
+  pass
+try:
+  DYNAMODB_SCAN_WORKERS = int(os.environ['DYNAMODB_SCAN_WORKERS'])
+except:
+  pass
+
+# max scan calls for one page, when filter leaves pages short
+pageScanRounds = 5
+
+# retries for unprocessed keys/items of batch requests
+DYNAMODB_BATCH_RETRIES = 8
+try:
+  DYNAMODB_BATCH_RETRIES = int(os.environ['DYNAMODB_BATCH_RETRIES'])
+except:
+  pass
+
+clientHolder = {}
+clientLock = threading.Lock()
+
+def getClient():
+  '''
+  boto3 is imported and client created on first db action,
+  so cold start does not pay for it when no db access needed
+  '''
+  if 'client' in clientHolder:
+    return clientHolder['client']
+  with clientLock:
+    if not 'client' in clientHolder:
+      import boto3
+      boto3.setup_default_session(region_name=os.environ['AWS_REGION'])
+      clientHolder['client'] = boto3.client('dynamodb')
+    return clientHolder['client']
+
+scanPoolHolder = {}
+scanPoolLock = threading.Lock()
+
+def getScanPool():
+  with scanPoolLock:
+    if not 'pool' in scanPoolHolder:
+      scanPoolHolder['pool'] = ThreadPoolExecutor(
+        max_workers=DYNAMODB_SCAN_WORKERS,
+        thread_name_prefix='dynamodb-scan'
+      )
+    return scanPoolHolder['pool']
+
 dbName = 'dynamodb'
 
 def initDB(conf):
   tables = list(map(lambda x: x['name'], conf.dbTables()))
+  # fields of schema type number are stored as dynamodb numbers,
+  # so lease conditions compare them and ttl can expire records
+  numberFields = {}
+  ttlFields = {}
+  # query keys are checked against schema, never put into expressions as is
+  schemaFields = {}
+  for t in conf.dbTables():
+    for field in t.get('schemas') or []:
+      schemaFields.setdefault(t['name'], set()).add(field['name'])
+      if field.get('type') == 'number':
+        numberFields.setdefault(t['name'], set()).add(field['name'])
+        if field.get('ttl'):
+          ttlFields[t['name']] = field['name']
 
   def createTableName(table):
     return prefix + '_' + table
 
+  readiness = {
+    'ready': False
+  }
+  readyLock = threading.Lock()
+
   def describeTable(tableName):
     try:
-      state = client.describe_table(
+      state = getClient().describe_table(
         TableName=tableName
       )
       return state['Table']['TableStatus']
     except:
       return False
 
+  def waitTable(name):
+    try:
+      getClient().get_waiter('table_exists').wait(
+        TableName=name,
+        WaiterConfig={
+          'Delay': DYNAMODB_WAIT_DELAY,
+          'MaxAttempts': DYNAMODB_WAIT_MAX_ATTEMPTS
+        }
+      )
+      return True
+    except Exception as e:
+      debug('dynamodb wait table error', name)
+      debug(e)
+      return False
+
   def createTable(table):
     name = createTableName(table)
-    table = client.create_table(
-      TableName=name,
-      KeySchema=[
-        {
-          'AttributeName': 'id',
-          'KeyType': 'HASH'
-        }
-      ],
-      AttributeDefinitions=[
-        {
-          'AttributeName': 'id',
-          'AttributeType': 'S'
+    try:
+      getClient().create_table(
+        TableName=name,
+        KeySchema=[
+          {
+            'AttributeName': 'id',
+            'KeyType': 'HASH'
+          }
+        ],
+        AttributeDefinitions=[
+          {
+            'AttributeName': 'id',
+            'AttributeType': 'S'
+          }
+        ],
+        ProvisionedThroughput={
+          'ReadCapacityUnits': DYNAMODB_ReadCapacityUnits,
+          'WriteCapacityUnits': DYNAMODB_WriteCapacityUnits
         }
-      ],
-      ProvisionedThroughput={
-        'ReadCapacityUnits': DYNAMODB_ReadCapacityUnits,
-        'WriteCapacityUnits': DYNAMODB_WriteCapacityUnits
-      }
-    )
-    for i in range(100):
-      status = describeTable(name)
-      if status == 'ACTIVE':
-        return True
-    return False
+      )
+    except getClient().exceptions.ResourceInUseException:
+      # created by another process, just wait for it
+      pass
+    return waitTable(name)
 
-  def prepareDb():
-    exist = describeTable(
-      createTableName(tables[0])
-    )
-    if exist != False:
+  def prepareDb(force = False):
+    """
+    make sure tables exist, checked once per process,
+    force re-check after ResourceNotFound
+    """
+    if readiness['ready'] and not force:
       return True
-    for t in tables:
-      createTable(t)
+    with readyLock:
+      if readiness['ready'] and not force:
+        return True
+      ok = True
+      for t in tables:
+        status = describeTable(createTableName(t))
+        if status == 'ACTIVE':
+          pass
+        elif status == False:
+          ok = createTable(t) and ok
+        else:
+          ok = waitTable(createTableName(t)) and ok
+        if t in ttlFields:
+          ensureTtl(t)
+      readiness['ready'] = ok
+      return ok
 
-  def putItem(item, table):
+  def ensureTtl(table):
+    '''
+    let dynamodb delete records once ttl field time has passed
+    '''
+    name = createTableName(table)
     try:
-      def reducer(x, y):
-        v = item[y]
-        if not is_string(v):
-          v = json.dumps(v)
-        x[y] = {
-          'S': v
+      res = getClient().describe_time_to_live(TableName=name)
+      if _.get(res, 'TimeToLiveDescription.TimeToLiveStatus') in ['ENABLED', 'ENABLING']:
+        return
+      getClient().update_time_to_live(
+        TableName=name,
+        TimeToLiveSpecification={
+          'Enabled': True,
+          'AttributeName': ttlFields[table]
         }
+      )
+    except Exception as e:
+      debug('dynamodb ttl error', name)
+      debug(e)
+
+  def toNumber(v):
+    try:
+      return {
+        'N': str(float(v))
+      }
+    except (TypeError, ValueError):
+      return None
+
+  def toDynamoItem(item, table = None):
+    numbers = numberFields.get(table) or set()
+    def reducer(x, y):
+      v = item[y]
+      n = toNumber(v) if y in numbers else None
+      if not n is None:
+        x[y] = n
         return x
-      client.put_item(
+      if not is_string(v):
+        v = json.dumps(v)
+      x[y] = {
+        'S': v
+      }
+      return x
+    return reduce(reducer, item.keys(), {})
+
+  def putItem(item, table):
+    try:
+      getClient().put_item(
         TableName=createTableName(table),
-        Item=reduce(reducer, item.keys(), {})
+        Item=toDynamoItem(item, table)
       )
       return True
+    except getClient().exceptions.ResourceNotFoundException:
+      raise
     except Exception as e:
       debug('dynamodb putitem error')
       debug(e)
@@ -102,7 +252,7 @@ def initDB(conf):
 
   def removeItem(id, table):
     try:
-      client.delete_item(
+      getClient().delete_item(
         TableName=createTableName(table),
         Key={
           'id': {
@@ -111,6 +261,8 @@ def initDB(conf):
         }
       )
       return True
+    except getClient().exceptions.ResourceNotFoundException:
+      raise
     except Exception as e:
       debug('dynamodb removeItem error')
       debug(e)
@@ -118,6 +270,9 @@ def initDB(conf):
 
   def formatItem(item):
     def reducer(x, y):
+      if 'N' in item[y]:
+        x[y] = float(item[y]['N'])
+        return x
       v = item[y]['S']
       isJson = False
       try:
@@ -132,7 +287,7 @@ def initDB(conf):
 
   def getItem(id, table):
     try:
-      res = client.get_item(
+      res = getClient().get_item(
         TableName=createTableName(table),
         Key={
           'id': {
@@ -141,40 +296,276 @@ def initDB(conf):
         }
       )
       return formatItem(res['Item'])
+    except getClient().exceptions.ResourceNotFoundException:
+      raise
     except Exception as e:
       debug('dynamodb getItem error')
       debug(e)
       return False
 
-  def scan(table, query = None):
-    values = {}
-    expr = ''
+  def retryUnprocessed(call, request, key):
+    """
+    send batch request, resend unprocessed part with backoff
+    """
+    responses = []
+    for i in range(DYNAMODB_BATCH_RETRIES + 1):
+      res = call(request)
+      responses.append(res)
+      request = res.get(key) or {}
+      if not request:
+        return responses
+      time.sleep(min(0.05 * (2 ** i), 2) * random.random())
+    raise Exception(f'dynamodb batch: unprocessed items left after {DYNAMODB_BATCH_RETRIES} retries')
+
+  def batchGet(ids, table):
+    name = createTableName(table)
+    ids = list(dict.fromkeys(map(str, ids)))
+    result = []
+    for i in range(0, len(ids), 100):
+      chunk = ids[i:i + 100]
+      responses = retryUnprocessed(
+        lambda request: getClient().batch_get_item(RequestItems=request),
+        {
+          name: {
+            'Keys': list(map(lambda id: {'id': {'S': id}}, chunk))
+          }
+        },
+        'UnprocessedKeys'
+      )
+      for res in responses:
+        result = result + list(map(formatItem, _.get(res, ['Responses', name]) or []))
+    return result
+
+  def batchWrite(requests, table):
+    name = createTableName(table)
+    for i in range(0, len(requests), 25):
+      retryUnprocessed(
+        lambda request: getClient().batch_write_item(RequestItems=request),
+        {
+          name: requests[i:i + 25]
+        },
+        'UnprocessedItems'
+      )
+    return True
+
+  def batchAdd(items, table):
+    # same id twice in one request is rejected, last one wins
+    byId = {}
+    for item in items:
+      byId[str(item['id'])] = item
+    return batchWrite(
+      list(map(
+        lambda item: {
+          'PutRequest': {
+            'Item': toDynamoItem(item, table)
+          }
+        },
+        byId.values()
+      )),
+      table
+    )
+
+  def batchRemove(ids, table):
+    return batchWrite(
+      list(map(
+        lambda id: {
+          'DeleteRequest': {
+            'Key': {
+              'id': {
+                'S': id
+              }
+            }
+          }
+        },
+        dict.fromkeys(map(str, ids))
+      )),
+      table
+    )
+
+  def queryFilter(table, query):
+    """
+    scan params of query {key, value}, key must be a schema field of table,
+    value typed like writes, number fields as N
+    """
+    key = query['key']
+    if not key in (schemaFields.get(table) or set()):
+      raise Exception(f'dynamodb: {key} is not a field of {table}')
+    item = toDynamoItem({
+      key: query['value']
+    }, table)
+    return {
+      'ExpressionAttributeNames': {
+        '#k': key
+      },
+      'ExpressionAttributeValues': {
+        ':a': item[key]
+      },
+      'FilterExpression': '#k = :a'
+    }
+
+  def scanPages(table, query = None, segment = None, totalSegments = None):
+    """
+    yield raw items page by page, follow LastEvaluatedKey until the end
+    """
+    params = {
+      'TableName': createTableName(table)
+    }
     if not query is None:
-      values = {
-        ':a': {
-          'S': query['value']
+      params.update(queryFilter(table, query))
+    if not totalSegments is None:
+      params['Segment'] = segment
+      params['TotalSegments'] = totalSegments
+    while True:
+      res = getClient().scan(**params)
+      yield res['Items']
+      last = res.get('LastEvaluatedKey')
+      if not last:
+        return
+      params['ExclusiveStartKey'] = last
+
+  def parallelScanPages(table, query, segments):
+    """
+    scan segments in thread pool, yield pages as they arrive
+    """
+    pages = queue.Queue(maxsize=segments * 2)
+    stop = threading.Event()
+    done = object()
+
+    def put(x):
+      while not stop.is_set():
+        try:
+          pages.put(x, timeout=1)
+          return True
+        except queue.Full:
+          pass
+      return False
+
+    def worker(segment):
+      try:
+        for items in scanPages(table, query, segment, segments):
+          if not put(items):
+            return
+      except Exception as e:
+        put(e)
+      finally:
+        put(done)
+
+    pool = getScanPool()
+    for segment in range(segments):
+      pool.submit(worker, segment)
+    finished = 0
+    try:
+      while finished < segments:
+        x = pages.get()
+        if x is done:
+          finished = finished + 1
+        elif isinstance(x, Exception):
+          raise x
+        else:
+          yield x
+    finally:
+      stop.set()
+
+  def iterScan(table, query = None, segments = 1):
+    """
+    generator of formatted items, whole table with pagination,
+    segments > 1 runs parallel scan,
+    first page is read at once so failing to start returns False like other actions,
+    a later page that fails raises from the generator, the stream can not return False
+    """
+    if segments > 1:
+      pages = parallelScanPages(table, query, segments)
+    else:
+      pages = scanPages(table, query)
+    first = next(pages, [])
+
+    def items():
+      for item in first:
+        yield formatItem(item)
+      for page in pages:
+        for item in page:
+          yield formatItem(item)
+    return items()
+
+  def page(table, data):
+    """
+    one page of scan after cursor id, a few scan calls at most when filtering,
+    cursor is the id of last evaluated item, scan order is not id order
+    """
+    limit = int(_.get(data, 'limit') or 100)
+    cursor = _.get(data, 'cursor')
+    params = {
+      'TableName': createTableName(table)
+    }
+    if not _.get(data, 'key') is None:
+      params.update(queryFilter(table, data))
+    if not cursor is None:
+      params['ExclusiveStartKey'] = {
+        'id': {
+          'S': str(cursor)
         }
       }
-      expr = f'{query["key"]} = :a'
+    items = []
+    for i in range(pageScanRounds):
+      params['Limit'] = limit - len(items)
+      res = getClient().scan(**params)
+      items = items + list(map(formatItem, res['Items']))
+      last = res.get('LastEvaluatedKey')
+      if not last:
+        return {'items': items, 'cursor': None}
+      params['ExclusiveStartKey'] = last
+      if len(items) >= limit:
+        break
+    return {'items': items, 'cursor': last['id']['S']}
+
+  def lease(table, data):
+    '''
+    conditional update, fails if lease field is set and not before now
+    '''
+    key = data['key']
+    names = {
+      '#k': key
+    }
+    values = {
+      ':until': toNumber(data['until']),
+      ':now': toNumber(data['now'])
+    }
+    sets = ['#k = :until']
+    update = toDynamoItem(data.get('update') or {}, table)
+    for i, name in enumerate(update.keys()):
+      names[f'#u{i}'] = name
+      values[f':u{i}'] = update[name]
+      sets.append(f'#u{i} = :u{i}')
+    condition = 'attribute_not_exists(#k) OR #k < :now'
+    if not data.get('create'):
+      condition = f'attribute_exists(id) AND ({condition})'
     try:
-      res = None
-      if expr == '':
-        res = client.scan(
-          TableName=createTableName(table)
-        )
-      else:
-        res = client.scan(
-          TableName=createTableName(table),
-          ExpressionAttributeValues=values,
-          FilterExpression=expr,
-        )
-      return list(map(formatItem, res['Items']))
+      getClient().update_item(
+        TableName=createTableName(table),
+        Key={
+          'id': {
+            'S': str(data['id'])
+          }
+        },
+        UpdateExpression='SET ' + ', '.join(sets),
+        ConditionExpression=condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+      )
+      return True
+    except getClient().exceptions.ConditionalCheckFailedException:
+      return False
+
+  def scan(table, query = None, segments = 1):
+    try:
+      return list(iterScan(table, query, segments))
+    except getClient().exceptions.ResourceNotFoundException:
+      raise
     except Exception as e:
       debug('dynamodb scan error')
       debug(e)
       return False
 
-
   def action(tableName, action, data = None):
     """db action wrapper
     * @param {String} tableName, user or bot
@@ -184,24 +575,76 @@ def initDB(conf):
     * for remove, {id: xxx} or {ids: [...]}
     * for update, {id: xxx, update: {...}}
     * for get, singleUser:{id: xxx}, allUser: {}, query: { 'key': 'xx', 'value': 'yy'}
+    * for batchGet, {ids: [...]}, return list of found items
+    * for batchAdd, {items: [{id: xxx, ...}, ...]}
+    * for batchRemove, {ids: [...]}
+    * for get all or query, add 'stream': True to get a generator instead of list,
+      a scan error after the first page raises while iterating, instead of returning False
+    * add 'segments': n to run parallel scan, default DYNAMODB_SCAN_SEGMENTS
+    * for page, {limit: n, cursor: lastId, key?: xx, value?: yy},
+      return {items: [...], cursor: next cursor or None}
+    * for lease, {id: xxx, key: field, until: t, now: t, create?: bool, update?: {...}},
+      set field to until if it is missing or before now, conditional update, return True if set
     """
     debug('db op:', tableName, action, data)
     prepareDb()
+    try:
+      return runAction(tableName, action, data)
+    except getClient().exceptions.ResourceNotFoundException as e:
+      debug('dynamodb table not found, re-check tables', tableName)
+      if not prepareDb(True):
+        debug(e)
+        return False
+      try:
+        return runAction(tableName, action, data)
+      except Exception as e:
+        debug(e)
+        return False
+    except Exception as e:
+      debug('dynamodb action error', action)
+      debug(e)
+      return False
+
+  def runAction(tableName, action, data = None):
     id = _.get(data, 'id')
     if _.predicates.is_number(id):
       id = str(id)
 
     if action == 'add':
-      putItem(data, tableName)
+      if not putItem(data, tableName):
+        return False
 
     elif action == 'remove':
-      removeItem(id, tableName)
+      ids = _.get(data, 'ids')
+      if ids is None:
+        if not removeItem(id, tableName):
+          return False
+      else:
+        batchRemove(ids, tableName)
+
+    elif action == 'batchGet':
+      return batchGet(data['ids'], tableName)
+
+    elif action == 'batchAdd':
+      batchAdd(data['items'], tableName)
+
+    elif action == 'batchRemove':
+      batchRemove(data['ids'], tableName)
 
     elif action == 'update':
       update = data['update']
       old = getItem(id, tableName)
+      if not _.predicates.is_dict(old):
+        return False
       _.assign(old, update)
-      putItem(old, tableName)
+      if not putItem(old, tableName):
+        return False
+
+    elif action == 'page':
+      return page(tableName, data)
+
+    elif action == 'lease':
+      return lease(tableName, data)
 
     elif action == 'get':
       if not id is None:
@@ -210,7 +653,10 @@ def initDB(conf):
         query = None
         if not _.get(data, 'key') is None:
           query = data
-        return scan(tableName, query)
+        segments = _.get(data, 'segments') or DYNAMODB_SCAN_SEGMENTS
+        if _.get(data, 'stream'):
+          return iterScan(tableName, query, segments)
+        return scan(tableName, query, segments)
 
     return action
 
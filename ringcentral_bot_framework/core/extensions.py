@@ -1,25 +1,83 @@
 """
 extensions load module
 get extension names from env.EXTENSIONS
+extension hooks are resolved once into per hook handler lists
 """
 
 from importlib import import_module
 import os
 import pydash as _
+from .aio import callHook
+from .tracing import span
 
+hookNames = [
+  'botGotPostAddAction',
+  'defaultEventHandler',
+  'onInteractiveMessage',
+  'route'
+]
+
+# yes: stop at first extension that handled the event
+EXTENSION_SHORT_CIRCUIT = False
+try:
+  EXTENSION_SHORT_CIRCUIT = os.environ['EXTENSION_SHORT_CIRCUIT'] == 'yes'
+except:
+  pass
+
+def extensionName(ext, index):
+  return getattr(ext, 'name', None) or getattr(ext, '__name__', None) or f'extension{index}'
+
+class ExtensionDispatcher:
+  '''
+  hook name -> [(stage name, function)], built once at frameworkInit,
+  each extension call is timed as stage `extension.{name}.{hook}`
+  '''
+
+  def __init__(self, extensions, shortCircuit = None):
+    self.shortCircuit = EXTENSION_SHORT_CIRCUIT if shortCircuit is None else shortCircuit
+    self.handlers = {}
+    for name in hookNames:
+      self.handlers[name] = []
+    for index, ext in enumerate(extensions or []):
+      extName = extensionName(ext, index)
+      for name in hookNames:
+        func = getattr(ext, name, None)
+        if callable(func):
+          self.handlers[name].append((f'extension.{extName}.{name}', func))
+
+  def has(self, name):
+    return len(self.handlers.get(name) or []) > 0
+
+  def run(self, name, *args):
+    '''
+    run extension functions of hook name,
+    each gets handled result of previous ones as last arg,
+    return True if any extension handled it
+    '''
+    res = False
+    for stage, func in self.handlers.get(name) or []:
+      with span(stage):
+        handled = callHook(func, *args, res)
+      res = res or handled
+      if res and self.shortCircuit:
+        break
+    return res
+
+  def route(self, event, framework):
+    '''
+    first non None result of extension routes
+    '''
+    for stage, func in self.handlers['route']:
+      with span(stage):
+        res = callHook(func, event, framework)
+      if not res is None:
+        return res
+    return None
 
 def runExtensionFunction(extensions, name, *args):
   '''
   run extension functions by name
   name must in extensionFuntionNames
+  resolves hooks on every call, prefer ExtensionDispatcher
   '''
-
-  res = False
-  for ext in extensions:
-    func = ext.__dict__.get(name)
-    hanldedByPrevious = False
-    if not func is None:
-      hanldedByPrevious = func(*args, res)
-    res = res or hanldedByPrevious
-
-  return res
\ No newline at end of file
+  return ExtensionDispatcher(extensions).run(name, *args)
@@ -7,22 +7,119 @@ __package__ = 'ringcentral_bot_framework.core'
 import pydash as _
 import sys, os
 import json
-from .common import debug, printError
+import copy
+import time
+import atexit
+import bisect
+import tempfile
+import threading
+from contextlib import contextmanager
+from .common import debug, printError, leaseFree, leased
 from os.path import join
 
+try:
+  import fcntl
+except ImportError:
+  # no inter-process lock on windows, single process only
+  fcntl = None
+
 folderName = 'filedb'
 try:
   folderName = os.environ['FILEDB_FOLDER_NAME']
 except:
   pass
 
+# file: read/write json files on every action
+# memory: keep write-through in-memory index per table, persist in batches
+FILEDB_MODE = 'file'
+try:
+  FILEDB_MODE = os.environ['FILEDB_MODE']
+except:
+  pass
+
+# seconds between batched disk flushes in memory mode, 0 to write on every action
+FILEDB_FLUSH_INTERVAL = 1.0
+try:
+  FILEDB_FLUSH_INTERVAL = float(os.environ['FILEDB_FLUSH_INTERVAL'])
+except:
+  pass
+
 cwd = os.getcwd()
 dbPath = join(cwd, folderName)
 
 dbName = 'filedb'
 
+writeActions = ['add', 'remove', 'batchAdd', 'batchRemove', 'update', 'lease']
+
+# page stops after reading limit * this many records when filtering
+pageScanFactor = 20
+
+def isRecordFile(name):
+  return name.endswith('.json') and not name.startswith('.')
+
+def writeFileAtomic(path, content, sync=True):
+  """
+  write to temp file then rename, readers never see half written file,
+  temp file name is unique so concurrent writers of one record never collide
+  """
+  folder, name = os.path.split(path)
+  fd, tmp = tempfile.mkstemp(prefix='.' + name + '.', suffix='.tmp', dir=folder)
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write(content)
+      f.flush()
+      if sync:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+  except Exception:
+    try:
+      os.remove(tmp)
+    except OSError:
+      pass
+    raise
+
+def syncDir(path):
+  """
+  fsync folder so renames are durable
+  """
+  try:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+      os.fsync(fd)
+    finally:
+      os.close(fd)
+  except Exception as e:
+    debug('filedb sync dir error', e)
+
+@contextmanager
+def tableLock(tableName):
+  """
+  exclusive lock on table across processes (server workers),
+  held around writes so read-modify-write of update never loses writes,
+  reads need no lock since files are replaced atomically
+  """
+  if fcntl is None:
+    yield
+    return
+  with open(join(dbPath, tableName, '.lock'), 'a') as f:
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
 def initDB(conf):
   tables = list(map(lambda x: x['name'], conf.dbTables()))
+  state = {
+    'ready': False
+  }
+  lock = threading.RLock()
+  # one flush at a time, so an older batch never lands after a newer one
+  flushLock = threading.Lock()
+  # memory mode: {tableName: {id: record}}
+  index = {}
+  # memory mode: {tableName: {id: record or None}}, None means removed
+  dirty = {}
 
   def assess(path):
     """
@@ -32,15 +129,17 @@ def initDB(conf):
 
   def prepareDb():
     """
-    prepare folders before operate
+    prepare folders before operate, only checked once per process
     """
-    if assess(dbPath):
+    if state['ready']:
       return
-    os.mkdir(dbPath)
+    if not assess(dbPath):
+      os.mkdir(dbPath)
     for table in tables:
-      os.mkdir(
-        join(dbPath, table)
-      )
+      p = join(dbPath, table)
+      if not assess(p):
+        os.mkdir(p)
+    state['ready'] = True
 
   def readFile(toOpen):
     """
@@ -52,6 +151,213 @@ def initDB(conf):
       toOpenFile.close()
       return f
 
+  def loadTable(tableName):
+    """
+    memory mode: load all records of table into index once
+    """
+    if tableName in index:
+      return index[tableName]
+    p = join(dbPath, tableName)
+    if not assess(p):
+      os.mkdir(p)
+    records = {}
+    for f in os.listdir(p):
+      if isRecordFile(f):
+        record = readFile(join(p, f))
+        records[f[0:-5]] = record
+    index[tableName] = records
+    return records
+
+  def flush():
+    """
+    memory mode: persist dirty records, files are written without fsync,
+    then each table folder is fsynced once per batch,
+    failed records stay dirty for next flush, no-op when nothing is dirty
+    """
+    with flushLock:
+      with lock:
+        if len(dirty) == 0:
+          return
+        batch = dict(dirty)
+        dirty.clear()
+      for tableName, records in batch.items():
+        p = join(dbPath, tableName)
+        with tableLock(tableName):
+          for id, record in records.items():
+            toOpen = join(p, id + '.json')
+            try:
+              if record is None:
+                if os.path.exists(toOpen):
+                  os.remove(toOpen)
+              else:
+                writeFileAtomic(
+                  toOpen,
+                  json.dumps(record, separators=(',', ':')),
+                  False
+                )
+            except Exception as e:
+              printError(e, 'filedb flush')
+              with lock:
+                # keep newer change if record was written again meanwhile
+                dirty.setdefault(tableName, {}).setdefault(id, record)
+        syncDir(p)
+
+  def markDirty(tableName, id, record):
+    dirty.setdefault(tableName, {})[id] = copy.deepcopy(record)
+
+  def flushLoop():
+    while True:
+      time.sleep(FILEDB_FLUSH_INTERVAL)
+      flush()
+
+  if FILEDB_MODE == 'memory':
+    atexit.register(flush)
+    if FILEDB_FLUSH_INTERVAL > 0:
+      threading.Thread(target=flushLoop, daemon=True, name='filedb-flush').start()
+
+  def page(ids, read, data):
+    """
+    records after cursor in id order, filtered by key/value,
+    return {items, cursor}, cursor None on last page
+    """
+    limit = int(_.get(data, 'limit') or 100)
+    cursor = _.get(data, 'cursor')
+    key = _.get(data, 'key')
+    value = _.get(data, 'value')
+    ids = sorted(ids)
+    start = 0 if cursor is None else bisect.bisect_right(ids, str(cursor))
+    items = []
+    scanned = 0
+    for i in range(start, len(ids)):
+      record = read(ids[i])
+      scanned = scanned + 1
+      if record is None or (not key is None and _.get(record, key) != value):
+        if scanned >= limit * pageScanFactor and i < len(ids) - 1:
+          return {'items': items, 'cursor': ids[i]}
+        continue
+      items.append(record)
+      if len(items) == limit:
+        return {'items': items, 'cursor': ids[i] if i < len(ids) - 1 else None}
+    return {'items': items, 'cursor': None}
+
+  def readRecord(tableName, id):
+    try:
+      return readFile(join(dbPath, tableName, id + '.json'))
+    except FileNotFoundError:
+      # removed after listing
+      return None
+
+  def memoryAction(tableName, action, data, id):
+    with lock:
+      records = loadTable(tableName)
+
+      if action == 'add':
+        id = str(data['id'])
+        records[id] = copy.deepcopy(data)
+        markDirty(tableName, id, data)
+
+      elif action == 'remove' and _.get(data, 'ids') is None:
+        if not id in records:
+          raise FileNotFoundError(id)
+        records.pop(id)
+        markDirty(tableName, id, None)
+
+      elif action == 'remove' or action == 'batchRemove':
+        for id in map(str, data['ids']):
+          if id in records:
+            records.pop(id)
+            markDirty(tableName, id, None)
+
+      elif action == 'batchAdd':
+        for item in data['items']:
+          id = str(item['id'])
+          records[id] = copy.deepcopy(item)
+          markDirty(tableName, id, item)
+
+      elif action == 'batchGet':
+        ids = map(str, data['ids'])
+        return copy.deepcopy(
+          [records[id] for id in dict.fromkeys(ids) if id in records]
+        )
+
+      elif action == 'update':
+        if not id in records:
+          raise FileNotFoundError(id)
+        _.assign(records[id], copy.deepcopy(data['update']))
+        markDirty(tableName, id, records[id])
+
+      elif action == 'lease':
+        if not leaseFree(records.get(id), data):
+          return False
+        records[id] = leased(records.get(id), data)
+        markDirty(tableName, id, records[id])
+
+      elif action == 'page':
+        return page(
+          list(records.keys()),
+          lambda id: copy.deepcopy(records[id]),
+          data
+        )
+
+      elif action == 'get':
+        if not id is None:
+          if not id in records:
+            raise FileNotFoundError(id)
+          return copy.deepcopy(records[id])
+        else:
+          return copy.deepcopy(list(records.values()))
+
+    if FILEDB_FLUSH_INTERVAL <= 0 and action in writeActions:
+      flush()
+    return True if action == 'lease' else action
+
+  def fileWrite(tableName, action, data, id):
+    """
+    file mode write, caller holds table lock
+    """
+    toOpen = join(dbPath, tableName, (id or '') + '.json')
+
+    if action == 'add':
+      id = data['id']
+      toOpen = join(dbPath, tableName, id + '.json')
+      r = json.dumps(data, indent=2)
+      writeFileAtomic(toOpen, r, False)
+
+    elif action == 'remove' and _.get(data, 'ids') is None:
+      os.remove(toOpen)
+
+    elif action == 'remove' or action == 'batchRemove':
+      p = join(dbPath, tableName)
+      for id in map(str, data['ids']):
+        f = join(p, id + '.json')
+        if os.path.exists(f):
+          os.remove(f)
+
+    elif action == 'batchAdd':
+      p = join(dbPath, tableName)
+      for item in data['items']:
+        writeFileAtomic(
+          join(p, str(item['id']) + '.json'),
+          json.dumps(item, indent=2),
+          False
+        )
+
+    elif action == 'update':
+      update = data['update']
+      f = readFile(toOpen)
+      _.assign(f, update)
+      f = json.dumps(f, indent=2)
+      writeFileAtomic(toOpen, f, False)
+
+    elif action == 'lease':
+      old = readFile(toOpen) if os.path.exists(toOpen) else None
+      if not leaseFree(old, data):
+        return False
+      writeFileAtomic(toOpen, json.dumps(leased(old, data), indent=2), False)
+      return True
+
+    return action
+
   def action(tableName, action, data=None):
     """db action wrapper
     * @param {String} tableName, user or bot
@@ -61,6 +367,13 @@ def initDB(conf):
     * for remove, {id: xxx} or {ids: [...]}
     * for update, {id: xxx, update: {...}}
     * for get, singleUser:{id: xxx}, allUser: {}
+    * for batchGet, {ids: [...]}, return list of found items
+    * for batchAdd, {items: [{id: xxx, ...}, ...]}
+    * for batchRemove, {ids: [...]}
+    * for page, {limit: n, cursor: lastId, key?: xx, value?: yy},
+      return {items: [...], cursor: next cursor or None}
+    * for lease, {id: xxx, key: field, until: t, now: t, create?: bool, update?: {...}},
+      set field to until if it is missing or before now, atomic, return True if set
     """
     debug('db op:', tableName, action, data)
     try:
@@ -68,38 +381,40 @@ def initDB(conf):
       id = _.get(data, 'id')
       if _.predicates.is_number(id):
         id = str(id)
+
+      if FILEDB_MODE == 'memory':
+        return memoryAction(tableName, action, data, id)
+
+      if action in writeActions:
+        with tableLock(tableName):
+          return fileWrite(tableName, action, data, id)
+
       if _.predicates.is_string(id):
         toOpen = join(dbPath, tableName, (id or '') + '.json')
 
-      if action == 'add':
-        id = data['id']
-        toOpen = join(dbPath, tableName, id + '.json')
-        r = json.dumps(data, indent=2)
-        with open(toOpen, 'w+') as toOpenFile:
-          toOpenFile.write(r)
-          toOpenFile.close()
-
-      elif action == 'remove':
-        os.remove(toOpen)
+      if action == 'batchGet':
+        p = join(dbPath, tableName)
+        res = []
+        for id in dict.fromkeys(map(str, data['ids'])):
+          f = join(p, id + '.json')
+          if os.path.exists(f):
+            res.append(readFile(f))
+        return res
 
-      elif action == 'update':
-        update = data['update']
-        with open(toOpen, 'r+') as toOpenFile:
-          f = toOpenFile.read()
-          f = json.loads(f)
-          _.assign(f, update)
-          f = json.dumps(f, indent=2)
-          toOpenFile.seek(0)
-          toOpenFile.write(f)
-          toOpenFile.truncate()
-          toOpenFile.close()
+      elif action == 'page':
+        p = join(dbPath, tableName)
+        return page(
+          [f[0:-5] for f in os.listdir(p) if isRecordFile(f)],
+          lambda id: readRecord(tableName, id),
+          data
+        )
 
       elif action == 'get':
         if not id is None:
           return readFile(toOpen)
         else:
           p = join(dbPath, tableName)
-          files = [f for f in os.listdir(p)]
+          files = [f for f in os.listdir(p) if isRecordFile(f)]
           return list(map(lambda x: readFile(join(p, x)), files))
 
       return action
@@ -107,4 +422,5 @@ def initDB(conf):
       printError(e, 'db action')
       return False
 
-  return action
\ No newline at end of file
+  action.flush = flush
+  return action
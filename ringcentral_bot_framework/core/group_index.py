@@ -0,0 +1,127 @@
+"""
+reverse index from bot to groups to users in `groupIndex` table,
+one record per user in group of bot, so writes never read or merge others:
+{'id': 'botId:groupId:userId', 'botId': botId, 'botGroup': 'botId:groupId', 'userId': userId}
+plus one marker record per bot, {'id': botId, 'botId': botId},
+saved once the index of bot is seeded from existing users on first read,
+kept up to date by User.addGroup and User.removeGroup,
+so group cleanup and per bot fan-out only touch affected users
+"""
+import pydash as _
+
+tableName = 'groupIndex'
+
+def indexTable():
+  return {
+    'name': tableName,
+    'schemas': [
+      {
+        'name': 'id',
+        'type': 'string',
+        'primary': True
+      },
+      {
+        'name': 'botId',
+        'type': 'string'
+      },
+      {
+        'name': 'botGroup',
+        'type': 'string'
+      }
+    ]
+  }
+
+def groupKey(botId, groupId):
+  return f'{botId}:{groupId}'
+
+def userRecord(botId, groupId, userId):
+  return {
+    'id': f'{groupKey(botId, groupId)}:{userId}',
+    'botId': botId,
+    'botGroup': groupKey(botId, groupId),
+    'userId': userId
+  }
+
+def hasIndex(dbAction, botId):
+  res = dbAction(tableName, 'get', {
+    'id': botId
+  })
+  return _.predicates.is_dict(res)
+
+def buildIndex(dbAction, botId):
+  '''
+  first index of bot, seeded from users stored before the index existed,
+  records added meanwhile are the same records, so nothing is lost
+  '''
+  items = []
+  for user in dbAction('user', 'get') or []:
+    for groupId, id in (user.get('groups') or {}).items():
+      if id == botId:
+        items.append(userRecord(botId, groupId, user['id']))
+  if len(items):
+    dbAction(tableName, 'batchAdd', {
+      'items': items
+    })
+  dbAction(tableName, 'add', {
+    'id': botId,
+    'botId': botId
+  })
+
+def ensureIndex(dbAction, botId):
+  if not hasIndex(dbAction, botId):
+    buildIndex(dbAction, botId)
+
+def query(dbAction, key, value):
+  res = dbAction(tableName, 'get', {
+    'key': key,
+    'value': value
+  }) or []
+  # custom db may ignore query
+  return list(filter(lambda r: r.get(key) == value and 'userId' in r, res))
+
+def addUserGroup(dbAction, botId, groupId, userId):
+  if not botId or not groupId or not userId:
+    return
+  dbAction(tableName, 'add', userRecord(botId, groupId, userId))
+
+def removeUserGroup(dbAction, botId, groupId, userId):
+  if not botId or not groupId or not userId:
+    return
+  dbAction(tableName, 'remove', {
+    'ids': [userRecord(botId, groupId, userId)['id']]
+  })
+
+def userIds(records):
+  return list(dict.fromkeys(map(lambda r: r['userId'], records)))
+
+def getGroupUsers(dbAction, botId, groupId = None):
+  '''
+  user ids of one group of bot, or all groups of bot when groupId is None,
+  None without botId
+  '''
+  if not botId:
+    return None
+  ensureIndex(dbAction, botId)
+  if not groupId is None:
+    return userIds(query(dbAction, 'botGroup', groupKey(botId, groupId)))
+  return userIds(query(dbAction, 'botId', botId))
+
+def removeGroup(dbAction, botId, groupId = None):
+  '''
+  drop group (or all groups and marker when groupId is None) from index,
+  return user ids that were in it, None without botId
+  '''
+  if not botId:
+    return None
+  ensureIndex(dbAction, botId)
+  if groupId is None:
+    records = query(dbAction, 'botId', botId)
+    ids = list(map(lambda r: r['id'], records)) + [botId]
+  else:
+    records = query(dbAction, 'botGroup', groupKey(botId, groupId))
+    ids = list(map(lambda r: r['id'], records))
+  if len(ids):
+    dbAction(tableName, 'remove', {
+      'ids': ids
+    })
+  return userIds(records)
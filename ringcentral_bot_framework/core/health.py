@@ -0,0 +1,29 @@
+'''
+health and readiness routes for load balancers and process managers
+/health: process is up, no dependency check
+/ready: database answers, 503 otherwise
+'''
+from .common import result, printError
+from .tracing import span
+
+def initHealthView():
+  def healthView(event):
+    return result('ok')
+  return healthView
+
+def initReadyView(dbAction):
+  '''
+  one batchGet of a missing bot id, cheap on every backend
+  '''
+  def readyView(event):
+    try:
+      with span('ready.db'):
+        res = dbAction('bot', 'batchGet', {
+          'ids': ['__ready__']
+        })
+      if isinstance(res, list):
+        return result('ready')
+    except Exception as e:
+      printError(e, 'ready check')
+    return result('not ready', 503)
+  return readyView
@@ -4,7 +4,8 @@ support hidden command `__rename__` and `__setAvatar__`
 
 import re
 import pydash as _
-import requests
+from .attachment import AttachmentError
+from .common import printError
 
 def hiddenCmd(
   bot,
@@ -33,12 +34,22 @@ def hiddenCmd(
     attachment = _.get(event, 'body.body.attachments[0]')
     if attachment is None:
       return False
-    r = requests.get(attachment['contentUri'])
-    bot.setAvatar(r.content, attachment['name'])
+    reply = 'Set avatar done'
+    try:
+      with bot.fetchAttachment(attachment) as image:
+        if not image.contentType.startswith('image/'):
+          reply = f'Avatar must be an image, got {image.contentType}'
+        else:
+          bot.setAvatar(image.file, attachment['name'], image.contentType)
+    except AttachmentError as e:
+      reply = f'Set avatar failed: {e}'
+    except Exception as e:
+      printError(e, 'set avatar')
+      reply = 'Set avatar failed'
     bot.sendMessage(
       groupId,
       {
-        'text': 'Set avatar done'
+        'text': reply
       }
     )
 
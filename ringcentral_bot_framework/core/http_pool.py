@@ -0,0 +1,177 @@
+"""
+shared http connection pool
+all Bot/User RestClient instances send requests through one keep-alive session,
+auth header is still built from each client's own token
+"""
+import os
+import sys
+import platform
+import threading
+import urllib.parse as urlparse
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from ringcentral_client import RestClient
+from .tracing import span
+
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_SIZE = 20
+HTTP_TIMEOUT = 60
+try:
+  HTTP_POOL_CONNECTIONS = int(os.environ['HTTP_POOL_CONNECTIONS'])
+except:
+  pass
+try:
+  HTTP_POOL_SIZE = int(os.environ['HTTP_POOL_SIZE'])
+except:
+  pass
+try:
+  HTTP_TIMEOUT = float(os.environ['HTTP_TIMEOUT'])
+except:
+  pass
+
+userAgent = '{name} Python {major}.{minor} {platform}'.format(
+  name='tylerlong/ringcentral-python',
+  major=sys.version_info[0],
+  minor=sys.version_info[1],
+  platform=platform.platform()
+)
+
+sessionHolder = {}
+sessionLock = threading.Lock()
+counterLock = threading.Lock()
+counters = {
+  'requests': 0,
+  'errors': 0,
+  'connectionsClosed': 0
+}
+
+def createSession():
+  session = requests.Session()
+  # tokens differ per bot/user, never share cookies between them
+  session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+  adapter = HTTPAdapter(
+    pool_connections=HTTP_POOL_CONNECTIONS,
+    pool_maxsize=HTTP_POOL_SIZE
+  )
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return session
+
+def getSession():
+  '''
+  process wide session, created on first use
+  '''
+  session = sessionHolder.get('session')
+  if not session is None:
+    return session
+  with sessionLock:
+    if not 'session' in sessionHolder:
+      sessionHolder['session'] = createSession()
+    return sessionHolder['session']
+
+def resetSession():
+  '''
+  close all pooled connections, next request creates a new session
+  '''
+  with sessionLock:
+    session = sessionHolder.pop('session', None)
+  if not session is None:
+    opened = countConnections(session)
+    with counterLock:
+      counters['connectionsClosed'] = counters['connectionsClosed'] + opened
+    session.close()
+
+def countConnections(session):
+  adapter = session.get_adapter('https://')
+  return sum(
+    map(
+      lambda pool: pool.num_connections,
+      list(adapter.poolmanager.pools._container.values())
+    )
+  )
+
+def poolStats():
+  '''
+  requests sent, connections opened and reused
+  '''
+  opened = 0
+  session = sessionHolder.get('session')
+  if not session is None:
+    opened = countConnections(session)
+  with counterLock:
+    total = counters['requests']
+    errors = counters['errors']
+    opened = opened + counters['connectionsClosed']
+  return {
+    'requests': total,
+    'errors': errors,
+    'connectionsOpened': opened,
+    'connectionsReused': max(total - opened, 0),
+    'poolSize': HTTP_POOL_SIZE
+  }
+
+class HttpError(Exception):
+  '''
+  non 2xx response, message format same as RestClient errors,
+  keep response for status code and headers like Retry-After
+  '''
+
+  def __init__(self, response):
+    super().__init__(
+      'HTTP status code: {0}\n\n{1}'.format(response.status_code, response.text)
+    )
+    self.response = response
+    self.status = response.status_code
+
+def count(key):
+  with counterLock:
+    counters[key] = counters[key] + 1
+
+class PooledRestClient(RestClient):
+  '''
+  RestClient which sends requests through the shared session
+  '''
+
+  def _request(
+    self,
+    method,
+    endpoint,
+    params=None,
+    json=None,
+    data=None,
+    files=None,
+    multipart_mixed=False,
+  ):
+    url = urlparse.urljoin(self.server, endpoint)
+    headers = {
+      'Authorization': self._autorization_header(),
+      'User-Agent': userAgent,
+      'RC-User-Agent': userAgent,
+      'X-User-Agent': userAgent,
+    }
+    req = requests.Request(
+      method,
+      url,
+      params=params,
+      data=data,
+      json=json,
+      files=files,
+      headers=headers,
+    )
+    prepared = req.prepare()
+    if multipart_mixed:
+      prepared.headers['Content-Type'] = prepared.headers['Content-Type'].replace(
+        'multipart/form-data;', 'multipart/mixed;'
+      )
+    count('requests')
+    with span('rest.' + method.lower()):
+      try:
+        r = getSession().send(prepared, timeout=HTTP_TIMEOUT)
+      except Exception:
+        count('errors')
+        raise
+      if not r.ok:
+        count('errors')
+        raise HttpError(r)
+    return r
@@ -4,13 +4,14 @@ handle interactive message from adaptive card
 import time
 from .common import result, getQueryParam, debug
 from pydash import get
-from .extensions import runExtensionFunction
+from .aio import callHook
+from .unit_of_work import unitOfWork
 
 def initInteractive(
   conf,
   getBot,
   dbAction,
-  extensions
+  dispatcher
 ):
   def onInteractive(event):
     body = get(event, 'body')
@@ -18,26 +19,27 @@ def initInteractive(
     data = get(body, 'data')
     botId = get(data, 'botId')
     groupId = get(data, 'groupId')
-    bot = getBot(botId)
-    handledByExtension = runExtensionFunction(
-        extensions,
-        'onInteractiveMessage',
+    with unitOfWork(dbAction):
+      bot = getBot(botId)
+      handledByExtension = dispatcher.run(
+          'onInteractiveMessage',
+          bot,
+          groupId,
+          userInfo,
+          data,
+          dbAction,
+          event
+        )
+      callHook(
+        conf.onInteractiveMessage,
         bot,
         groupId,
         userInfo,
         data,
         dbAction,
+        handledByExtension,
         event
       )
-    conf.onInteractiveMessage(
-      bot,
-      groupId,
-      userInfo,
-      data,
-      dbAction,
-      handledByExtension,
-      event
-    )
     return result(
       'ok',
       200,
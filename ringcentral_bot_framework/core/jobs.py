@@ -0,0 +1,349 @@
+"""
+durable delayed jobs on dbAction
+jobs are records in `job` table with scheduled run time,
+drained by a polling thread (server) started by the first schedule in process,
+or the `jobs` route (lambda schedule, requires JOBS_TOKEN),
+polls read due jobs by id from an in memory index of run times,
+fed by local schedules and a full table scan every JOB_RESCAN_INTERVAL,
+jobs are claimed with an atomic lease so only one process runs each,
+failed jobs retry with exponential backoff
+"""
+import os
+import time
+import uuid
+import random
+import threading
+import pydash as _
+from .common import debug, printError, result, getQueryParam
+from .self_run import lambdaName
+from .worker_pool import WorkerPool
+
+tableName = 'job'
+
+# seconds between db polls for due jobs, 0 disables the polling thread
+JOB_POLL_INTERVAL = 10.0
+JOB_WORKER_COUNT = 4
+JOB_MAX_ATTEMPTS = 10
+JOB_RETRY_BASE = 30.0
+JOB_RETRY_MAX = 3600.0
+# seconds a claimed job stays hidden from other drains
+JOB_LOCK_SECONDS = 300.0
+# seconds between full scans of job table, for jobs saved by other processes or before restart
+JOB_RESCAN_INTERVAL = 300.0
+# yes: start polling at start to resume jobs saved before restart, full scan of job table,
+# enable it in one process, others poll once they schedule a job
+JOB_POLL_ON_START = False
+# when set, the `jobs` route is enabled, call it with ?token=xxx
+JOBS_TOKEN = ''
+try:
+  JOB_POLL_INTERVAL = float(os.environ['JOB_POLL_INTERVAL'])
+except:
+  pass
+try:
+  JOB_WORKER_COUNT = int(os.environ['JOB_WORKER_COUNT'])
+except:
+  pass
+try:
+  JOB_MAX_ATTEMPTS = int(os.environ['JOB_MAX_ATTEMPTS'])
+except:
+  pass
+try:
+  JOB_RETRY_BASE = float(os.environ['JOB_RETRY_BASE'])
+except:
+  pass
+try:
+  JOB_RESCAN_INTERVAL = float(os.environ['JOB_RESCAN_INTERVAL'])
+except:
+  pass
+try:
+  JOB_POLL_ON_START = os.environ['JOB_POLL_ON_START'] == 'yes'
+except:
+  pass
+try:
+  JOBS_TOKEN = os.environ['JOBS_TOKEN']
+except:
+  pass
+
+def jobTable():
+  return {
+    'name': tableName,
+    'schemas': [
+      {
+        'name': 'id',
+        'type': 'string',
+        'primary': True
+      },
+      {
+        'name': 'type',
+        'type': 'string'
+      },
+      {
+        'name': 'runAt',
+        'type': 'number'
+      },
+      {
+        'name': 'lockedUntil',
+        'type': 'number'
+      },
+      {
+        'name': 'payload',
+        'type': 'json'
+      }
+    ]
+  }
+
+class RetryJob(Exception):
+  '''
+  raise in job handler to retry later with backoff, without error log
+  '''
+  pass
+
+def retryDelay(attempt):
+  delay = min(JOB_RETRY_BASE * (2 ** attempt), JOB_RETRY_MAX)
+  return delay * (0.8 + random.random() * 0.4)
+
+class JobQueue:
+
+  def __init__(self, dbAction, workers = None):
+    self.dbAction = dbAction
+    self.handlers = {}
+    self.pool = WorkerPool(
+      JOB_WORKER_COUNT if workers is None else workers,
+      1000,
+      'rc-bot-job'
+    )
+    self.lock = threading.Lock()
+    # ids running in this process
+    self.running = set()
+    # id: runAt of jobs known to this process
+    self.due = {}
+    self.scannedAt = None
+    self.polling = False
+    # bumped on schedule, so poller does not stop right after a new job
+    self.generation = 0
+    self.pending = 0
+    self.succeeded = 0
+    self.retried = 0
+    self.dropped = 0
+
+  def register(self, type, handler):
+    '''
+    handler(payload), raise to retry later
+    '''
+    self.handlers[type] = handler
+
+  def schedule(self, type, payload, delay = 0, id = None, maxAttempts = None):
+    '''
+    save job to run after delay seconds, job with same id is replaced,
+    return job id
+    '''
+    id = id or f'{type}_{uuid.uuid4().hex}'
+    runAt = time.time() + delay
+    self.dbAction(tableName, 'add', {
+      'id': id,
+      'type': type,
+      'payload': payload,
+      'runAt': runAt,
+      'attempt': '0',
+      'maxAttempts': str(maxAttempts or JOB_MAX_ATTEMPTS),
+      'lockedUntil': 0
+    })
+    debug('job scheduled', id, 'in', delay)
+    with self.lock:
+      self.due[id] = runAt
+      self.pending = len(self.due)
+      self.generation = self.generation + 1
+    self.startPolling()
+    return id
+
+  def rescan(self):
+    '''
+    rebuild due index from whole job table
+    '''
+    jobs = self.dbAction(tableName, 'get')
+    if not _.predicates.is_list(jobs):
+      return
+    with self.lock:
+      self.due = dict(map(lambda job: (job['id'], float(job.get('runAt') or 0)), jobs))
+      self.pending = len(self.due)
+      self.scannedAt = time.monotonic()
+
+  def dueJobs(self, now, rescan = False):
+    if rescan or self.scannedAt is None or time.monotonic() - self.scannedAt >= JOB_RESCAN_INTERVAL:
+      self.rescan()
+    with self.lock:
+      ids = list(filter(
+        lambda id: self.due[id] <= now and not id in self.running,
+        self.due.keys()
+      ))
+    if len(ids) == 0:
+      return []
+    jobs = self.dbAction(tableName, 'batchGet', {
+      'ids': ids
+    })
+    if not _.predicates.is_list(jobs):
+      return []
+    with self.lock:
+      found = set(map(lambda job: job['id'], jobs))
+      for id in ids:
+        # done by another process
+        if not id in found:
+          self.due.pop(id, None)
+      for job in jobs:
+        self.due[job['id']] = float(job.get('runAt') or 0)
+      self.pending = len(self.due)
+    due = filter(
+      lambda job: float(job.get('runAt') or 0) <= now
+        and float(job.get('lockedUntil') or 0) <= now,
+      jobs
+    )
+    return sorted(due, key=lambda job: float(job.get('runAt') or 0))
+
+  def claim(self, job):
+    '''
+    hide job from other drains while it runs,
+    atomic lease, so only one process runs it
+    '''
+    id = job['id']
+    with self.lock:
+      if id in self.running:
+        return False
+      self.running.add(id)
+    try:
+      now = time.time()
+      ok = self.dbAction(tableName, 'lease', {
+        'id': id,
+        'key': 'lockedUntil',
+        'until': now + JOB_LOCK_SECONDS,
+        'now': now
+      }) == True
+    except Exception as e:
+      printError(e, f'job {id} claim')
+      ok = False
+    if not ok:
+      with self.lock:
+        self.running.discard(id)
+    return ok
+
+  def forget(self, id):
+    with self.lock:
+      self.due.pop(id, None)
+      self.pending = len(self.due)
+
+  def runJob(self, job):
+    id = job['id']
+    try:
+      handler = self.handlers.get(job.get('type'))
+      if handler is None:
+        raise Exception(f'no handler for job type {job.get("type")}')
+      handler(job.get('payload'))
+      self.dbAction(tableName, 'remove', {
+        'id': id
+      })
+      self.forget(id)
+      with self.lock:
+        self.succeeded = self.succeeded + 1
+    except Exception as e:
+      self.onFail(job, e)
+    finally:
+      with self.lock:
+        self.running.discard(id)
+
+  def onFail(self, job, e):
+    attempt = int(float(job.get('attempt') or 0)) + 1
+    maxAttempts = int(float(job.get('maxAttempts') or JOB_MAX_ATTEMPTS))
+    if attempt >= maxAttempts:
+      printError(e, f'job {job["id"]} dropped after {attempt} attempts')
+      self.dbAction(tableName, 'remove', {
+        'id': job['id']
+      })
+      self.forget(job['id'])
+      with self.lock:
+        self.dropped = self.dropped + 1
+      return
+    if not isinstance(e, RetryJob):
+      printError(e, f'job {job["id"]}')
+    delay = retryDelay(attempt)
+    debug('job', job['id'], 'retry in', delay)
+    runAt = time.time() + delay
+    self.dbAction(tableName, 'update', {
+      'id': job['id'],
+      'update': {
+        'attempt': str(attempt),
+        'runAt': runAt,
+        'lockedUntil': 0
+      }
+    })
+    with self.lock:
+      self.due[job['id']] = runAt
+      self.retried = self.retried + 1
+
+  def drain(self, wait = False, rescan = False):
+    '''
+    run due jobs on worker pool, wait for them when wait is True,
+    rescan: read whole job table first, not only the due index,
+    return number of jobs started
+    '''
+    started = 0
+    for job in self.dueJobs(time.time(), rescan):
+      if not self.claim(job):
+        continue
+      if wait or not self.pool.submit(self.runJob, job):
+        self.runJob(job)
+      started = started + 1
+    return started
+
+  def poll(self):
+    '''
+    drain until no job is known to this process, then stop, schedule starts it again
+    '''
+    while True:
+      with self.lock:
+        generation = self.generation
+      try:
+        self.drain()
+      except Exception as e:
+        printError(e, 'job poll')
+      with self.lock:
+        if self.pending == 0 and len(self.running) == 0 and generation == self.generation:
+          self.polling = False
+          return
+      time.sleep(JOB_POLL_INTERVAL)
+
+  def startPolling(self):
+    '''
+    one polling thread per process while jobs exist,
+    started by schedule, or at start with JOB_POLL_ON_START,
+    lambda relies on scheduled `jobs` route instead
+    '''
+    if self.polling or JOB_POLL_INTERVAL <= 0 or lambdaName():
+      return
+    with self.lock:
+      if self.polling:
+        return
+      self.polling = True
+    threading.Thread(target=self.poll, daemon=True, name='rc-bot-job-poll').start()
+
+  def stats(self):
+    with self.lock:
+      return {
+        'running': len(self.running),
+        'succeeded': self.succeeded,
+        'retried': self.retried,
+        'dropped': self.dropped
+      }
+
+def initJobsView(jobQueue):
+  '''
+  `jobs` route, drain due jobs, for lambda schedule event,
+  disabled unless JOBS_TOKEN is set
+  '''
+  def jobsView(event):
+    if not JOBS_TOKEN:
+      return result('Jobs route disabled, set JOBS_TOKEN to enable it', 403)
+    if getQueryParam(event, 'token') != JOBS_TOKEN:
+      return result('forbidden', 403)
+    # lambda instances do not share the due index, so read the whole table
+    n = jobQueue.drain(True, True)
+    return result(f'{n} jobs run')
+  return jobsView
@@ -0,0 +1,40 @@
+'''
+metrics route, prometheus text format
+'''
+from .common import result, getQueryParam
+from .tracing import prometheusText
+import os
+
+# yes: /metrics without token, disabled by default
+METRICS_ENABLED = False
+try:
+  METRICS_ENABLED = os.environ['METRICS_ENABLED'] == 'yes'
+except:
+  pass
+
+# when set, /metrics is enabled, scrape with /metrics?token=xxx
+METRICS_TOKEN = ''
+try:
+  METRICS_TOKEN = os.environ['METRICS_TOKEN']
+except:
+  pass
+
+def initMetricsView(gauges):
+  '''
+  gauges: function return {group: {name: number}} of framework counters
+  '''
+  def metricsView(event):
+    if not METRICS_ENABLED and not METRICS_TOKEN:
+      return result('Metrics disabled, set METRICS_TOKEN or METRICS_ENABLED=yes to enable it', 403)
+    if METRICS_TOKEN and getQueryParam(event, 'token') != METRICS_TOKEN:
+      return result('forbidden', 403)
+    return result(
+      prometheusText(gauges()),
+      200,
+      {
+        'headers': {
+          'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+        }
+      }
+    )
+  return metricsView
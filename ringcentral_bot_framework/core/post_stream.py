@@ -0,0 +1,137 @@
+"""
+progressive reply in one chat post
+text is appended as it is produced, post is edited at most once per interval,
+edits that would wait for the rate limiter are skipped and merged into a later one
+"""
+import os
+import time
+import threading
+from .common import printError
+
+POST_STREAM_INTERVAL = 1.0
+try:
+  POST_STREAM_INTERVAL = float(os.environ['POST_STREAM_INTERVAL'])
+except:
+  pass
+
+def textMessage(text):
+  return {
+    'text': text
+  }
+
+def postId(res):
+  '''
+  id of created post from rest response, None if post was queued or failed
+  '''
+  try:
+    return res.json()['id']
+  except:
+    return None
+
+class PostStream:
+  '''
+  stream = bot.streamMessage(groupId, {'text': 'thinking...'})
+  stream.write(delta) for each chunk, stream.close() when done,
+  render turns full text into message object (text post or adaptive card)
+  '''
+
+  def __init__(
+    self,
+    bot,
+    groupId,
+    initial,
+    render = textMessage,
+    card = False,
+    interval = None
+  ):
+    self.bot = bot
+    self.groupId = groupId
+    self.render = render
+    self.card = card
+    self.interval = POST_STREAM_INTERVAL if interval is None else interval
+    self.lock = threading.Lock()
+    self.text = ''
+    self.sent = None
+    self.lastEdit = 0
+    self.edits = 0
+    self.skipped = 0
+    self.closed = False
+    send = bot.sendAdaptiveCard if card else bot.sendMessage
+    self.id = postId(send(groupId, initial))
+
+  def update(self, messageObj):
+    if self.card:
+      return self.bot.updateAdaptiveCard(self.id, messageObj)
+    return self.bot.updateMessage(self.groupId, self.id, messageObj)
+
+  def limited(self):
+    '''
+    True if an edit now would wait for a rate limit token
+    '''
+    limiter = getattr(self.bot, 'rateLimiter', None)
+    if limiter is None:
+      return False
+    return not limiter.ready(self.bot.id, None if self.card else self.groupId)
+
+  def flush(self, force = False):
+    '''
+    edit post with current text if interval passed since last edit
+    and a rate limit token is free, final edit (force) always runs
+    '''
+    with self.lock:
+      now = time.monotonic()
+      if self.text == self.sent or (not force and now - self.lastEdit < self.interval):
+        return
+      if not force and self.limited():
+        self.skipped = self.skipped + 1
+        return
+      text = self.text
+      self.sent = text
+      self.lastEdit = now
+    if self.id is None:
+      return
+    try:
+      self.update(self.render(text))
+      self.edits = self.edits + 1
+    except Exception as e:
+      printError(e, 'post stream')
+
+  def write(self, delta):
+    with self.lock:
+      self.text = self.text + delta
+    self.flush()
+
+  def drop(self, count):
+    '''
+    remove last count characters written, e.g. text of a tool calling round,
+    post is only edited if they were already shown
+    '''
+    if count <= 0:
+      return
+    with self.lock:
+      self.text = self.text[0:max(0, len(self.text) - count)]
+    self.flush()
+
+  def set(self, text):
+    '''
+    replace whole text, e.g. final formatted answer
+    '''
+    with self.lock:
+      self.text = text
+    self.flush()
+
+  def close(self, text = None):
+    '''
+    final edit, post new message if first post could not be created
+    '''
+    if self.closed:
+      return
+    self.closed = True
+    if not text is None:
+      with self.lock:
+        self.text = text
+    if self.id is None:
+      send = self.bot.sendAdaptiveCard if self.card else self.bot.sendMessage
+      send(self.groupId, self.render(self.text))
+      return
+    self.flush(True)
@@ -0,0 +1,348 @@
+"""
+outbound rate limit for bot posts
+token buckets: global (glip posts api), per bot, per group,
+429/503 responses honor Retry-After and retry with jittered backoff
+"""
+import os
+import time
+import heapq
+import random
+import threading
+from collections import deque
+from .cache import TTLCache
+from .common import printError, debug
+
+def parseRate(v):
+  '''
+  'count/seconds' to (rate per second, burst), '' or '0' to None (no limit)
+  '''
+  if not v or v == '0':
+    return None
+  arr = v.split('/')
+  count = float(arr[0])
+  seconds = float(arr[1]) if len(arr) > 1 else 1.0
+  return (count / seconds, count)
+
+# count/seconds
+RATE_LIMIT_GLOBAL = None
+RATE_LIMIT_BOT = parseRate('40/60')
+RATE_LIMIT_GROUP = None
+try:
+  RATE_LIMIT_GLOBAL = parseRate(os.environ['RATE_LIMIT_GLOBAL'])
+except:
+  pass
+try:
+  RATE_LIMIT_BOT = parseRate(os.environ['RATE_LIMIT_BOT'])
+except:
+  pass
+try:
+  RATE_LIMIT_GROUP = parseRate(os.environ['RATE_LIMIT_GROUP'])
+except:
+  pass
+
+# longest time a caller waits for a token or a retry,
+# background posts that would wait longer go to the retry queue,
+# inline posts send anyway (token) or give up (retry)
+RATE_LIMIT_MAX_WAIT = 2.0
+RATE_LIMIT_MAX_RETRIES = 5
+RATE_LIMIT_RETRY_BASE = 1.0
+RATE_LIMIT_RETRY_MAX = 120.0
+try:
+  RATE_LIMIT_MAX_WAIT = float(os.environ['RATE_LIMIT_MAX_WAIT'])
+except:
+  pass
+try:
+  RATE_LIMIT_MAX_RETRIES = int(os.environ['RATE_LIMIT_MAX_RETRIES'])
+except:
+  pass
+
+retryStatus = [429, 503]
+
+class TokenBucket:
+
+  def __init__(self, rate, burst):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.updated = time.monotonic()
+    self.pausedUntil = 0
+    self.lock = threading.Lock()
+
+  def reserve(self):
+    '''
+    take one token, return seconds to wait before using it
+    '''
+    with self.lock:
+      now = time.monotonic()
+      self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+      self.updated = now
+      self.tokens = self.tokens - 1
+      wait = 0 if self.tokens >= 0 else -self.tokens / self.rate
+      return max(wait, self.pausedUntil - now)
+
+  def ready(self):
+    '''
+    True if a token can be taken without waiting, takes none
+    '''
+    with self.lock:
+      now = time.monotonic()
+      tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+      return tokens >= 1 and now >= self.pausedUntil
+
+  def pause(self, seconds):
+    '''
+    server said slow down, hold all posts for seconds
+    '''
+    with self.lock:
+      self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+
+class RetryLater(Exception):
+  '''
+  run task again after delay, retry False: waiting for a token, not counted as a retry
+  '''
+
+  def __init__(self, delay, retry = True):
+    super().__init__(f'retry in {delay}s')
+    self.delay = delay
+    self.retry = retry
+
+class RetryQueue:
+  '''
+  delayed retries, tasks of same key run in order
+  '''
+
+  def __init__(self, maxRetries):
+    self.maxRetries = maxRetries
+    self.cond = threading.Condition()
+    # key: deque of [func, attempt]
+    self.keys = {}
+    # (runAt, seq, key), one entry for head task of each key
+    self.heap = []
+    self.seq = 0
+    self.started = False
+    self.dropped = 0
+    self.retried = 0
+
+  def schedule(self, key, delay):
+    self.seq = self.seq + 1
+    heapq.heappush(self.heap, (time.monotonic() + delay, self.seq, key))
+    self.cond.notify()
+
+  def submit(self, key, func, delay = 0):
+    with self.cond:
+      if not self.started:
+        threading.Thread(target=self.run, daemon=True, name='rc-bot-retry').start()
+        self.started = True
+      if key in self.keys:
+        self.keys[key].append([func, 0])
+        return
+      self.keys[key] = deque([[func, 0]])
+      self.schedule(key, delay)
+
+  def pending(self, key):
+    with self.cond:
+      return key in self.keys
+
+  def size(self):
+    with self.cond:
+      return sum(map(len, self.keys.values()))
+
+  def run(self):
+    while True:
+      with self.cond:
+        while len(self.heap) == 0 or self.heap[0][0] > time.monotonic():
+          timeout = None if len(self.heap) == 0 else self.heap[0][0] - time.monotonic()
+          self.cond.wait(timeout)
+        runAt, seq, key = heapq.heappop(self.heap)
+        task = self.keys[key][0]
+      delay = None
+      retry = True
+      try:
+        task[0]()
+      except RetryLater as e:
+        delay = e.delay
+        retry = e.retry
+      except Exception as e:
+        printError(e, 'retry queue')
+      with self.cond:
+        tasks = self.keys[key]
+        if not delay is None:
+          if retry:
+            task[1] = task[1] + 1
+          if task[1] <= self.maxRetries:
+            if retry:
+              self.retried = self.retried + 1
+            self.schedule(key, delay)
+            continue
+          self.dropped = self.dropped + 1
+          printError(f'give up after {self.maxRetries} retries', 'retry queue')
+        tasks.popleft()
+        if len(tasks) == 0:
+          self.keys.pop(key)
+        else:
+          self.schedule(key, 0)
+
+def retryDelay(e, attempt):
+  '''
+  Retry-After header if any, otherwise jittered exponential backoff
+  '''
+  after = None
+  try:
+    after = float(e.response.headers.get('Retry-After'))
+  except:
+    pass
+  if after is None:
+    after = min(RATE_LIMIT_RETRY_BASE * (2 ** attempt), RATE_LIMIT_RETRY_MAX)
+  return min(after, RATE_LIMIT_RETRY_MAX) + random.random() * RATE_LIMIT_RETRY_BASE
+
+def shouldRetry(e):
+  return getattr(e, 'status', None) in retryStatus
+
+class RateLimiter:
+
+  def __init__(self):
+    self.globalBucket = None if RATE_LIMIT_GLOBAL is None else TokenBucket(*RATE_LIMIT_GLOBAL)
+    self.buckets = TTLCache(100000, 3600)
+    self.lock = threading.Lock()
+    self.retryQueue = RetryQueue(RATE_LIMIT_MAX_RETRIES)
+    self.waited = 0
+    self.waitSeconds = 0.0
+    self.throttled = 0
+
+  def bucket(self, key, rate):
+    if rate is None:
+      return None
+    with self.lock:
+      b = self.buckets.get(key)
+      if b is None:
+        b = TokenBucket(*rate)
+        self.buckets.set(key, b)
+      return b
+
+  def bucketsFor(self, botId, groupId, withGlobal = True):
+    return list(filter(lambda x: not x is None, [
+      self.globalBucket if withGlobal else None,
+      self.bucket(('bot', botId), RATE_LIMIT_BOT),
+      None if groupId is None else self.bucket(('group', botId, groupId), RATE_LIMIT_GROUP)
+    ]))
+
+  def reserve(self, botId, groupId):
+    '''
+    take a token of each bucket, return seconds until they can be used
+    '''
+    return max([0] + list(map(lambda b: b.reserve(), self.bucketsFor(botId, groupId))))
+
+  def ready(self, botId, groupId):
+    '''
+    True if a post now would not wait, for optional posts like stream edits
+    '''
+    return all(map(lambda b: b.ready(), self.bucketsFor(botId, groupId)))
+
+  def wait(self, seconds):
+    if seconds <= 0:
+      return
+    with self.lock:
+      self.waited = self.waited + 1
+      self.waitSeconds = self.waitSeconds + seconds
+    time.sleep(seconds)
+
+  def acquire(self, botId, groupId):
+    '''
+    wait for tokens, at most RATE_LIMIT_MAX_WAIT seconds
+    '''
+    self.wait(min(self.reserve(botId, groupId), RATE_LIMIT_MAX_WAIT))
+
+  def pause(self, botId, groupId, delay):
+    '''
+    hold posts of this bot and group, other bots keep posting
+    '''
+    for b in self.bucketsFor(botId, groupId, False):
+      b.pause(delay)
+
+  def call(self, botId, groupId, func, background = False):
+    '''
+    run func (a post to glip) under rate limit,
+    caller waits at most RATE_LIMIT_MAX_WAIT seconds, longer waits and
+    429/503 retries go to retry queue if background, otherwise
+    inline calls post anyway after a long token wait and give up on a long retry,
+    background calls return None when queued
+    '''
+    key = (botId, groupId)
+    if background and self.retryQueue.pending(key):
+      # keep order behind messages waiting for retry
+      self.retryQueue.submit(key, self.retryTask(botId, groupId, func))
+      return None
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+      wait = self.reserve(botId, groupId)
+      if background and wait > RATE_LIMIT_MAX_WAIT:
+        # token is reserved, post it from retry queue when due
+        self.retryQueue.submit(key, self.retryTask(botId, groupId, func, attempt, True), wait)
+        return None
+      self.wait(min(wait, RATE_LIMIT_MAX_WAIT))
+      try:
+        return func()
+      except Exception as e:
+        if not shouldRetry(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+          raise
+        delay = retryDelay(e, attempt)
+        self.onThrottled(botId, groupId, delay)
+        if background:
+          self.retryQueue.submit(key, self.retryTask(botId, groupId, func, attempt + 1), delay)
+          return None
+        if delay > RATE_LIMIT_MAX_WAIT:
+          raise
+        time.sleep(delay)
+
+  def retryTask(self, botId, groupId, func, attempt = 0, reserved = False):
+    state = {
+      'attempt': attempt,
+      'reserved': reserved
+    }
+    def task():
+      if state['reserved']:
+        state['reserved'] = False
+      else:
+        wait = self.reserve(botId, groupId)
+        if wait > 0:
+          # run again when token is due, retry thread is not held
+          state['reserved'] = True
+          raise RetryLater(wait, False)
+      try:
+        return func()
+      except Exception as e:
+        if not shouldRetry(e):
+          raise
+        delay = retryDelay(e, state['attempt'])
+        state['attempt'] = state['attempt'] + 1
+        self.onThrottled(botId, groupId, delay)
+        raise RetryLater(delay)
+    return task
+
+  def onThrottled(self, botId, groupId, delay):
+    debug('glip post throttled, retry in', delay)
+    with self.lock:
+      self.throttled = self.throttled + 1
+    self.pause(botId, groupId, delay)
+
+  def stats(self):
+    with self.lock:
+      return {
+        'waited': self.waited,
+        'waitSeconds': self.waitSeconds,
+        'throttled': self.throttled,
+        'retryPending': self.retryQueue.size(),
+        'retried': self.retryQueue.retried,
+        'dropped': self.retryQueue.dropped
+      }
+
+limiterHolder = {}
+limiterLock = threading.Lock()
+
+def getRateLimiter():
+  '''
+  process wide rate limiter, limits are per api, not per framework instance
+  '''
+  with limiterLock:
+    if not 'limiter' in limiterHolder:
+      limiterHolder['limiter'] = RateLimiter()
+    return limiterHolder['limiter']
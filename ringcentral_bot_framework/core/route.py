@@ -5,16 +5,22 @@ route /{action} to different event handeler
 /bot-webhook bot webhook
 /user-webhook user webhook
 /interactive interactive from adaptive cards
+/jobs run due delayed jobs, for scheduled lambda invoke
+/metrics stage latency and framework counters, prometheus text format
+/health process is up
+/ready database answers, 503 otherwise
 
 extend or overide default route by set `routes` in config.py
 """
 
 from urllib.parse import parse_qs, urlencode
 from .common import debug, defaultEventHandler
+from .tracing import span, traced
 from pydash import get
 from pydash.predicates import is_dict
 import json
 
+@traced('event_parse')
 def eventParser(event):
   '''
   fix event format
@@ -39,11 +45,14 @@ def initRouter(routes):
     action = get(event, 'pathParameters.action')
     handler = defaultEventHandler
     debug('action=====', action)
-    event = eventParser(event)
-    try:
-      handler = routes[action]
-    except:
-      pass
-    return handler(event)
+    # unknown actions share one stage, keep metric labels bounded
+    stage = 'route.' + (action if action in routes else 'default')
+    with span(stage):
+      event = eventParser(event)
+      try:
+        handler = routes[action]
+      except:
+        pass
+      return handler(event)
 
   return router
\ No newline at end of file
@@ -0,0 +1,353 @@
+"""
+sqlite db
+one table per conf.dbTables() entry, json schema types stored as json text,
+fields not in schema stored in `extra` json column
+"""
+__name__ = 'sqlite'
+__package__ = 'ringcentral_bot_framework.core'
+
+import pydash as _
+import os
+import re
+import json
+import sqlite3
+import threading
+from .common import debug, printError, leaseFree, leased
+from os.path import join
+
+SQLITE_DB_PATH = join(os.getcwd(), 'sqlite.db')
+try:
+  SQLITE_DB_PATH = os.environ['SQLITE_DB_PATH']
+except:
+  pass
+
+SQLITE_BUSY_TIMEOUT = 5.0
+try:
+  SQLITE_BUSY_TIMEOUT = float(os.environ['SQLITE_BUSY_TIMEOUT'])
+except:
+  pass
+
+dbName = 'sqlite'
+
+validName = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def quote(name):
+  if not validName.match(name):
+    raise Exception(f'sqlite: invalid name {name}')
+  return f'"{name}"'
+
+def initDB(conf):
+  schemas = {}
+  for t in conf.dbTables():
+    schemas[t['name']] = list(
+      filter(lambda x: x['name'] != 'id', t['schemas'])
+    )
+  local = threading.local()
+  lock = threading.Lock()
+  ready = set()
+  indexed = set()
+
+  def getConn():
+    """
+    one connection per thread, WAL lets readers run beside the writer
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+      conn = sqlite3.connect(
+        SQLITE_DB_PATH,
+        timeout=SQLITE_BUSY_TIMEOUT,
+        isolation_level=None,
+        check_same_thread=False
+      )
+      conn.execute('PRAGMA journal_mode=WAL')
+      conn.execute('PRAGMA synchronous=NORMAL')
+      local.conn = conn
+    return conn
+
+  def columns(table):
+    return schemas.get(table) or []
+
+  def isJsonCol(col):
+    return col.get('type') == 'json'
+
+  def names(table):
+    """
+    quoted column names in row order, statements never rely on table column order,
+    columns added by later schema versions are appended to existing tables
+    """
+    return ', '.join(
+      ['"id"'] + list(map(lambda col: quote(col['name']), columns(table))) + ['"extra"']
+    )
+
+  def insertSql(table):
+    return (
+      f'INSERT OR REPLACE INTO {quote(table)} ({names(table)}) '
+      f'VALUES ({", ".join(["?"] * (len(columns(table)) + 2))})'
+    )
+
+  def selectSql(table):
+    return f'SELECT {names(table)} FROM {quote(table)}'
+
+  def prepareTable(table):
+    """
+    create table, add schema columns it misses, and indexes, once per process
+    """
+    if table in ready:
+      return
+    with lock:
+      if table in ready:
+        return
+      conn = getConn()
+      cols = ['"id" TEXT PRIMARY KEY']
+      for col in columns(table):
+        # no declared type for plain columns, so values keep their type
+        cols.append(quote(col['name']) + (' TEXT' if isJsonCol(col) else ''))
+      cols.append('"extra" TEXT')
+      conn.execute(
+        f'CREATE TABLE IF NOT EXISTS {quote(table)} ({", ".join(cols)})'
+      )
+      existing = set(map(lambda row: row[1], conn.execute(f'PRAGMA table_info({quote(table)})')))
+      for col in columns(table):
+        if not col['name'] in existing:
+          conn.execute(
+            f'ALTER TABLE {quote(table)} ADD COLUMN {quote(col["name"])}' + (' TEXT' if isJsonCol(col) else '')
+          )
+      for col in columns(table):
+        if not isJsonCol(col):
+          conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {quote("idx_" + table + "_" + col["name"])} '
+            f'ON {quote(table)} ({quote(col["name"])})'
+          )
+      ready.add(table)
+
+  def prepareExtraIndex(table, key):
+    """
+    expression index for query on field not in schema
+    """
+    name = table + '.' + key
+    if name in indexed:
+      return
+    quote(key)
+    getConn().execute(
+      f'CREATE INDEX IF NOT EXISTS {quote("idx_" + table + "_extra_" + key)} '
+      f'ON {quote(table)} (json_extract("extra", \'$.{key}\'))'
+    )
+    indexed.add(name)
+
+  def toRow(table, item):
+    """
+    dict / list value of plain column is kept in extra,
+    so it is read back as it was written
+    """
+    item = dict(item)
+    row = [str(item.pop('id'))]
+    for col in columns(table):
+      name = col['name']
+      v = item.get(name)
+      if isJsonCol(col):
+        v = None if v is None else json.dumps(v)
+      elif _.predicates.is_dict(v) or _.predicates.is_list(v):
+        row.append(None)
+        continue
+      item.pop(name, None)
+      row.append(v)
+    row.append(json.dumps(item))
+    return row
+
+  def fromRow(table, row):
+    item = json.loads(row[-1] or '{}')
+    item['id'] = row[0]
+    for i, col in enumerate(columns(table)):
+      v = row[i + 1]
+      if v is None:
+        continue
+      if isJsonCol(col):
+        v = json.loads(v)
+      item[col['name']] = v
+    return item
+
+  def putItem(conn, table, item):
+    row = toRow(table, item)
+    conn.execute(
+      insertSql(table),
+      row
+    )
+
+  def getItem(conn, table, id):
+    row = conn.execute(
+      selectSql(table) + ' WHERE "id" = ?',
+      [id]
+    ).fetchone()
+    if row is None:
+      return False
+    return fromRow(table, row)
+
+  def queryWhere(table, query):
+    """
+    sql condition and params of query {key, value}
+    """
+    key = query['key']
+    value = query['value']
+    names = list(map(lambda x: x['name'], columns(table)))
+    if key == 'id':
+      return '"id" = ?', [str(value)]
+    elif key in names:
+      col = _.find(columns(table), lambda x: x['name'] == key)
+      # json column holds json text, plain column holds the raw value
+      if isJsonCol(col):
+        value = json.dumps(value)
+      return f'{quote(key)} = ?', [value]
+    prepareExtraIndex(table, key)
+    return f'json_extract("extra", \'$.{key}\') = ?', [value]
+
+  def scan(conn, table, query=None):
+    if query is None:
+      rows = conn.execute(selectSql(table))
+      return list(map(lambda r: fromRow(table, r), rows))
+    if query['key'] == 'id':
+      res = getItem(conn, table, str(query['value']))
+      return [] if res == False else [res]
+    where, params = queryWhere(table, query)
+    rows = conn.execute(
+      selectSql(table) + f' WHERE {where}',
+      params
+    )
+    return list(map(lambda r: fromRow(table, r), rows))
+
+  def page(conn, table, data):
+    """
+    keyset page in id order, one extra row tells if there is a next page
+    """
+    limit = int(_.get(data, 'limit') or 100)
+    cursor = _.get(data, 'cursor')
+    wheres = []
+    params = []
+    if not _.get(data, 'key') is None:
+      where, params = queryWhere(table, data)
+      wheres.append(where)
+    if not cursor is None:
+      wheres.append('"id" > ?')
+      params = params + [str(cursor)]
+    where = ' WHERE ' + ' AND '.join(wheres) if len(wheres) else ''
+    rows = list(conn.execute(
+      selectSql(table) + f'{where} ORDER BY "id" LIMIT ?',
+      params + [limit + 1]
+    ))
+    items = list(map(lambda r: fromRow(table, r), rows[0:limit]))
+    return {
+      'items': items,
+      'cursor': items[-1]['id'] if len(rows) > limit else None
+    }
+
+  def action(tableName, action, data = None):
+    """db action wrapper
+    * @param {String} tableName, user or bot
+    * @param {String} action, add, remove, update, get
+    * @param {Object} data
+    * for add, {id: xxx, token: {...}, groups: {...}}
+    * for remove, {id: xxx} or {ids: [...]}
+    * for update, {id: xxx, update: {...}}
+    * for get, singleUser:{id: xxx}, allUser: {}, query: { 'key': 'xx', 'value': 'yy'}
+    * for batchGet, {ids: [...]}, return list of found items
+    * for batchAdd, {items: [{id: xxx, ...}, ...]}
+    * for batchRemove, {ids: [...]}
+    * for page, {limit: n, cursor: lastId, key?: xx, value?: yy},
+      return {items: [...], cursor: next cursor or None}
+    * for lease, {id: xxx, key: field, until: t, now: t, create?: bool, update?: {...}},
+      set field to until if it is missing or before now, atomic, return True if set
+    """
+    debug('db op:', tableName, action, data)
+    try:
+      prepareTable(tableName)
+      conn = getConn()
+      id = _.get(data, 'id')
+      if _.predicates.is_number(id):
+        id = str(id)
+
+      if action == 'add':
+        putItem(conn, tableName, data)
+
+      elif action == 'remove' or action == 'batchRemove':
+        ids = _.get(data, 'ids') or [id]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+          conn.executemany(
+            f'DELETE FROM {quote(tableName)} WHERE "id" = ?',
+            list(map(lambda x: [str(x)], ids))
+          )
+          conn.execute('COMMIT')
+        except:
+          conn.execute('ROLLBACK')
+          raise
+
+      elif action == 'batchAdd':
+        rows = list(map(lambda item: toRow(tableName, item), data['items']))
+        if len(rows) == 0:
+          return action
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+          conn.executemany(
+            insertSql(tableName),
+            rows
+          )
+          conn.execute('COMMIT')
+        except:
+          conn.execute('ROLLBACK')
+          raise
+
+      elif action == 'batchGet':
+        ids = list(dict.fromkeys(map(str, data['ids'])))
+        res = []
+        for i in range(0, len(ids), 500):
+          chunk = ids[i:i + 500]
+          rows = conn.execute(
+            selectSql(tableName) + f' WHERE "id" IN ({", ".join(["?"] * len(chunk))})',
+            chunk
+          )
+          res = res + list(map(lambda r: fromRow(tableName, r), rows))
+        return res
+
+      elif action == 'update':
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+          old = getItem(conn, tableName, id)
+          if old == False:
+            raise Exception(f'sqlite: {tableName} {id} not found')
+          _.assign(old, data['update'])
+          putItem(conn, tableName, old)
+          conn.execute('COMMIT')
+        except:
+          conn.execute('ROLLBACK')
+          raise
+
+      elif action == 'lease':
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+          old = getItem(conn, tableName, id)
+          ok = leaseFree(old, data)
+          if ok:
+            putItem(conn, tableName, leased(old, data))
+          conn.execute('COMMIT')
+          return ok
+        except:
+          conn.execute('ROLLBACK')
+          raise
+
+      elif action == 'page':
+        return page(conn, tableName, data)
+
+      elif action == 'get':
+        if not id is None:
+          return getItem(conn, tableName, id)
+        else:
+          query = None
+          if not _.get(data, 'key') is None:
+            query = data
+          return scan(conn, tableName, query)
+
+      return action
+    except Exception as e:
+      printError(e, 'sqlite db action')
+      return False
+
+  return action
@@ -0,0 +1,78 @@
+"""
+webhook subscription kept per bot / user record:
+{'id': subscriptionId, 'expirationTime': iso time, 'filters': [...]}
+renewed in place with one api call, recreated only when server returns 404
+"""
+import json
+from .common import debug, printError
+
+subscriptionUrl = '/restapi/v1.0/subscription'
+
+def toRecord(res, filters):
+  sub = json.loads(res.text)
+  return {
+    'id': sub['id'],
+    'expirationTime': sub.get('expirationTime'),
+    'filters': filters
+  }
+
+def findSubscriptions(rc, address):
+  '''
+  subscriptions of this app delivered to address
+  '''
+  res = rc.get(subscriptionUrl)
+  records = json.loads(res.text)['records']
+  found = list(filter(
+    lambda x: x['deliveryMode']['address'] == address,
+    records
+  ))
+  debug('subs list', address, ','.join(map(lambda x: x['id'], found)))
+  return found
+
+def createSubscription(rc, address, filters, expiresIn):
+  res = rc.post(subscriptionUrl, {
+    'eventFilters': filters,
+    'expiresIn': expiresIn,
+    'deliveryMode': {
+      'transportType': 'WebHook',
+      'address': address
+    }
+  })
+  return toRecord(res, filters)
+
+def deleteSubscription(rc, id):
+  debug('del sub id:', id)
+  try:
+    rc.delete(subscriptionUrl + '/' + id)
+  except Exception as e:
+    printError(e, 'delete subscription')
+
+def renewSubscription(rc, sub, address, filters, expiresIn):
+  '''
+  renew cached subscription, update it in place if filters changed,
+  recreate only if it is gone (404),
+  without cached id (records saved before ids were kept),
+  create new one then remove old ones found by address,
+  return new subscription record
+  '''
+  id = sub.get('id') if isinstance(sub, dict) else None
+  if id:
+    try:
+      if sub.get('filters') == filters:
+        res = rc.post(f'{subscriptionUrl}/{id}/renew')
+      else:
+        res = rc.put(f'{subscriptionUrl}/{id}', {
+          'eventFilters': filters,
+          'expiresIn': expiresIn
+        })
+      return toRecord(res, filters)
+    except Exception as e:
+      if getattr(e, 'status', None) != 404:
+        raise
+      debug('subscription gone, recreate', id)
+      return createSubscription(rc, address, filters, expiresIn)
+  old = findSubscriptions(rc, address)
+  record = createSubscription(rc, address, filters, expiresIn)
+  for s in old:
+    deleteSubscription(rc, s['id'])
+  return record
@@ -0,0 +1,155 @@
+"""
+proactive oauth token refresh
+tokens are stamped with absolute expire_time/refresh_token_expire_time,
+refreshed ahead of expiry, concurrent refreshes of one owner share one call
+"""
+import os
+import time
+import threading
+from .cache import TTLCache
+from .common import debug
+
+# seconds before access token expiry to refresh it
+TOKEN_REFRESH_AHEAD = 300.0
+try:
+  TOKEN_REFRESH_AHEAD = float(os.environ['TOKEN_REFRESH_AHEAD'])
+except:
+  pass
+
+def stampToken(token, now = None):
+  '''
+  add absolute expire times to token from oauth response, return token
+  '''
+  now = time.time() if now is None else now
+  if 'expires_in' in token:
+    token['expire_time'] = now + float(token['expires_in'])
+  if 'refresh_token_expires_in' in token:
+    token['refresh_token_expire_time'] = now + float(token['refresh_token_expires_in'])
+  return token
+
+def expireTime(token, key = 'expire_time'):
+  '''
+  absolute expire time, None if unknown (token saved before it was stamped)
+  '''
+  try:
+    return float(token[key])
+  except:
+    return None
+
+def needsRefresh(token, ahead = None, now = None):
+  '''
+  access token expires within ahead seconds, or its expiry is unknown
+  '''
+  ahead = TOKEN_REFRESH_AHEAD if ahead is None else ahead
+  now = time.time() if now is None else now
+  expire = expireTime(token)
+  return expire is None or expire - ahead <= now
+
+def canRefresh(token, now = None):
+  '''
+  refresh token exists and is not known to be expired
+  '''
+  if not token or not token.get('refresh_token'):
+    return False
+  now = time.time() if now is None else now
+  expire = expireTime(token, 'refresh_token_expire_time')
+  return expire is None or expire == 0 or expire > now
+
+def newer(a, b):
+  '''
+  a expires later than b
+  '''
+  return (expireTime(a) or 0) > (expireTime(b) or 0)
+
+class TokenManager:
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    # owner id: event set when running refresh is done
+    self.inflight = {}
+    # owner id: latest token refreshed in this process
+    self.latest = TTLCache(100000, 7200)
+    self.refreshed = 0
+    self.collapsed = 0
+    self.failed = 0
+
+  def current(self, ownerId, token):
+    '''
+    newest known token of owner, no network call
+    '''
+    latest = self.latest.get(ownerId)
+    if not latest is None and newer(latest, token):
+      return latest
+    return token
+
+  def refresh(self, ownerId, token, doRefresh):
+    '''
+    run doRefresh(token) -> new token, once per owner at a time,
+    callers arriving while it runs wait and get its result,
+    return new token, None if refresh failed
+    '''
+    with self.lock:
+      flight = self.inflight.get(ownerId)
+      leader = flight is None
+      if leader:
+        flight = self.inflight[ownerId] = {
+          'done': threading.Event(),
+          'token': None
+        }
+      else:
+        self.collapsed = self.collapsed + 1
+    if not leader:
+      flight['done'].wait()
+      return flight['token']
+    try:
+      latest = self.current(ownerId, token)
+      if latest is token or needsRefresh(latest):
+        latest = doRefresh(token)
+        debug('token refreshed', ownerId)
+        with self.lock:
+          self.refreshed = self.refreshed + 1
+      self.latest.set(ownerId, latest)
+      flight['token'] = latest
+      return latest
+    except Exception:
+      with self.lock:
+        self.failed = self.failed + 1
+      raise
+    finally:
+      with self.lock:
+        self.inflight.pop(ownerId, None)
+      flight['done'].set()
+
+  def ensure(self, ownerId, token, doRefresh, ahead = None):
+    '''
+    token valid for at least ahead seconds, refreshed only when needed,
+    return token to use, None if refresh failed
+    '''
+    token = self.current(ownerId, token)
+    if not needsRefresh(token, ahead):
+      return token
+    return self.refresh(ownerId, token, doRefresh)
+
+  def forget(self, ownerId):
+    self.latest.delete(ownerId)
+
+  def stats(self):
+    with self.lock:
+      return {
+        'refreshed': self.refreshed,
+        'collapsed': self.collapsed,
+        'failed': self.failed,
+        'inflight': len(self.inflight)
+      }
+
+managerHolder = {}
+managerLock = threading.Lock()
+
+def getTokenManager():
+  '''
+  process wide token manager
+  '''
+  with managerLock:
+    if not 'manager' in managerHolder:
+      managerHolder['manager'] = TokenManager()
+    return managerHolder['manager']
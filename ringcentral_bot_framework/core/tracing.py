@@ -0,0 +1,186 @@
+"""
+lightweight span tracer
+per stage latency histogram, count and error count,
+exported in prometheus text format, optional json lines span log
+"""
+import os
+import re
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+
+TRACING = True
+try:
+  TRACING = os.environ['TRACING'] != 'no'
+except:
+  pass
+
+# file path or stdout, every finished span written as one json line
+TRACE_LOG = ''
+try:
+  TRACE_LOG = os.environ['TRACE_LOG']
+except:
+  pass
+
+# histogram upper bounds in seconds
+buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+class Histogram:
+
+  def __init__(self):
+    self.counts = [0] * (len(buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.errors = 0
+
+  def observe(self, v, failed):
+    self.counts[bisect.bisect_left(buckets, v)] += 1
+    self.count += 1
+    self.sum += v
+    if failed:
+      self.errors += 1
+
+stages = {}
+stagesLock = threading.Lock()
+current = contextvars.ContextVar('rc_bot_span', default=None)
+logLock = threading.Lock()
+logHolder = {}
+
+def observe(name, seconds, failed = False):
+  with stagesLock:
+    h = stages.get(name)
+    if h is None:
+      h = stages[name] = Histogram()
+    h.observe(seconds, failed)
+
+def writeLog(record):
+  line = json.dumps(record) + '\n'
+  with logLock:
+    if TRACE_LOG == 'stdout':
+      print(line, end='', flush=True)
+      return
+    if not 'file' in logHolder:
+      logHolder['file'] = open(TRACE_LOG, 'a', buffering=1)
+    logHolder['file'].write(line)
+
+@contextmanager
+def span(name):
+  '''
+  with span('db.bot.get'):
+    ...
+  time the block under stage name, nested spans share trace id in span log
+  '''
+  if not TRACING:
+    yield
+    return
+  parent = current.get()
+  token = None
+  record = None
+  if TRACE_LOG:
+    record = {
+      'trace': parent['trace'] if parent else uuid.uuid4().hex,
+      'span': uuid.uuid4().hex[:16],
+      'parent': parent['span'] if parent else None,
+      'name': name,
+      'start': time.time()
+    }
+    token = current.set(record)
+  start = time.perf_counter()
+  failed = False
+  try:
+    yield
+  except BaseException:
+    failed = True
+    raise
+  finally:
+    duration = time.perf_counter() - start
+    observe(name, duration, failed)
+    if not token is None:
+      current.reset(token)
+      record['duration'] = duration
+      record['error'] = failed
+      writeLog(record)
+
+def traced(name):
+  '''
+  decorator version of span
+  '''
+  def wrap(func):
+    @wraps(func)
+    def run(*args, **kwargs):
+      with span(name):
+        return func(*args, **kwargs)
+    return run
+  return wrap
+
+def stageStats():
+  '''
+  {stage: {count, errors, sum, avg}}
+  '''
+  with stagesLock:
+    return {
+      name: {
+        'count': h.count,
+        'errors': h.errors,
+        'sum': h.sum,
+        'avg': h.sum / h.count if h.count else 0
+      } for name, h in stages.items()
+    }
+
+def reset():
+  with stagesLock:
+    stages.clear()
+
+def escape(v):
+  return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def metricName(*parts):
+  name = '_'.join(parts)
+  name = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', name).lower()
+  return re.sub(r'[^a-z0-9_]', '_', name)
+
+def flatten(prefix, obj, out):
+  for key, v in obj.items():
+    if isinstance(v, dict):
+      flatten(prefix + [key], v, out)
+    elif isinstance(v, (int, float)) and not isinstance(v, bool):
+      out.append((metricName(*prefix, key), v))
+    elif isinstance(v, bool):
+      out.append((metricName(*prefix, key), int(v)))
+  return out
+
+def prometheusText(gauges = None):
+  '''
+  stage histograms, plus numeric values of gauges dict, like
+  {'http_pool': {'requests': 1}} -> rc_bot_http_pool_requests 1
+  '''
+  lines = [
+    '# HELP rc_bot_stage_duration_seconds time spent in each stage',
+    '# TYPE rc_bot_stage_duration_seconds histogram'
+  ]
+  errors = []
+  with stagesLock:
+    items = sorted(stages.items())
+    snapshot = list(map(lambda x: (x[0], list(x[1].counts), x[1].count, x[1].sum, x[1].errors), items))
+  for name, counts, count, total, errorCount in snapshot:
+    label = escape(name)
+    acc = 0
+    for i, le in enumerate(buckets):
+      acc += counts[i]
+      lines.append(f'rc_bot_stage_duration_seconds_bucket{{stage="{label}",le="{le}"}} {acc}')
+    lines.append(f'rc_bot_stage_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {count}')
+    lines.append(f'rc_bot_stage_duration_seconds_sum{{stage="{label}"}} {total}')
+    lines.append(f'rc_bot_stage_duration_seconds_count{{stage="{label}"}} {count}')
+    errors.append(f'rc_bot_stage_errors_total{{stage="{label}"}} {errorCount}')
+  lines = lines + [
+    '# HELP rc_bot_stage_errors_total stage runs that raised',
+    '# TYPE rc_bot_stage_errors_total counter'
+  ] + errors
+  for name, v in flatten(['rc_bot'], gauges or {}, []):
+    lines.append(f'{name} {v}')
+  return '\n'.join(lines) + '\n'
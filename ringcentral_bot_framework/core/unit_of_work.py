@@ -0,0 +1,327 @@
+"""
+request scoped unit of work
+while an event is handled, dbAction reads of single records are memoized
+and writes are collected, then flushed once when the event ends:
+adds of a table in one batchAdd, removes in one remove of ids,
+updates of the same record merged into one update,
+a failed write (error or False from db) raises, so the event fails and is redelivered
+"""
+import copy
+import threading
+import contextvars
+from contextlib import contextmanager
+import pydash as _
+from .common import printError
+from .tracing import span
+from .config import frameworkTables
+
+current = contextvars.ContextVar('rc_bot_unit_of_work', default=None)
+
+statsLock = threading.Lock()
+counters = {
+  'events': 0,
+  'readsSaved': 0,
+  'writesDeferred': 0,
+  'writesFlushed': 0
+}
+
+class FlushError(Exception):
+  '''
+  pending writes of unit of work failed, first db error is its cause
+  '''
+  pass
+
+def count(key, n = 1):
+  with statsLock:
+    counters[key] = counters[key] + n
+
+def stats():
+  with statsLock:
+    return dict(counters)
+
+class UnitOfWork:
+
+  def __init__(self, dbAction):
+    self.db = dbAction
+    # framework tables are written at once, other processes / threads read
+    # or update them during the event, a deferred write would overwrite their changes
+    self.immediateTables = set(map(lambda table: table['name'], frameworkTables()))
+    # (table, id): record loaded from db, False if not found
+    self.records = {}
+    # (table, id): ['add', record] / ['update', fields] / ['remove', None]
+    self.pending = {}
+    # memoized objects, like bot/user instances
+    self.objects = {}
+    # run after flush, like cache invalidation
+    self.callbacks = []
+    self.lock = threading.RLock()
+
+  def memo(self, key, load):
+    '''
+    load(), once per key in this unit of work
+    '''
+    with self.lock:
+      if key in self.objects:
+        return self.objects[key]
+    v = load()
+    with self.lock:
+      return self.objects.setdefault(key, v)
+
+  def forget(self, key):
+    with self.lock:
+      self.objects.pop(key, None)
+
+  def load(self, tableName, id):
+    key = (tableName, id)
+    if key in self.records:
+      count('readsSaved')
+      return self.records[key]
+    res = self.db(tableName, 'get', {
+      'id': id
+    })
+    self.records[key] = res if _.predicates.is_dict(res) else False
+    return self.records[key]
+
+  def get(self, tableName, id):
+    op = self.pending.get((tableName, id))
+    if not op is None and op[0] != 'update':
+      count('readsSaved')
+      return copy.deepcopy(op[1]) if op[0] == 'add' else False
+    record = self.load(tableName, id)
+    if record == False:
+      return False
+    record = copy.deepcopy(record)
+    if not op is None:
+      _.assign(record, copy.deepcopy(op[1]))
+    return record
+
+  def write(self, tableName, action, data):
+    count('writesDeferred')
+    if action == 'add':
+      id = str(data['id'])
+      self.pending[(tableName, id)] = ['add', copy.deepcopy(data)]
+      return action
+    if action == 'remove':
+      for id in map(str, _.get(data, 'ids') or [data['id']]):
+        self.pending[(tableName, id)] = ['remove', None]
+      return action
+    # update
+    id = str(data['id'])
+    key = (tableName, id)
+    update = copy.deepcopy(data['update'])
+    op = self.pending.get(key)
+    if op is None:
+      self.pending[key] = ['update', update]
+    elif op[0] == 'remove':
+      # record is gone, same as update of missing record
+      return False
+    else:
+      _.assign(op[1], update)
+    return action
+
+  def action(self, tableName, action, data = None):
+    if tableName in self.immediateTables:
+      return self.db(tableName, action, data)
+    id = _.get(data, 'id')
+    with self.lock:
+      if action == 'get' and not id is None and _.get(data, 'key') is None:
+        return self.get(tableName, str(id))
+      if action in ['add', 'update'] or (action == 'remove' and (not id is None or not _.get(data, 'ids') is None)):
+        return self.write(tableName, action, data)
+      if action == 'batchAdd':
+        for item in data['items']:
+          self.write(tableName, 'add', item)
+        return action
+      if action == 'batchRemove':
+        return self.write(tableName, 'remove', data)
+      # get all, query, page, batchGet: read through, pending writes first
+      self.flushTable(tableName)
+    return self.db(tableName, action, data)
+
+  def flushTable(self, tableName):
+    ops = dict(filter(lambda x: x[0][0] == tableName, self.pending.items()))
+    for key in ops:
+      self.pending.pop(key)
+      self.records.pop(key, None)
+    adds = []
+    removes = []
+    updates = []
+    for (table, id), op in ops.items():
+      if op[0] == 'add':
+        adds.append(op[1])
+      elif op[0] == 'remove':
+        removes.append(id)
+      else:
+        updates.append((id, op[1]))
+    calls = 0
+    def run(action, data):
+      # backends log their errors and return False
+      if self.db(tableName, action, data) == False:
+        raise Exception(f'unit of work: {action} {tableName} failed')
+    if len(removes):
+      # as ids, record already gone is not an error
+      run('remove', {
+        'ids': removes
+      })
+      calls = calls + 1
+    if len(adds) == 1:
+      run('add', adds[0])
+      calls = calls + 1
+    elif len(adds) > 1:
+      run('batchAdd', {
+        'items': adds
+      })
+      calls = calls + 1
+    for id, update in updates:
+      run('update', {
+        'id': id,
+        'update': update
+      })
+      calls = calls + 1
+    count('writesFlushed', calls)
+
+  def flush(self):
+    '''
+    write pending records of all tables, other tables are still written
+    when one fails, then FlushError is raised
+    '''
+    errors = []
+    with self.lock:
+      tables = list(dict.fromkeys(map(lambda key: key[0], self.pending.keys())))
+      if len(tables):
+        with span('unit_of_work.flush'):
+          for tableName in tables:
+            try:
+              self.flushTable(tableName)
+            except Exception as e:
+              printError(e, f'unit of work flush {tableName}')
+              errors.append(e)
+      callbacks = self.callbacks
+      self.callbacks = []
+    for func in callbacks:
+      func()
+    if len(errors):
+      raise FlushError(str(errors[0])) from errors[0]
+
+def withUnitOfWork(dbAction):
+  '''
+  dbAction that goes through the unit of work of current event, if any
+  '''
+  def action(tableName, action, data = None):
+    uow = current.get()
+    if uow is None:
+      return dbAction(tableName, action, data)
+    return uow.action(tableName, action, data)
+  action.raw = dbAction
+  return action
+
+def memoize(kind, load):
+  '''
+  load(id) memoized per unit of work, plain load(id) outside one
+  '''
+  def get(id):
+    uow = current.get()
+    if uow is None:
+      return load(id)
+    return uow.memo((kind, id), lambda: load(id))
+  return get
+
+def forget(kind, id):
+  uow = current.get()
+  if not uow is None:
+    uow.forget((kind, id))
+
+def flushNow():
+  '''
+  write pending records of current unit of work at once,
+  for writes that must not wait for the end of event
+  '''
+  uow = current.get()
+  if not uow is None:
+    uow.flush()
+
+def syncPoint():
+  '''
+  flush and drop read cache of current unit of work,
+  around code that reads / writes db outside of it, like coroutines in main loop
+  '''
+  uow = current.get()
+  if not uow is None:
+    uow.flush()
+    with uow.lock:
+      uow.records.clear()
+
+def afterFlush(func):
+  '''
+  run func once current unit of work is flushed, no-op outside one
+  '''
+  uow = current.get()
+  if not uow is None:
+    uow.callbacks.append(func)
+
+@contextmanager
+def unitOfWork(dbAction):
+  '''
+  with unitOfWork(dbAction) as uow:
+    handle event
+  writes are flushed when block exits, also on error,
+  a failed flush raises unless the block already raised,
+  nested blocks share the outer unit of work
+  '''
+  uow = current.get()
+  if not uow is None:
+    yield uow
+    return
+  uow = UnitOfWork(getattr(dbAction, 'raw', dbAction))
+  token = current.set(uow)
+  count('events')
+  try:
+    yield uow
+  except:
+    current.reset(token)
+    try:
+      uow.flush()
+    except FlushError:
+      # logged by flush, keep error of the block
+      pass
+    raise
+  current.reset(token)
+  uow.flush()
+
+class LazyObject:
+  '''
+  proxy that runs load() on first use, isinstance and == see loaded object
+  '''
+
+  def __init__(self, load):
+    object.__setattr__(self, '_load', load)
+    object.__setattr__(self, '_target', None)
+    object.__setattr__(self, '_loaded', False)
+
+  def _get(self):
+    if not object.__getattribute__(self, '_loaded'):
+      object.__setattr__(self, '_target', object.__getattribute__(self, '_load')())
+      object.__setattr__(self, '_loaded', True)
+    return object.__getattribute__(self, '_target')
+
+  @property
+  def __class__(self):
+    return self._get().__class__
+
+  def __getattr__(self, name):
+    return getattr(self._get(), name)
+
+  def __setattr__(self, name, value):
+    setattr(self._get(), name, value)
+
+  def __eq__(self, other):
+    return self._get() == other
+
+  def __hash__(self):
+    return hash(self._get())
+
+  def __bool__(self):
+    return bool(self._get())
+
+  def __repr__(self):
+    return repr(self._get())
@@ -1,11 +1,16 @@
 
+import time
 from os import environ
-from ringcentral_client import RestClient
 from urllib.parse import urlencode
 from pydash.predicates import is_dict
 from pydash.objects import omit
-import json
 from .common import printError, debug, subscribeInterval
+from .aio import runInThread
+from .http_pool import PooledRestClient
+from . import group_index
+from .subscription import createSubscription, renewSubscription
+from .token_manager import getTokenManager, stampToken, expireTime, canRefresh
+from .unit_of_work import memoize, forget, flushNow, FlushError
 
 RINGCENTRAL_SERVER = environ['RINGCENTRAL_SERVER']
 RINGCENTRAL_BOT_SERVER = environ['RINGCENTRAL_BOT_SERVER']
@@ -19,7 +24,11 @@ try:
 except Exception as e:
   printError(e, 'user load env')
 
+USER_SUBSCRIPTION_EXPIRES_IN = 1799
+
 def initUserClass(conf, dbAction):
+  tokenManager = getTokenManager()
+
   class User:
 
     def __init__(
@@ -27,23 +36,27 @@ def initUserClass(conf, dbAction):
       id=None,
       token=None,
       groups=None,
-      data=None
+      data=None,
+      subscription=None
     ):
-      self.rc = RestClient(
+      self.rc = PooledRestClient(
         RINGCENTRAL_USER_CLIENT_ID,
         RINGCENTRAL_USER_CLIENT_SECRET,
         RINGCENTRAL_SERVER
       )
       self.platform = self.rc
+      if not id is None:
+        self.id = id
       if not token is None:
+        # token refreshed by another request in this process may be newer
+        token = tokenManager.current(self.id, token)
         self.token = token
         self.rc.token = token
-      if not groups is None:
-        self.groups = groups
+      self.groups = {} if groups is None else groups
       if not data is None:
         self.data = data
-      if not id is None:
-        self.id = id
+      # {id, expirationTime, filters} of webhook subscription
+      self.subscription = subscription
 
     id = ''
     groups = {}
@@ -83,7 +96,7 @@ def initUserClass(conf, dbAction):
     def auth(self, code):
       redirect_url = RINGCENTRAL_BOT_SERVER +'/user-oauth'
       self.rc.authorize(auth_code=code, redirect_uri=redirect_url)
-      self.token = self.rc.token
+      self.token = stampToken(self.rc.token)
       self.id = self.token['owner_id']
       self.writeToDb({
         'id': self.id,
@@ -92,45 +105,90 @@ def initUserClass(conf, dbAction):
         'data': self.data
       })
 
-    def refresh (self):
+    def doRefresh(self, token):
+      self.rc.token = token
+      self.rc.refresh()
+      self.token = stampToken(self.rc.token)
+      self.writeToDb(False)
+      # old refresh token is void now, store new one before anything else can fail
       try:
-        self.rc.refresh()
-        self.token = self.rc.token
+        flushNow()
+      except FlushError:
+        # refresh itself worked, so the user is kept, the save is retried when the event ends
         self.writeToDb(False)
-        return True
-      except Exception as e:
-        printError(e, 'user refrefresh token has expired')
-        removeUser(self.id)
+      return self.token
+
+    def useToken(self, token):
+      if token is None:
         return False
+      self.token = token
+      self.rc.token = token
+      return True
+
+    def onRefreshFailed(self, e):
+      printError(e, 'user refrefresh token has expired')
+      tokenManager.forget(self.id)
+      removeUser(self.id)
+      return False
+
+    def refresh (self):
+      '''
+      refresh token now, one refresh per user at a time in this process
+      '''
+      try:
+        return self.useToken(
+          tokenManager.refresh(self.id, self.token, self.doRefresh)
+        )
+      except Exception as e:
+        return self.onRefreshFailed(e)
+
+    def ensureToken(self, ahead = None):
+      '''
+      refresh token only if it expires within ahead seconds
+      (TOKEN_REFRESH_AHEAD by default), no api call otherwise
+      '''
+      if not canRefresh(self.token):
+        expire = expireTime(self.token)
+        return expire is None or expire > time.time()
+      try:
+        return self.useToken(
+          tokenManager.ensure(self.id, self.token, self.doRefresh, ahead)
+        )
+      except Exception as e:
+        return self.onRefreshFailed(e)
+
+    def saveSubscription(self, subscription):
+      self.subscription = subscription
+      dbAction('user', 'update', {
+        'id': self.id,
+        'update': {
+          'subscription': subscription
+        }
+      })
 
     def setupWebhook(self, event=None):
       try:
-        self.platform.post('/restapi/v1.0/subscription', {
-          'eventFilters': self.eventFilters,
-          'expiresIn': 1799,
-          'deliveryMode': {
-            'transportType': 'WebHook',
-            'address': RINGCENTRAL_BOT_SERVER + '/user-webhook'
-          }
-        })
+        self.saveSubscription(createSubscription(
+          self.platform,
+          RINGCENTRAL_BOT_SERVER + '/user-webhook',
+          self.eventFilters,
+          USER_SUBSCRIPTION_EXPIRES_IN
+        ))
       except Exception as e:
         printError(e, 'user setupWebhook')
 
     def renewWebHooks(self, event=None):
+      '''
+      renew cached subscription in place, see subscription.renewSubscription
+      '''
       try:
-        r = self.platform.get('/restapi/v1.0/subscription')
-        r = json.loads(r.text)['records']
-        filtered = list(filter(
-          lambda x: x['deliveryMode']['address'] == RINGCENTRAL_BOT_SERVER + '/user-webhook',
-          r
+        self.saveSubscription(renewSubscription(
+          self.platform,
+          self.subscription,
+          RINGCENTRAL_BOT_SERVER + '/user-webhook',
+          self.eventFilters,
+          USER_SUBSCRIPTION_EXPIRES_IN
         ))
-        debug(
-          'user subs list',
-          ','.join(list(map(lambda g: g['id'], filtered)))
-        )
-        self.setupWebhook(event)
-        for sub in filtered:
-          self.delSubscription(sub['id'])
 
       except Exception as e:
         printError(e, 'user renewWebHooks')
@@ -143,26 +201,50 @@ def initUserClass(conf, dbAction):
         printError(e, 'user delSubscription')
 
     def removeGroup(self, id):
-      self.groups.pop(id, None)
+      botId = self.groups.pop(id, None)
       self.writeToDb(False)
+      group_index.removeUserGroup(dbAction, botId, id, self.id)
 
     def addGroup (self, groupId, botId):
       hasNoGroup = len(self.groups.keys()) == 0
       self.groups[groupId] = botId
       self.writeToDb()
+      group_index.addUserGroup(dbAction, botId, groupId, self.id)
       if hasNoGroup:
         self.renewWebHooks()
 
     def validate (self):
+      '''
+      token with known expiry is refreshed ahead of time without api call,
+      older tokens are checked against api once and stamped as expiring now,
+      their real expiry is unknown, so the next check refreshes instead of calling api
+      '''
+      if not expireTime(self.token) is None:
+        return self.ensureToken()
       try:
         self.rc.get('/restapi/v1.0/account/~/extension/~')
-        return True
       except Exception as e:
         printError(e, 'user validate')
         return self.refresh()
+      if canRefresh(self.token):
+        self.token['expire_time'] = time.time()
+        self.writeToDb(False)
+      return True
 
+    async def arequest(self, method, *args, **kwargs):
+      '''
+      awaitable rest call, method: get, post, put, patch, delete
+      '''
+      return await runInThread(getattr(self.rc, method), *args, **kwargs)
 
-  def getUser(id):
+    async def avalidate(self):
+      return await runInThread(self.validate)
+
+    async def arefresh(self):
+      return await runInThread(self.refresh)
+
+
+  def loadUser(id):
     if RINGCENTRAL_USER_CLIENT_ID == '':
       return False
     userData = dbAction('user', 'get', {
@@ -173,14 +255,18 @@ def initUserClass(conf, dbAction):
         userData['id'],
         userData['token'],
         userData['groups'],
-        userData['data']
+        userData['data'],
+        userData.get('subscription')
       )
     else:
       return False
 
+  getUser = memoize('user', loadUser)
+
   def removeUser(id):
     if RINGCENTRAL_USER_CLIENT_ID == '':
       return False
+    forget('user', id)
     return dbAction('user', 'remove', {
       'id': id
     })
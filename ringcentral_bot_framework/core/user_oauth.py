@@ -4,6 +4,7 @@ user auth
 import time
 from .common import result, getQueryParam
 from pydash import get
+from .aio import callHook
 
 def initUserAuth(
   conf,
@@ -22,10 +23,10 @@ def initUserAuth(
     botId = get(arr, '[1]')
     bot = getBot(botId)
     user.addGroup(groupId, botId)
-    conf.userAuthSuccessAction(bot, groupId, user.id, dbAction)
-    conf.userAddGroupInfoAction(user, bot, groupId, dbAction)
+    callHook(conf.userAuthSuccessAction, bot, groupId, user.id, dbAction)
+    callHook(conf.userAddGroupInfoAction, user, bot, groupId, dbAction)
     return result(
-      conf.userAuthSuccessHtml(user, bot),
+      callHook(conf.userAuthSuccessHtml, user, bot),
       200,
       {
         'headers': {
@@ -1,14 +1,21 @@
-from .common import result, subscribeInterval
+from .common import result, subscribeInterval, SUBSCRIBE_THRESHOLD
 import time
 from pydash import get, is_dict
+from .aio import callHook
+from .user import USER_SUBSCRIPTION_EXPIRES_IN
+from .token_manager import TOKEN_REFRESH_AHEAD
+from .unit_of_work import unitOfWork
 
 subscribeIntervalText = subscribeInterval()
+# seconds between renew events of one user subscription
+renewTickInterval = USER_SUBSCRIPTION_EXPIRES_IN - SUBSCRIBE_THRESHOLD
 
 def initUserWebhook(
   conf,
   Bot, getBot,
   User, getUser,
-  dbAction
+  dbAction,
+  dedup
 ):
   def userWebhook(event):
     message = get(event, 'body')
@@ -23,26 +30,43 @@ def initUserWebhook(
       print('body not dict')
       return defaultResponse
 
+    if dedup.isDuplicate('user', message):
+      return defaultResponse
+
+    try:
+      with unitOfWork(dbAction):
+        handleEvent(event)
+    except:
+      # let RingCentral redeliver it
+      dedup.release('user', message)
+      raise
+    dedup.done('user', message)
+    return defaultResponse
+
+  def handleEvent(event):
+    message = get(event, 'body')
+    body = get(message, 'body')
     userId = get(body, 'extensionId') or get(message, 'ownerId')
     eventType = get(message, 'event')
     user = getUser(userId)
     isRenewEvent = eventType == subscribeIntervalText
 
     if not isinstance(user, User):
-      return defaultResponse
+      return
 
     if isRenewEvent:
-      user.renewWebHooks(event)
-      user.refresh()
-      return defaultResponse
+      # refresh only if token would expire before next renew tick
+      if user.ensureToken(renewTickInterval + TOKEN_REFRESH_AHEAD):
+        user.renewWebHooks(event)
 
     else:
-      conf.userEventAction(
+      callHook(
+        conf.userEventAction,
         user,
         eventType,
         event,
         getBot,
         dbAction
       )
-      return defaultResponse
+
   return userWebhook
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+bounded background worker pool
+used to run bot handlers after webhook already acknowledged,
+tasks are kept in memory only, queued ones are lost when process exits
+"""
+import time
+import queue
+import threading
+from collections import deque
+from .common import printError
+
+class Stat:
+  '''
+  count, sum and max of observed values
+  '''
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def observe(self, v):
+    self.count = self.count + 1
+    self.total = self.total + v
+    self.max = max(self.max, v)
+
+  def toDict(self):
+    return {
+      'count': self.count,
+      'avg': self.total / self.count if self.count else 0,
+      'max': self.max
+    }
+
+class WorkerPool:
+
+  def __init__(self, workers=8, queueSize=1000, name='rc-bot-worker'):
+    self.workers = workers
+    self.name = name
+    self.tasks = queue.Queue(maxsize=queueSize)
+    self.lock = threading.Lock()
+    self.started = False
+    self.active = 0
+    self.rejected = 0
+    self.failed = 0
+    self.wait = Stat()
+    self.duration = Stat()
+
+  def start(self):
+    with self.lock:
+      if self.started:
+        return
+      for i in range(self.workers):
+        threading.Thread(
+          target=self.run,
+          daemon=True,
+          name=f'{self.name}-{i}'
+        ).start()
+      self.started = True
+
+  def submit(self, func, *args):
+    '''
+    queue task, return False when queue is full
+    '''
+    self.start()
+    try:
+      self.tasks.put_nowait((time.monotonic(), func, args))
+      return True
+    except queue.Full:
+      with self.lock:
+        self.rejected = self.rejected + 1
+      return False
+
+  def run(self):
+    while True:
+      queued, func, args = self.tasks.get()
+      start = time.monotonic()
+      with self.lock:
+        self.active = self.active + 1
+        self.wait.observe(start - queued)
+      failed = False
+      try:
+        func(*args)
+      except Exception as e:
+        failed = True
+        printError(e, self.name)
+      finally:
+        with self.lock:
+          self.active = self.active - 1
+          self.duration.observe(time.monotonic() - start)
+          if failed:
+            self.failed = self.failed + 1
+        self.tasks.task_done()
+
+  def join(self):
+    '''
+    block until all queued tasks done
+    '''
+    self.tasks.join()
+
+  def stats(self):
+    with self.lock:
+      return {
+        'workers': self.workers,
+        'queueDepth': self.tasks.qsize(),
+        'queueSize': self.tasks.maxsize,
+        'active': self.active,
+        'rejected': self.rejected,
+        'failed': self.failed,
+        'waitSeconds': self.wait.toDict(),
+        'durationSeconds': self.duration.toDict()
+      }
+
+class KeyedExecutor:
+  '''
+  run tasks with same key one by one in submit order,
+  tasks with different keys run in parallel on shared WorkerPool
+  '''
+
+  def __init__(self, pool, keyQueueSize=100):
+    self.pool = pool
+    self.keyQueueSize = keyQueueSize
+    self.lock = threading.Lock()
+    # key: deque of (func, args), key present means a runner is scheduled or running
+    self.queues = {}
+    self.overflow = 0
+
+  def submit(self, key, func, *args):
+    '''
+    queue task after earlier tasks of same key,
+    return False when queue of the key or the pool is full,
+    task never runs in caller thread
+    '''
+    with self.lock:
+      pending = self.queues.get(key)
+      if not pending is None:
+        if len(pending) >= self.keyQueueSize:
+          self.overflow = self.overflow + 1
+          return False
+        pending.append((func, args))
+        return True
+      # pool.submit does not block, so holding the lock is cheap,
+      # and no later task of key can be queued without a runner
+      if not self.pool.submit(self.runKey, key):
+        self.overflow = self.overflow + 1
+        return False
+      self.queues[key] = deque([(func, args)])
+    return True
+
+  def runKey(self, key):
+    '''
+    run one task of key, then reschedule so busy keys do not starve others
+    '''
+    while True:
+      with self.lock:
+        pending = self.queues[key]
+        func, args = pending.popleft()
+      try:
+        func(*args)
+      except Exception as e:
+        printError(e, 'keyed executor')
+      with self.lock:
+        if len(self.queues[key]) == 0:
+          self.queues.pop(key)
+          return
+      if self.pool.submit(self.runKey, key):
+        return
+
+  def stats(self):
+    with self.lock:
+      depths = list(map(len, self.queues.values()))
+      return {
+        'keys': len(depths),
+        'pending': sum(depths),
+        'maxKeyDepth': max(depths) if depths else 0,
+        'keyQueueSize': self.keyQueueSize,
+        'overflow': self.overflow
+      }
@@ -0,0 +1,116 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import asyncio
+import time
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import aio
+from ringcentral_bot_framework.core.aio import callHook, runInThread
+import default_conf as conf
+framework = frameworkInit(conf)
+
+class TestAio(unittest.TestCase):
+
+  def test_arouter(self):
+    print('running aio arouter test')
+    res = asyncio.run(framework.arouter({
+      'pathParameters': {
+        'action': 'bot-webhook'
+      },
+      'headers': {
+        'validation-token': 'vt'
+      },
+      'body': None
+    }))
+    self.assertEqual(res['statusCode'], 200)
+    self.assertEqual(res['headers']['validation-token'], 'vt')
+
+  def test_call_hook(self):
+    async def hook(a, b):
+      await asyncio.sleep(0)
+      return a + b
+    self.assertEqual(callHook(hook, 1, 2), 3)
+    self.assertEqual(callHook(lambda a, b: a * b, 2, 3), 6)
+
+    async def inLoop():
+      return await runInThread(callHook, hook, 2, 2)
+    self.assertEqual(asyncio.run(inLoop()), 4)
+
+  def test_asgi_app(self):
+    print('running aio asgi test')
+    app = framework.asgiApp()
+    sent = []
+    async def receive():
+      return {
+        'type': 'http.request',
+        'body': b'',
+        'more_body': False
+      }
+    async def send(message):
+      sent.append(message)
+    asyncio.run(app({
+      'type': 'http',
+      'path': '/bot-webhook',
+      'query_string': b'',
+      'headers': [(b'validation-token', b'vt2')]
+    }, receive, send))
+    self.assertEqual(sent[0]['status'], 200)
+    self.assertIn((b'validation-token', b'vt2'), sent[0]['headers'])
+    self.assertEqual(sent[1]['body'], b'bot WebHook replied')
+
+class TestAioConcurrency(unittest.TestCase):
+
+  def setUp(self):
+    self.counts = (aio.ASYNC_WORKER_COUNT, aio.ASYNC_HELPER_COUNT)
+    self.executors = dict(aio.executorHolder)
+    aio.ASYNC_WORKER_COUNT = 2
+    aio.ASYNC_HELPER_COUNT = 2
+    aio.executorHolder.clear()
+
+  def tearDown(self):
+    aio.ASYNC_WORKER_COUNT, aio.ASYNC_HELPER_COUNT = self.counts
+    aio.executorHolder.clear()
+    aio.executorHolder.update(self.executors)
+
+  def test_hooks_awaiting_threads(self):
+    print('running aio concurrent hook test')
+    done = []
+    class AsyncHook:
+      @staticmethod
+      async def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handled):
+        # blocking call awaited while the pipeline thread waits for this hook
+        await runInThread(time.sleep, 0.05)
+        done.append(text)
+        return True
+    fw = frameworkInit(conf, [AsyncHook])
+    fw.dbAction('bot', 'add', {'id': 'aio1', 'token': {}, 'data': {}})
+    def event(i):
+      return {
+        'pathParameters': {
+          'action': 'bot-webhook'
+        },
+        'headers': {},
+        'body': {
+          'uuid': f'aio-concurrent-{i}',
+          'ownerId': 'aio1',
+          'body': {
+            'eventType': 'PostAdded',
+            'type': 'TextMessage',
+            'groupId': f'g{i}',
+            'creatorId': 'c1',
+            'text': str(i)
+          }
+        }
+      }
+    async def run():
+      return await asyncio.wait_for(
+        asyncio.gather(*map(lambda i: fw.arouter(event(i)), range(6))),
+        10
+      )
+    res = asyncio.run(run())
+    self.assertEqual(list(map(lambda r: r['statusCode'], res)), [200] * 6)
+    self.assertEqual(sorted(done), list(map(str, range(6))))
+    fw.removeBot('aio1')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from ringcentral_bot_framework.core.attachment import fetchAttachment, sniffType, AttachmentTooLarge, AttachmentTimeout
+from ringcentral_bot_framework.core.http_pool import HttpError
+from ringcentral_bot_framework.core.hidden_cmd import hiddenCmd
+
+png = b'\x89PNG\r\n\x1a\n' + b'\0' * 3000
+
+class Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    if self.path == '/missing':
+      self.send_response(404)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      return
+    if self.path == '/slow':
+      self.send_response(200)
+      self.send_header('Transfer-Encoding', 'chunked')
+      self.end_headers()
+      for i in range(5):
+        self.wfile.write(b'2\r\nab\r\n')
+        self.wfile.flush()
+        time.sleep(0.2)
+      self.wfile.write(b'0\r\n\r\n')
+      return
+    body = png if self.path == '/avatar.png' else b'plain text body'
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/octet-stream' if self.path == '/avatar.png' else 'text/plain')
+    if self.path != '/nolength':
+      self.send_header('Content-Length', str(len(body)))
+    else:
+      self.send_header('Connection', 'close')
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+class FakeBot:
+  id = 'b1'
+
+  def __init__(self):
+    self.sent = []
+    self.avatar = None
+
+  def fetchAttachment(self, attachment):
+    return fetchAttachment(attachment['contentUri'], attachment['name'])
+
+  def setAvatar(self, data, name, contentType):
+    self.avatar = (data.read(), name, contentType)
+
+  def sendMessage(self, groupId, msg):
+    self.sent.append(msg['text'])
+
+class TestAttachment(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+    cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+
+  def test_fetch(self):
+    print('running attachment fetch test')
+    with fetchAttachment(self.url + '/avatar.png', 'a.png') as file:
+      self.assertEqual(file.size, len(png))
+      self.assertEqual(file.contentType, 'image/png')
+      self.assertEqual(file.read(), png)
+    with fetchAttachment(self.url + '/doc') as file:
+      self.assertEqual(file.contentType, 'text/plain')
+
+  def test_limits(self):
+    print('running attachment limit test')
+    with self.assertRaises(AttachmentTooLarge):
+      fetchAttachment(self.url + '/avatar.png', maxBytes=100)
+    with self.assertRaises(AttachmentTooLarge):
+      fetchAttachment(self.url + '/nolength', maxBytes=5)
+    with self.assertRaises(AttachmentTimeout):
+      fetchAttachment(self.url + '/slow', timeout=0.3)
+    with self.assertRaises(HttpError):
+      fetchAttachment(self.url + '/missing')
+
+  def test_sniff(self):
+    print('running attachment sniff test')
+    self.assertEqual(sniffType(b'\xff\xd8\xff\xe0'), 'image/jpeg')
+    self.assertEqual(sniffType(b'RIFF\0\0\0\0WEBPVP8'), 'image/webp')
+    self.assertIsNone(sniffType(b'hello'))
+
+  def test_set_avatar_cmd(self):
+    print('running set avatar hidden command test')
+    bot = FakeBot()
+    text = '![:Person](b1) __setAvatar__'
+    def event(path):
+      return {'body': {'body': {'attachments': [{'contentUri': self.url + path, 'name': 'a.png'}]}}}
+    self.assertTrue(hiddenCmd(bot, 'g1', text, event('/avatar.png')))
+    self.assertEqual(bot.avatar, (png, 'a.png', 'image/png'))
+    self.assertEqual(bot.sent, ['Set avatar done'])
+    hiddenCmd(bot, 'g1', text, event('/doc'))
+    self.assertEqual(bot.sent[-1], 'Avatar must be an image, got text/plain')
+
+if __name__ == '__main__':
+  unittest.main()
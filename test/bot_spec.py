@@ -1,7 +1,11 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 import unittest
+import threading
+import time
 from ringcentral_bot_framework import frameworkInit
+import ringcentral_bot_framework.core.bot_webhook as bot_webhook
+import ringcentral_bot_framework.core.dedup as dedup
 import default_conf as conf
 framework = frameworkInit(conf)
 
@@ -38,5 +42,274 @@ class TestBot(unittest.TestCase):
     self.assertEqual(bot.token, bot2.token)
     self.assertEqual(bot.data, bot2.data)
 
+  def test_bot_cache(self):
+    print('running bot cache test')
+    bot = Bot()
+    bot.id = 'c1'
+    bot.writeToDb({
+      'id': bot.id,
+      'data': {},
+      'token': {'a': 1}
+    })
+    before = framework.botCacheStats()
+    bot2 = getBot('c1')
+    bot3 = getBot('c1')
+    stats = framework.botCacheStats()
+    self.assertEqual(stats['misses'], before['misses'] + 1)
+    self.assertEqual(stats['hits'], before['hits'] + 1)
+    # each call gets its own instance, changes never leak through the cache
+    self.assertIsNot(bot2, bot3)
+    self.assertEqual(bot2.token, bot3.token)
+    bot2.token['a'] = 2
+    self.assertEqual(getBot('c1').token, {'a': 1})
+    bot3.token = {'a': 3}
+    bot3.writeToDb()
+    self.assertEqual(getBot('c1').token, {'a': 3})
+    framework.removeBot('c1')
+    self.assertEqual(getBot('c1'), False)
+
+class RecordExtension:
+  handled = []
+
+  @staticmethod
+  def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handled):
+    RecordExtension.handled.append((text, threading.current_thread().name))
+    return True
+
+class TestBotWebhookAsync(unittest.TestCase):
+
+  def setUp(self):
+    bot_webhook.BOT_WEBHOOK_ASYNC = True
+
+  def tearDown(self):
+    bot_webhook.BOT_WEBHOOK_ASYNC = False
+
+  def test_async_webhook(self):
+    print('running bot webhook async test')
+    fw = frameworkInit(conf, [RecordExtension])
+    fw.dbAction('bot', 'add', {
+      'id': 'a1',
+      'token': {},
+      'data': {}
+    })
+    res = fw.router({
+      'pathParameters': {
+        'action': 'bot-webhook'
+      },
+      'headers': {},
+      'body': {
+        'ownerId': 'a1',
+        'body': {
+          'eventType': 'PostAdded',
+          'type': 'TextMessage',
+          'groupId': 'g1',
+          'creatorId': 'c1',
+          'text': 'hi'
+        }
+      }
+    })
+    self.assertEqual(res['statusCode'], 200)
+    for i in range(50):
+      if fw.botWorkerStats()['durationSeconds']['count'] > 0:
+        break
+      time.sleep(0.1)
+    self.assertEqual(len(RecordExtension.handled), 1)
+    text, threadName = RecordExtension.handled[0]
+    self.assertEqual(text, 'hi')
+    self.assertTrue(threadName.startswith('rc-bot-webhook'))
+    stats = fw.botWorkerStats()
+    self.assertEqual(stats['durationSeconds']['count'], 1)
+    self.assertEqual(stats['queueDepth'], 0)
+
+class BlockExtension:
+  release = threading.Event()
+  handled = []
+
+  @staticmethod
+  def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handled):
+    BlockExtension.release.wait(5)
+    BlockExtension.handled.append(text)
+    return True
+
+class TestBotWebhookOverflow(unittest.TestCase):
+
+  def setUp(self):
+    self.size = bot_webhook.BOT_KEY_QUEUE_SIZE
+    bot_webhook.BOT_WEBHOOK_ASYNC = True
+    bot_webhook.BOT_KEY_QUEUE_SIZE = 0
+
+  def tearDown(self):
+    bot_webhook.BOT_WEBHOOK_ASYNC = False
+    bot_webhook.BOT_KEY_QUEUE_SIZE = self.size
+
+  def test_overflow_redelivered(self):
+    print('running bot webhook overflow test')
+    fw = frameworkInit(conf, [BlockExtension])
+    fw.dbAction('bot', 'add', {
+      'id': 'o1',
+      'token': {},
+      'data': {}
+    })
+    def send(uuid):
+      return fw.router({
+        'pathParameters': {
+          'action': 'bot-webhook'
+        },
+        'headers': {},
+        'body': {
+          'uuid': uuid,
+          'ownerId': 'o1',
+          'body': {
+            'eventType': 'PostAdded',
+            'type': 'TextMessage',
+            'groupId': 'g1',
+            'creatorId': 'c1',
+            'text': uuid
+          }
+        }
+      })
+    self.assertEqual(send('o-1')['statusCode'], 200)
+    # same group is busy, not run out of order in request thread
+    self.assertEqual(send('o-2')['statusCode'], 503)
+    BlockExtension.release.set()
+    for i in range(50):
+      if fw.botWorkerStats()['ordered']['keys'] == 0:
+        break
+      time.sleep(0.1)
+    self.assertEqual(BlockExtension.handled, ['o-1'])
+    # redelivery is not taken for a duplicate
+    self.assertEqual(send('o-2')['statusCode'], 200)
+    for i in range(50):
+      if len(BlockExtension.handled) == 2:
+        break
+      time.sleep(0.1)
+    self.assertEqual(BlockExtension.handled, ['o-1', 'o-2'])
+
+class TestBotWebhookDedup(unittest.TestCase):
+
+  def test_dedup(self):
+    print('running bot webhook dedup test')
+    fw = frameworkInit(conf, [RecordExtension])
+    fw.dbAction('bot', 'add', {
+      'id': 'd1',
+      'token': {},
+      'data': {}
+    })
+    before = len(RecordExtension.handled)
+    def send(uuid):
+      return fw.router({
+        'pathParameters': {
+          'action': 'bot-webhook'
+        },
+        'headers': {},
+        'body': {
+          'uuid': uuid,
+          'ownerId': 'd1',
+          'body': {
+            'id': 'p1',
+            'eventType': 'PostAdded',
+            'type': 'TextMessage',
+            'groupId': 'g1',
+            'creatorId': 'c1',
+            'text': 'dedup'
+          }
+        }
+      })
+    self.assertEqual(send('u1')['statusCode'], 200)
+    self.assertEqual(send('u1')['statusCode'], 200)
+    self.assertEqual(len(RecordExtension.handled), before + 1)
+    send('u2')
+    self.assertEqual(len(RecordExtension.handled), before + 2)
+    stats = fw.dedupStats()
+    self.assertEqual(stats['checked'], 3)
+    self.assertEqual(stats['duplicates'], 1)
+
+  def test_failed_event_redelivered(self):
+    print('running bot webhook dedup release test')
+    calls = []
+    class FailOnce:
+      @staticmethod
+      def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handled):
+        calls.append(text)
+        if len(calls) == 1:
+          raise Exception('handler failed')
+        return True
+    fw = frameworkInit(conf, [FailOnce])
+    fw.dbAction('bot', 'add', {'id': 'd2', 'token': {}, 'data': {}})
+    event = {
+      'pathParameters': {
+        'action': 'bot-webhook'
+      },
+      'headers': {},
+      'body': {
+        'uuid': 'fail1',
+        'ownerId': 'd2',
+        'body': {
+          'id': 'p2',
+          'eventType': 'PostAdded',
+          'type': 'TextMessage',
+          'groupId': 'g1',
+          'creatorId': 'c1',
+          'text': 'fail'
+        }
+      }
+    }
+    with self.assertRaises(Exception):
+      fw.router(event)
+    self.assertEqual(fw.router(event)['statusCode'], 200)
+    self.assertEqual(fw.router(event)['statusCode'], 200)
+    self.assertEqual(len(calls), 2)
+    fw.removeBot('d2')
+
+class TestSharedDedup(unittest.TestCase):
+
+  def setUp(self):
+    self.shared = dedup.WEBHOOK_DEDUP_SHARED
+    dedup.WEBHOOK_DEDUP_SHARED = True
+    # webhookEvent table is only created in shared mode
+    self.action = frameworkInit(conf).dbAction
+
+  def tearDown(self):
+    dedup.WEBHOOK_DEDUP_SHARED = self.shared
+
+  def test_claim_across_processes(self):
+    print('running shared dedup test')
+    # two instances stand for two server processes sharing db
+    a = dedup.Dedup(self.action)
+    b = dedup.Dedup(self.action)
+    message = {'uuid': 'shared1'}
+    self.action(dedup.tableName, 'remove', {'id': 'bot_shared1'})
+    self.assertFalse(a.isDuplicate('bot', message))
+    self.assertTrue(b.isDuplicate('bot', message))
+    # handler failed in a, redelivery goes to b
+    a.release('bot', message)
+    self.assertFalse(b.isDuplicate('bot', message))
+    b.done('bot', message)
+    self.assertTrue(a.isDuplicate('bot', message))
+    record = self.action(dedup.tableName, 'get', {'id': 'bot_shared1'})
+    self.assertTrue(record['expire'] > time.time() + dedup.WEBHOOK_DEDUP_TTL - 60)
+    # claim of a dead process expires
+    self.action(dedup.tableName, 'update', {'id': 'bot_shared1', 'update': {'expire': time.time() - 1}})
+    self.assertFalse(dedup.Dedup(self.action).isDuplicate('bot', message))
+    self.action(dedup.tableName, 'remove', {'id': 'bot_shared1'})
+
+  def test_purge(self):
+    print('running shared dedup purge test')
+    now = time.time()
+    self.action(dedup.tableName, 'batchAdd', {'items': [
+      {'id': 'purge1', 'expire': now - 10},
+      {'id': 'purge2', 'expire': now + 600}
+    ]})
+    d = dedup.Dedup(self.action)
+    d.purge()
+    self.assertEqual(len(self.action(dedup.tableName, 'batchGet', {'ids': ['purge1', 'purge2']})), 2)
+    while True:
+      d.purge(True)
+      if d.purgeCursor is None:
+        break
+    ids = list(map(lambda r: r['id'], self.action(dedup.tableName, 'batchGet', {'ids': ['purge1', 'purge2']})))
+    self.assertEqual(ids, ['purge2'])
+    self.action(dedup.tableName, 'remove', {'id': 'purge2'})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
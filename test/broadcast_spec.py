@@ -0,0 +1,80 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import rate_limit
+import default_conf as conf
+framework = frameworkInit(conf)
+
+rate_limit.RATE_LIMIT_RETRY_BASE = 0.01
+busy = {
+  'count': 0
+}
+
+class Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def reply(self, status, body, headers = {}):
+    body = json.dumps(body).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Length', str(len(body)))
+    for k, v in headers.items():
+      self.send_header(k, v)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_POST(self):
+    self.rfile.read(int(self.headers.get('Content-Length') or 0))
+    groupId = self.path.split('/')[-2]
+    time.sleep(0.2)
+    if groupId == 'bad':
+      return self.reply(403, {'errorCode': 'CMN-401'})
+    if groupId == 'busy' and busy['count'] == 0:
+      busy['count'] = 1
+      return self.reply(429, {}, {'Retry-After': '0'})
+    self.reply(200, {'id': 'p-' + groupId})
+
+  def log_message(self, *args):
+    pass
+
+class TestBroadcast(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+  def bot(self):
+    Bot = framework.Bot()
+    bot = Bot('broadcast-bot', {'access_token': 't'}, {})
+    bot.rc.server = f'http://127.0.0.1:{self.server.server_port}'
+    return bot
+
+  def test_fan_out(self):
+    print('running broadcast fan out test')
+    bot = self.bot()
+    groups = list(map(lambda i: f'g{i}', range(8)))
+    start = time.monotonic()
+    res = bot.broadcast(groups + ['g0'], {'text': 'hi'})
+    took = time.monotonic() - start
+    self.assertEqual(res['sent'], 8)
+    self.assertEqual(res['groups']['g3'], {'status': 'sent', 'postId': 'p-g3'})
+    # sequential would take 8 * 0.2s
+    self.assertTrue(took < 0.2 * 4, took)
+
+  def test_partial_failure(self):
+    print('running broadcast partial failure test')
+    bot = self.bot()
+    res = bot.broadcast(['ok', 'bad', 'busy'], {'text': 'hi'})
+    self.assertEqual(res['groups']['ok']['status'], 'sent')
+    self.assertEqual(res['groups']['bad']['status'], 'failed')
+    self.assertIn('403', res['groups']['bad']['error'])
+    self.assertEqual(res['groups']['busy']['status'], 'queued')
+    self.assertEqual((res['sent'], res['failed'], res['queued']), (1, 1, 1))
+
+if __name__ == '__main__':
+  unittest.main()
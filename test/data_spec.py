@@ -0,0 +1,104 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import asyncio
+import json
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import data
+import default_conf as conf
+framework = frameworkInit(conf)
+data.disabled = False
+
+def view(query):
+  return framework.router({
+    'pathParameters': {
+      'action': 'data'
+    },
+    'queryStringParameters': query,
+    'body': '{}'
+  })
+
+class TestDataView(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    framework.dbAction('user', 'batchAdd', {
+      'items': list(map(lambda i: {
+        'id': f'dv{i:02d}',
+        'token': {
+          'access_token': 'secret-token'
+        },
+        'groups': {},
+        'data': {
+          'name': f'n{i}',
+          'apiSecret': 'x'
+        }
+      }, range(7)))
+    })
+
+  @classmethod
+  def tearDownClass(cls):
+    framework.dbAction('user', 'batchRemove', {
+      'ids': list(map(lambda i: f'dv{i:02d}', range(7)))
+    })
+
+  def test_json_pages(self):
+    print('running data view json page test')
+    res = view({'tableName': 'user', 'format': 'json', 'limit': '4', 'cursor': 'dv'})
+    self.assertEqual(res['statusCode'], 200)
+    self.assertFalse(isinstance(res['body'], str))
+    page = json.loads(''.join(res['body']))
+    self.assertEqual(list(map(lambda r: r['id'], page['items'])), ['dv00', 'dv01', 'dv02', 'dv03'])
+    self.assertEqual(page['items'][0]['token'], '[redacted]')
+    self.assertEqual(page['items'][0]['data']['apiSecret'], '[redacted]')
+    page = json.loads(''.join(view({
+      'tableName': 'user', 'format': 'json', 'limit': '4', 'cursor': page['cursor']
+    })['body']))
+    self.assertEqual(list(map(lambda r: r['id'], page['items']))[0:3], ['dv04', 'dv05', 'dv06'])
+
+  def test_projection_and_ids(self):
+    print('running data view projection test')
+    res = view({'tableName': 'user', 'format': 'json', 'id': 'dv01,dv03', 'fields': 'id,data.name'})
+    page = json.loads(''.join(res['body']))
+    self.assertEqual(page['items'], [
+      {'id': 'dv01', 'data': {'name': 'n1'}},
+      {'id': 'dv03', 'data': {'name': 'n3'}}
+    ])
+    # no way to turn redaction off
+    res = view({'tableName': 'user', 'format': 'json', 'id': 'dv01', 'redact': 'no'})
+    page = json.loads(''.join(res['body']))
+    self.assertEqual(page['items'][0]['token'], '[redacted]')
+    # query only on schema fields
+    self.assertEqual(view({'tableName': 'user', 'key': 'a = b or c', 'value': 'x'})['statusCode'], 400)
+
+  def test_html_and_asgi_stream(self):
+    print('running data view html stream test')
+    res = view({'tableName': 'user', 'limit': '2', 'cursor': 'dv'})
+    text = ''.join(res['body'])
+    self.assertIn('cursor=dv01', text)
+    self.assertNotIn('secret-token', text)
+    self.assertEqual(view({'tableName': 'nope'})['statusCode'], 400)
+    app = framework.asgiApp()
+    sent = []
+    async def receive():
+      return {
+        'type': 'http.request',
+        'body': b'',
+        'more_body': False
+      }
+    async def send(message):
+      sent.append(message)
+    asyncio.run(app({
+      'type': 'http',
+      'path': '/data',
+      'query_string': b'tableName=user&format=json&limit=3&cursor=dv',
+      'headers': []
+    }, receive, send))
+    self.assertEqual(sent[0]['status'], 200)
+    self.assertTrue(len(sent) > 3)
+    self.assertTrue(sent[1]['more_body'])
+    body = b''.join(map(lambda m: m.get('body', b''), sent[1:]))
+    self.assertEqual(len(json.loads(body)['items']), 3)
+
+if __name__ == '__main__':
+  unittest.main()
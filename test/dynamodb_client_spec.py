@@ -0,0 +1,112 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+from ringcentral_bot_framework.core import dynamodb
+from ringcentral_bot_framework.core.jobs import jobTable
+
+class ResourceNotFoundException(Exception):
+  pass
+
+class ResourceInUseException(Exception):
+  pass
+
+class Exceptions:
+  pass
+Exceptions.ResourceNotFoundException = ResourceNotFoundException
+Exceptions.ResourceInUseException = ResourceInUseException
+
+class FakeClient:
+  '''
+  stub of boto3 dynamodb client, records calls
+  '''
+
+  def __init__(self):
+    self.exceptions = Exceptions
+    self.calls = []
+    self.tables = {}
+    self.lost = set()
+
+  def describe_table(self, TableName):
+    self.calls.append(('describe_table', TableName))
+    if not TableName in self.tables:
+      raise ResourceNotFoundException(TableName)
+    return {'Table': {'TableStatus': self.tables[TableName]}}
+
+  def create_table(self, TableName, **kwargs):
+    self.calls.append(('create_table', TableName))
+    self.tables[TableName] = 'CREATING'
+
+  def get_waiter(self, name):
+    client = self
+    class Waiter:
+      def wait(self, TableName, WaiterConfig):
+        client.calls.append(('wait', TableName))
+        client.tables[TableName] = 'ACTIVE'
+    return Waiter()
+
+  def describe_time_to_live(self, TableName):
+    return {'TimeToLiveDescription': {'TimeToLiveStatus': 'ENABLED'}}
+
+  def put_item(self, TableName, Item):
+    self.calls.append(('put_item', TableName))
+    if TableName in self.lost:
+      # table deleted behind the cached readiness
+      self.lost.discard(TableName)
+      self.tables.pop(TableName, None)
+      raise ResourceNotFoundException(TableName)
+
+  def scan(self, **params):
+    self.calls.append(('scan', params))
+    return {'Items': []}
+
+class Conf:
+  def dbTables():
+    return [jobTable()]
+
+class TestDynamodbClient(unittest.TestCase):
+
+  def setUp(self):
+    self.client = FakeClient()
+    self.saved = dict(dynamodb.clientHolder)
+    dynamodb.clientHolder['client'] = self.client
+    self.db = dynamodb.initDB(Conf)
+    self.name = dynamodb.prefix + '_job'
+
+  def tearDown(self):
+    dynamodb.clientHolder.clear()
+    dynamodb.clientHolder.update(self.saved)
+
+  def names(self):
+    return list(map(lambda call: call[0], self.client.calls))
+
+  def test_create_wait_ready(self):
+    print('running dynamodb table create test')
+    self.assertEqual(self.db('job', 'add', {'id': 'j1', 'runAt': 1}), 'add')
+    self.assertEqual(self.names(), ['describe_table', 'create_table', 'wait', 'put_item'])
+    # readiness is cached, no describe per action
+    self.client.calls.clear()
+    self.assertEqual(self.db('job', 'add', {'id': 'j2', 'runAt': 2}), 'add')
+    self.assertEqual(self.names(), ['put_item'])
+
+  def test_resource_not_found_recheck(self):
+    print('running dynamodb table re-check test')
+    self.db('job', 'add', {'id': 'j1', 'runAt': 1})
+    self.client.calls.clear()
+    self.client.lost.add(self.name)
+    self.assertEqual(self.db('job', 'add', {'id': 'j1', 'runAt': 1}), 'add')
+    self.assertEqual(
+      self.names(),
+      ['put_item', 'describe_table', 'create_table', 'wait', 'put_item']
+    )
+
+  def test_query_value_types(self):
+    print('running dynamodb query value type test')
+    self.db('job', 'get', {'key': 'runAt', 'value': 5})
+    self.db('job', 'page', {'limit': 10, 'key': 'type', 'value': 'renew'})
+    scans = list(map(lambda call: call[1], filter(lambda call: call[0] == 'scan', self.client.calls)))
+    self.assertEqual(scans[0]['ExpressionAttributeValues'], {':a': {'N': '5.0'}})
+    self.assertEqual(scans[0]['ExpressionAttributeNames'], {'#k': 'runAt'})
+    self.assertEqual(scans[1]['ExpressionAttributeValues'], {':a': {'S': 'renew'}})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,6 +1,7 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 import unittest
+import pydash as _
 from ringcentral_bot_framework import frameworkInit
 import default_conf as conf
 framework = frameworkInit(conf)
@@ -50,5 +51,71 @@ class TestDynamodbMethods(unittest.TestCase):
     x2 = action('bot', 'get', { 'key': 'x', 'value': 'c' })
     self.assertEqual(x2[0]['x'], 'c')
     self.assertEqual(len(x2), 2)
+    # query key is a schema field, never part of the expression
+    self.assertEqual(action('bot', 'get', { 'key': 'x = :a or id', 'value': 'c' }), False)
+    self.assertEqual(action('bot', 'page', { 'limit': 10, 'key': 'nope', 'value': 'c' }), False)
+
+  def test_scan_stream(self):
+    print('running dynamodb scan stream test')
+    ids = list(map(lambda i: f'scan{i}', range(30)))
+    for id in ids:
+      action('user', 'add', {
+        'id': id,
+        'groups': {}
+      })
+    res = action('user', 'get', { 'stream': True })
+    self.assertFalse(isinstance(res, list))
+    found = set(map(lambda x: x['id'], res))
+    self.assertTrue(set(ids).issubset(found))
+    res = action('user', 'get', { 'segments': 4 })
+    found = set(map(lambda x: x['id'], res))
+    self.assertTrue(set(ids).issubset(found))
+    # failing to start the scan returns False like other actions
+    self.assertEqual(action('noSuchTable', 'get', { 'stream': True }), False)
+
+  def test_batch_dynamodb(self):
+    print('running dynamodb batch test')
+    ids = list(map(lambda i: f'batch{i}', range(40)))
+    x = action('user', 'batchAdd', {
+      'items': list(map(lambda id: { 'id': id, 'groups': {} }, ids))
+    })
+    self.assertEqual(x, 'batchAdd')
+    x2 = action('user', 'batchGet', { 'ids': ids + ['nobatch'] })
+    self.assertEqual(len(x2), 40)
+    action('user', 'batchRemove', { 'ids': ids })
+    self.assertEqual(action('user', 'batchGet', { 'ids': ids }), [])
+
+  def test_page_dynamodb(self):
+    print('running dynamodb page test')
+    ids = list(map(lambda i: f'page{i}', range(25)))
+    action('user', 'batchAdd', {
+      'items': list(map(lambda id: { 'id': id, 'groups': {} }, ids))
+    })
+    seen = []
+    cursor = None
+    while True:
+      res = action('user', 'page', { 'limit': 10, 'cursor': cursor })
+      self.assertTrue(len(res['items']) <= 10)
+      seen = seen + list(map(lambda r: r['id'], res['items']))
+      cursor = res['cursor']
+      if cursor is None:
+        break
+    self.assertTrue(set(ids).issubset(set(seen)))
+    self.assertEqual(len(seen), len(set(seen)))
+    action('user', 'batchRemove', { 'ids': ids })
+
+  def test_lease_dynamodb(self):
+    print('running dynamodb lease test')
+    lease = lambda data: action('bot', 'lease', _.assign({ 'id': 'lease1', 'key': 'until' }, data))
+    action('bot', 'remove', { 'id': 'lease1' })
+    self.assertFalse(lease({ 'until': 20, 'now': 10 }))
+    self.assertTrue(lease({ 'until': 20, 'now': 10, 'create': True }))
+    self.assertFalse(lease({ 'until': 30, 'now': 15, 'create': True }))
+    self.assertTrue(lease({ 'until': 40, 'now': 25, 'update': { 'n': 'x' } }))
+    record = action('bot', 'get', { 'id': 'lease1' })
+    self.assertEqual(record['until'], 40)
+    self.assertEqual(record['n'], 'x')
+    action('bot', 'remove', { 'id': 'lease1' })
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import types
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core.extensions import ExtensionDispatcher
+from ringcentral_bot_framework.core.tracing import stageStats
+import default_conf as conf
+
+calls = []
+
+def makeExtension(name, handled, route = None):
+  ext = types.ModuleType(name)
+  ext.name = name
+  def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handledByPrevious):
+    calls.append((name, handledByPrevious))
+    return handled
+  ext.botGotPostAddAction = botGotPostAddAction
+  if not route is None:
+    ext.route = route
+  return ext
+
+class TestExtensions(unittest.TestCase):
+
+  def setUp(self):
+    calls.clear()
+
+  def test_run_all(self):
+    print('running extension dispatch test')
+    dispatcher = ExtensionDispatcher([
+      makeExtension('ext_a', False),
+      makeExtension('ext_b', True),
+      makeExtension('ext_c', False)
+    ], False)
+    self.assertTrue(dispatcher.run('botGotPostAddAction', 1, 2, 3, 4, 'hi', None, {}))
+    self.assertEqual(calls, [('ext_a', False), ('ext_b', False), ('ext_c', True)])
+    self.assertFalse(dispatcher.run('onInteractiveMessage', 1, 2, 3, 4, None, {}))
+    self.assertIn('extension.ext_b.botGotPostAddAction', stageStats())
+
+  def test_short_circuit(self):
+    print('running extension short circuit test')
+    dispatcher = ExtensionDispatcher([
+      makeExtension('ext_a', True),
+      makeExtension('ext_b', True)
+    ], True)
+    self.assertTrue(dispatcher.run('botGotPostAddAction', 1, 2, 3, 4, 'hi', None, {}))
+    self.assertEqual(calls, [('ext_a', False)])
+
+  def test_route(self):
+    print('running extension route test')
+    ext = makeExtension('ext_route', False, lambda event, framework: {
+      'statusCode': 200,
+      'body': 'ext'
+    } if event['pathParameters']['action'] == 'ext-custom' else None)
+    framework = frameworkInit(conf, [makeExtension('ext_plain', False), ext])
+    res = framework.router({
+      'pathParameters': {
+        'action': 'ext-custom'
+      }
+    })
+    self.assertEqual(res['body'], 'ext')
+    res = framework.router({
+      'pathParameters': {
+        'action': 'unknown'
+      },
+      'body': '{}'
+    })
+    self.assertEqual(res['statusCode'], 200)
+
+if __name__ == '__main__':
+  unittest.main()
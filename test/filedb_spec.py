@@ -2,7 +2,10 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 import unittest
 import pydash as _
+import multiprocessing
+import threading
 from ringcentral_bot_framework import frameworkInit
+import ringcentral_bot_framework.core.filedb as filedb
 import default_conf as conf
 framework = frameworkInit(conf)
 DBNAME = 'filedb'
@@ -38,5 +41,170 @@ class TestFiledbMethods(unittest.TestCase):
     )
     self.assertEqual(xx2['fg'], 'sdf')
 
+  def test_batch_filedb(self):
+    print('running filedb batch test')
+    x = action('user', 'batchAdd', {'items': [
+      {'id': 'b1', 'groups': {}},
+      {'id': 'b2', 'groups': {'g': 'bot'}}
+    ]})
+    self.assertEqual(x, 'batchAdd')
+    x2 = action('user', 'batchGet', {'ids': ['b1', 'b2', 'b3']})
+    self.assertEqual(sorted(map(lambda r: r['id'], x2)), ['b1', 'b2'])
+    action('user', 'batchRemove', {'ids': ['b1', 'b2', 'b3']})
+    self.assertEqual(action('user', 'batchGet', {'ids': ['b1', 'b2']}), [])
+
+def updateMany(worker, count):
+  for i in range(count):
+    action('bot', 'update', {'id': 'locked', 'update': {f'w{worker}_{i}': i}})
+
+class TestFiledbLock(unittest.TestCase):
+
+  @unittest.skipIf(filedb.fcntl is None, 'no fcntl')
+  def test_concurrent_update_processes(self):
+    print('running filedb multi process update test')
+    action('bot', 'add', {'id': 'locked'})
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=updateMany, args=(w, 30)) for w in range(4)]
+    for p in procs:
+      p.start()
+    for p in procs:
+      p.join()
+    record = action('bot', 'get', {'id': 'locked'})
+    self.assertEqual(len(record.keys()), 4 * 30 + 1)
+    action('bot', 'remove', {'id': 'locked'})
+
+  def test_ready_route(self):
+    print('running health route test')
+    res = framework.router({'pathParameters': {'action': 'health'}, 'body': '{}'})
+    self.assertEqual(res['statusCode'], 200)
+    res = framework.router({'pathParameters': {'action': 'ready'}, 'body': '{}'})
+    self.assertEqual(res['statusCode'], 200)
+
+class TestFiledbPage(unittest.TestCase):
+
+  def test_page(self):
+    print('running filedb page test')
+    ids = list(map(lambda i: f'pg{i:02d}', range(12)))
+    action('user', 'batchAdd', {'items': list(map(
+      lambda id: {'id': id, 'kind': 'a' if id < 'pg05' else 'b'},
+      ids
+    ))})
+    res = action('user', 'page', {'limit': 5})
+    self.assertEqual(list(map(lambda r: r['id'], res['items'])), ids[0:5])
+    res = action('user', 'page', {'limit': 5, 'cursor': res['cursor']})
+    self.assertEqual(list(map(lambda r: r['id'], res['items'])), ids[5:10])
+    res = action('user', 'page', {'limit': 5, 'cursor': res['cursor']})
+    self.assertEqual(list(map(lambda r: r['id'], res['items'])), ids[10:12])
+    self.assertIsNone(res['cursor'])
+    res = action('user', 'page', {'limit': 10, 'key': 'kind', 'value': 'b'})
+    self.assertEqual(list(map(lambda r: r['id'], res['items'])), ids[5:12])
+    action('user', 'batchRemove', {'ids': ids})
+
+def checkLease(test, db, id):
+  db('bot', 'remove', {'id': id})
+  test.assertFalse(db('bot', 'lease', {'id': id, 'key': 'until', 'until': 20, 'now': 10}))
+  test.assertTrue(db('bot', 'lease', {'id': id, 'key': 'until', 'until': 20, 'now': 10, 'create': True}))
+  test.assertFalse(db('bot', 'lease', {'id': id, 'key': 'until', 'until': 30, 'now': 15, 'create': True}))
+  test.assertTrue(db('bot', 'lease', {'id': id, 'key': 'until', 'until': 40, 'now': 25, 'update': {'n': 1}}))
+  record = db('bot', 'get', {'id': id})
+  test.assertEqual(record['until'], 40)
+  test.assertEqual(record['n'], 1)
+  db('bot', 'remove', {'id': id})
+
+class TestFiledbLease(unittest.TestCase):
+
+  def test_lease(self):
+    print('running filedb lease test')
+    checkLease(self, action, 'lease1')
+
+class TestFiledbMemoryMode(unittest.TestCase):
+
+  def setUp(self):
+    self.mode = filedb.FILEDB_MODE
+    self.interval = filedb.FILEDB_FLUSH_INTERVAL
+    filedb.FILEDB_MODE = 'memory'
+    filedb.FILEDB_FLUSH_INTERVAL = 0
+
+  def tearDown(self):
+    filedb.FILEDB_MODE = self.mode
+    filedb.FILEDB_FLUSH_INTERVAL = self.interval
+
+  def test_memory_filedb(self):
+    print('running filedb memory mode test')
+    mem = filedb.initDB(conf)
+    x = mem('bot', 'add', {'id': 'm1', 'token': {'a': 1}})
+    self.assertEqual(x, 'add')
+    mem('bot', 'update', {'id': 'm1', 'update': {'x': 'c'}})
+    x2 = mem('bot', 'get', {'id': 'm1'})
+    self.assertEqual(x2['x'], 'c')
+    x2['x'] = 'changed'
+    self.assertEqual(mem('bot', 'get', {'id': 'm1'})['x'], 'c')
+    # persisted, readable by file mode
+    filedb.FILEDB_MODE = 'file'
+    x3 = action('bot', 'get', {'id': 'm1'})
+    self.assertEqual(x3['token']['a'], 1)
+    self.assertEqual(x3['x'], 'c')
+    filedb.FILEDB_MODE = 'memory'
+    all = mem('bot', 'get')
+    self.assertTrue(any(map(lambda r: r['id'] == 'm1', all)))
+    mem('bot', 'batchAdd', {'items': [{'id': 'm2'}, {'id': 'm3'}]})
+    self.assertEqual(len(mem('bot', 'batchGet', {'ids': ['m1', 'm2', 'm3', 'm4']})), 3)
+    res = mem('bot', 'page', {'limit': 2, 'cursor': 'm0'})
+    self.assertEqual(list(map(lambda r: r['id'], res['items'])), ['m1', 'm2'])
+    self.assertEqual(mem('bot', 'page', {'limit': 2, 'cursor': res['cursor']})['items'][0]['id'], 'm3')
+    mem('bot', 'batchRemove', {'ids': ['m2', 'm3']})
+    self.assertEqual(len(mem('bot', 'batchGet', {'ids': ['m2', 'm3']})), 0)
+    mem('bot', 'remove', {'id': 'm1'})
+    self.assertEqual(mem('bot', 'get', {'id': 'm1'}), False)
+    self.assertFalse(os.path.exists(os.path.join(filedb.dbPath, 'bot', 'm1.json')))
+
+  def test_memory_lease(self):
+    print('running filedb memory mode lease test')
+    checkLease(self, filedb.initDB(conf), 'lease2')
+
+  def test_concurrent_flush_order(self):
+    print('running filedb memory mode concurrent flush test')
+    mem = filedb.initDB(conf)
+    mem('bot', 'add', {'id': 'm5', 'n': 0})
+    def run(w):
+      for i in range(20):
+        mem('bot', 'update', {'id': 'm5', 'update': {f'w{w}': i}})
+    threads = [threading.Thread(target=run, args=(w,)) for w in range(4)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    # disk has the latest record, no temp files left behind
+    filedb.FILEDB_MODE = 'file'
+    record = action('bot', 'get', {'id': 'm5'})
+    filedb.FILEDB_MODE = 'memory'
+    self.assertEqual(record, mem('bot', 'get', {'id': 'm5'}))
+    names = os.listdir(os.path.join(filedb.dbPath, 'bot'))
+    self.assertEqual(list(filter(lambda x: x.endswith('.tmp'), names)), [])
+    mem('bot', 'remove', {'id': 'm5'})
+
+  def test_memory_flush_syncs(self):
+    print('running filedb memory mode flush sync test')
+    mem = filedb.initDB(conf)
+    mem('bot', 'get')
+    fsync = os.fsync
+    synced = []
+    def record(fd):
+      synced.append(fd)
+      return fsync(fd)
+    os.fsync = record
+    try:
+      mem('bot', 'batchAdd', {'items': [{'id': 'm6'}, {'id': 'm7'}, {'id': 'm8'}]})
+      # records written without fsync, then one fsync of the table folder
+      self.assertEqual(len(synced), 1)
+      mem('bot', 'get', {'id': 'm6'})
+      mem('bot', 'batchGet', {'ids': ['m6', 'm7']})
+      mem('bot', 'page', {'limit': 2})
+      # reads flush nothing
+      self.assertEqual(len(synced), 1)
+    finally:
+      os.fsync = fsync
+    mem('bot', 'batchRemove', {'ids': ['m6', 'm7', 'm8']})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
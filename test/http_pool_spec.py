@@ -0,0 +1,45 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from ringcentral_bot_framework.core.http_pool import PooledRestClient, poolStats, resetSession
+
+class Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    body = self.headers.get('Authorization').encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+class TestHttpPool(unittest.TestCase):
+
+  def test_reuse(self):
+    print('running http pool test')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    resetSession()
+    rc1 = PooledRestClient('a', 'b', url)
+    rc1.token = {'access_token': 't1'}
+    rc2 = PooledRestClient('a', 'b', url)
+    rc2.token = {'access_token': 't2'}
+    before = poolStats()
+    self.assertEqual(rc1.get('/x').text, 'Bearer t1')
+    self.assertEqual(rc2.get('/x').text, 'Bearer t2')
+    self.assertEqual(rc1.get('/x').text, 'Bearer t1')
+    stats = poolStats()
+    self.assertEqual(stats['requests'] - before['requests'], 3)
+    self.assertEqual(stats['connectionsOpened'] - before['connectionsOpened'], 1)
+    self.assertEqual(stats['connectionsReused'] - before['connectionsReused'], 2)
+    resetSession()
+    server.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+import threading
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import jobs
+from ringcentral_bot_framework.core.jobs import JobQueue, RetryJob
+import default_conf as conf
+framework = frameworkInit(conf)
+dbAction = framework.dbAction
+
+jobs.JOB_POLL_INTERVAL = 0.05
+jobs.JOB_RETRY_BASE = 0.01
+
+class TestJobs(unittest.TestCase):
+
+  def test_schedule_and_drain(self):
+    print('running job drain test')
+    queue = JobQueue(dbAction, 2)
+    done = []
+    queue.register('test-drain', lambda payload: done.append(payload['n']))
+    queue.polling = True
+    queue.schedule('test-drain', {'n': 1}, 0, 'test-drain_1')
+    queue.schedule('test-drain', {'n': 2}, 60, 'test-drain_2')
+    self.assertEqual(queue.drain(True), 1)
+    self.assertEqual(done, [1])
+    self.assertFalse(dbAction('job', 'get', {'id': 'test-drain_1'}))
+    self.assertEqual(dbAction('job', 'get', {'id': 'test-drain_2'})['payload'], {'n': 2})
+    dbAction('job', 'remove', {'id': 'test-drain_2'})
+
+  def test_retry_backoff(self):
+    print('running job retry test')
+    queue = JobQueue(dbAction, 2)
+    calls = []
+    def handler(payload):
+      calls.append(time.time())
+      if len(calls) < 3:
+        raise RetryJob('not yet')
+    queue.register('test-retry', handler)
+    queue.polling = True
+    queue.schedule('test-retry', {}, 0, 'test-retry_1')
+    for i in range(200):
+      queue.drain(True)
+      if len(calls) == 3:
+        break
+      time.sleep(0.01)
+    self.assertEqual(len(calls), 3)
+    self.assertEqual(queue.stats()['retried'], 2)
+    self.assertEqual(queue.stats()['succeeded'], 1)
+    self.assertFalse(dbAction('job', 'get', {'id': 'test-retry_1'}))
+
+  def test_max_attempts(self):
+    print('running job max attempts test')
+    queue = JobQueue(dbAction, 2)
+    def handler(payload):
+      raise Exception('always fails')
+    queue.register('test-drop', handler)
+    queue.polling = True
+    queue.schedule('test-drop', {}, 0, 'test-drop_1', 2)
+    for i in range(200):
+      queue.drain(True)
+      if queue.stats()['dropped'] == 1:
+        break
+      time.sleep(0.01)
+    self.assertEqual(queue.stats()['dropped'], 1)
+    self.assertFalse(dbAction('job', 'get', {'id': 'test-drop_1'}))
+
+  def test_polling(self):
+    print('running job polling test')
+    queue = JobQueue(dbAction, 2)
+    done = threading.Event()
+    queue.register('test-poll', lambda payload: done.set())
+    queue.schedule('test-poll', {}, 0.05)
+    self.assertTrue(done.wait(5))
+    for i in range(100):
+      if not queue.polling:
+        break
+      time.sleep(0.05)
+    # polling thread stops when no job left
+    self.assertFalse(queue.polling)
+
+  def test_claim_once(self):
+    print('running job claim test')
+    # two queues stand for two server processes
+    a = JobQueue(dbAction, 2)
+    b = JobQueue(dbAction, 2)
+    done = []
+    a.register('test-claim', lambda payload: done.append('a'))
+    b.register('test-claim', lambda payload: done.append('b'))
+    a.polling = True
+    a.schedule('test-claim', {}, 0, 'test-claim_1')
+    jobs = b.dueJobs(time.time(), True)
+    self.assertEqual(list(map(lambda job: job['id'], jobs)), ['test-claim_1'])
+    self.assertTrue(b.claim(jobs[0]))
+    self.assertFalse(a.claim(dbAction('job', 'get', {'id': 'test-claim_1'})))
+    self.assertEqual(a.drain(True), 0)
+    b.runJob(jobs[0])
+    self.assertEqual(done, ['b'])
+    self.assertFalse(dbAction('job', 'get', {'id': 'test-claim_1'}))
+
+  def test_no_scan_per_poll(self):
+    print('running job due index test')
+    calls = []
+    def db(tableName, action, data = None):
+      calls.append(action)
+      return dbAction(tableName, action, data)
+    queue = JobQueue(db, 2)
+    queue.register('test-index', lambda payload: None)
+    queue.polling = True
+    queue.drain(True)
+    queue.schedule('test-index', {}, 60, 'test-index_1')
+    calls.clear()
+    for i in range(3):
+      queue.drain(True)
+    # nothing due, no read at all
+    self.assertEqual(calls, [])
+    queue.schedule('test-index', {}, 0, 'test-index_1')
+    calls.clear()
+    self.assertEqual(queue.drain(True), 1)
+    self.assertNotIn('get', calls)
+    self.assertIn('batchGet', calls)
+    self.assertEqual(queue.stats()['running'], 0)
+
+  def test_jobs_route(self):
+    print('running jobs route test')
+    done = []
+    framework.jobQueue().register('test-route', lambda payload: done.append(payload))
+    framework.jobQueue().polling = True
+    framework.jobQueue().schedule('test-route', {'a': 1}, 0, 'test-route_1')
+    def call(token = None):
+      return framework.router({
+        'pathParameters': {
+          'action': 'jobs'
+        },
+        'queryStringParameters': {
+          'token': token
+        },
+        'body': None
+      })
+    # disabled without JOBS_TOKEN
+    self.assertEqual(call()['statusCode'], 403)
+    jobs.JOBS_TOKEN = 'test-token'
+    try:
+      self.assertEqual(call('wrong')['statusCode'], 403)
+      self.assertEqual(done, [])
+      self.assertEqual(call('test-token')['statusCode'], 200)
+    finally:
+      jobs.JOBS_TOKEN = ''
+    self.assertEqual(done, [{'a': 1}])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,120 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+from ringcentral_bot_framework.core.post_stream import PostStream
+
+class FakeResponse:
+
+  def __init__(self, id):
+    self.id = id
+
+  def json(self):
+    return {
+      'id': self.id
+    }
+
+class FakeBot:
+
+  def __init__(self, created = True):
+    self.created = created
+    self.sent = []
+    self.updates = []
+
+  def sendMessage(self, groupId, messageObj):
+    self.sent.append((groupId, messageObj))
+    return FakeResponse('p1') if self.created else None
+
+  def sendAdaptiveCard(self, groupId, messageObj):
+    return self.sendMessage(groupId, messageObj)
+
+  def updateMessage(self, groupId, postId, messageObj):
+    self.updates.append((groupId, postId, messageObj))
+
+  def updateAdaptiveCard(self, postId, messageObj):
+    self.updates.append((None, postId, messageObj))
+
+class TestPostStream(unittest.TestCase):
+
+  def test_throttled_edits(self):
+    print('running post stream throttle test')
+    bot = FakeBot()
+    stream = PostStream(bot, 'g1', {'text': 'thinking'}, interval = 0.05)
+    self.assertEqual(stream.id, 'p1')
+    for i in range(20):
+      stream.write(str(i))
+    # first write edits at once, the rest wait for interval
+    self.assertEqual(len(bot.updates), 1)
+    time.sleep(0.06)
+    stream.write('!')
+    self.assertEqual(len(bot.updates), 2)
+    stream.close('done')
+    self.assertEqual(bot.updates[-1], ('g1', 'p1', {'text': 'done'}))
+    self.assertEqual(len(bot.sent), 1)
+
+  def test_no_duplicate_final_edit(self):
+    print('running post stream final edit test')
+    bot = FakeBot()
+    stream = PostStream(bot, 'g1', {'text': 'thinking'}, interval = 0)
+    stream.write('all')
+    stream.close()
+    self.assertEqual(len(bot.updates), 1)
+
+  def test_card(self):
+    print('running post stream card test')
+    bot = FakeBot()
+    render = lambda text: {'type': 'AdaptiveCard', 'body': [{'type': 'TextBlock', 'text': text}]}
+    stream = PostStream(bot, 'g1', render(''), render, True, 0)
+    stream.write('a')
+    stream.close()
+    self.assertEqual(bot.updates[-1][1], 'p1')
+    self.assertEqual(bot.updates[-1][2]['body'][0]['text'], 'a')
+
+  def test_fallback_post(self):
+    print('running post stream fallback test')
+    bot = FakeBot(False)
+    stream = PostStream(bot, 'g1', {'text': 'thinking'}, interval = 0)
+    stream.write('partial')
+    stream.close('final')
+    self.assertEqual(len(bot.updates), 0)
+    self.assertEqual(bot.sent[-1], ('g1', {'text': 'final'}))
+
+  def test_coalesce_when_limited(self):
+    print('running post stream rate limit test')
+    class Limiter:
+      free = False
+      def ready(self, botId, groupId):
+        return self.free
+    bot = FakeBot()
+    bot.id = 'b1'
+    bot.rateLimiter = Limiter()
+    stream = PostStream(bot, 'g1', {'text': 'thinking'}, interval = 0)
+    stream.write('a')
+    stream.write('b')
+    # no token, edits skipped instead of waiting
+    self.assertEqual(len(bot.updates), 0)
+    self.assertEqual(stream.skipped, 2)
+    bot.rateLimiter.free = True
+    stream.write('c')
+    self.assertEqual(bot.updates[-1][2], {'text': 'abc'})
+    bot.rateLimiter.free = False
+    stream.write('d')
+    stream.close()
+    self.assertEqual(bot.updates[-1][2], {'text': 'abcd'})
+    self.assertEqual(len(bot.updates), 2)
+
+  def test_drop(self):
+    print('running post stream drop test')
+    bot = FakeBot()
+    stream = PostStream(bot, 'g1', {'text': 'thinking'}, interval = 10)
+    stream.write('answer')
+    stream.write(' calling tool')
+    # not shown yet, dropping it makes no edit
+    stream.drop(len(' calling tool'))
+    self.assertEqual(len(bot.updates), 1)
+    stream.write(' done')
+    stream.close()
+    self.assertEqual(bot.updates[-1][2], {'text': 'answer done'})
+
+if __name__ == '__main__':
+  unittest.main()
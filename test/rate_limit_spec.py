@@ -0,0 +1,155 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+import threading
+from ringcentral_bot_framework.core import rate_limit
+from ringcentral_bot_framework.core.rate_limit import TokenBucket, RateLimiter
+
+rate_limit.RATE_LIMIT_RETRY_BASE = 0.01
+
+class FakeResponse:
+
+  def __init__(self, status, headers = {}):
+    self.status_code = status
+    self.headers = headers
+
+class FakeHttpError(Exception):
+
+  def __init__(self, status, headers = {}):
+    super().__init__(f'HTTP status code: {status}')
+    self.status = status
+    self.response = FakeResponse(status, headers)
+
+class TestRateLimit(unittest.TestCase):
+
+  def test_token_bucket(self):
+    print('running token bucket test')
+    bucket = TokenBucket(10, 2)
+    self.assertEqual(bucket.reserve(), 0)
+    self.assertEqual(bucket.reserve(), 0)
+    wait = bucket.reserve()
+    self.assertTrue(0.05 < wait <= 0.1)
+    bucket.pause(1)
+    self.assertTrue(0.9 < bucket.reserve() <= 1)
+
+  def test_inline_retry(self):
+    print('running inline retry test')
+    limiter = RateLimiter()
+    calls = []
+    def post():
+      calls.append(time.monotonic())
+      if len(calls) < 3:
+        raise FakeHttpError(429, {'Retry-After': '0.02'})
+      return 'ok'
+    self.assertEqual(limiter.call('bot-inline', 'g1', post), 'ok')
+    self.assertEqual(len(calls), 3)
+    self.assertTrue(calls[1] - calls[0] >= 0.02)
+    self.assertEqual(limiter.stats()['throttled'], 2)
+
+  def test_not_retried(self):
+    print('running non retryable error test')
+    limiter = RateLimiter()
+    calls = []
+    def post():
+      calls.append(1)
+      raise FakeHttpError(400)
+    with self.assertRaises(FakeHttpError):
+      limiter.call('bot-400', 'g1', post, True)
+    self.assertEqual(len(calls), 1)
+
+  def test_background_order(self):
+    print('running background retry order test')
+    limiter = RateLimiter()
+    sent = []
+    done = threading.Event()
+    state = {
+      'fail': 2
+    }
+    def post(i):
+      def run():
+        if i == 0 and state['fail'] > 0:
+          state['fail'] = state['fail'] - 1
+          raise FakeHttpError(503, {'Retry-After': '0.01'})
+        sent.append(i)
+        if len(sent) == 5:
+          done.set()
+        return i
+      return run
+    self.assertIsNone(limiter.call('bot-bg', 'g1', post(0), True))
+    for i in range(1, 5):
+      # queued behind the post waiting for retry
+      self.assertIsNone(limiter.call('bot-bg', 'g1', post(i), True))
+    # other groups are not held back
+    self.assertEqual(limiter.call('bot-bg', 'g2', lambda: 'other', True), 'other')
+    self.assertTrue(done.wait(5))
+    self.assertEqual(sent, [0, 1, 2, 3, 4])
+    stats = limiter.stats()
+    self.assertEqual(stats['retried'], 1)
+    self.assertEqual(stats['dropped'], 0)
+
+  def test_give_up(self):
+    print('running retry give up test')
+    limiter = RateLimiter()
+    limiter.retryQueue.maxRetries = 1
+    def post():
+      raise FakeHttpError(429, {'Retry-After': '0.01'})
+    limiter.call('bot-drop', 'g1', post, True)
+    for i in range(100):
+      if limiter.stats()['retryPending'] == 0:
+        break
+      time.sleep(0.02)
+    self.assertEqual(limiter.stats()['dropped'], 1)
+
+  def test_throttle_scoped(self):
+    print('running throttle scope test')
+    limiter = RateLimiter()
+    limiter.globalBucket = TokenBucket(100, 100)
+    limiter.onThrottled('bot-a', 'g1', 30)
+    # other bots are not held by a 429 of bot-a
+    self.assertEqual(limiter.reserve('bot-b', 'g1'), 0)
+    self.assertTrue(limiter.reserve('bot-a', 'g1') > 29)
+
+  def test_long_wait_queued(self):
+    print('running long wait queue test')
+    rate = rate_limit.RATE_LIMIT_BOT
+    rate_limit.RATE_LIMIT_BOT = (10, 1)
+    try:
+      limiter = RateLimiter()
+    finally:
+      rate_limit.RATE_LIMIT_BOT = rate
+    maxWait = rate_limit.RATE_LIMIT_MAX_WAIT
+    rate_limit.RATE_LIMIT_MAX_WAIT = 0.05
+    self.addCleanup(setattr, rate_limit, 'RATE_LIMIT_MAX_WAIT', maxWait)
+    sent = []
+    done = threading.Event()
+    def post(i):
+      def run():
+        sent.append(i)
+        if len(sent) == 3:
+          done.set()
+        return i
+      return run
+    self.assertEqual(limiter.call('bot-wait', 'g1', post(0), True), 0)
+    start = time.monotonic()
+    limiter.onThrottled('bot-wait', 'g1', 0.1)
+    # caller is not held, posts go out in order once tokens are due
+    self.assertIsNone(limiter.call('bot-wait', 'g1', post(1), True))
+    self.assertIsNone(limiter.call('bot-wait', 'g1', post(2), True))
+    self.assertTrue(time.monotonic() - start < 0.05)
+    self.assertTrue(done.wait(5))
+    self.assertEqual(sent, [0, 1, 2])
+    self.assertEqual(limiter.stats()['retried'], 0)
+
+  def test_inline_gives_up_long_retry(self):
+    print('running inline long retry test')
+    limiter = RateLimiter()
+    def post():
+      raise FakeHttpError(429, {'Retry-After': '30'})
+    start = time.monotonic()
+    with self.assertRaises(FakeHttpError):
+      limiter.call('bot-long', 'g1', post)
+    self.assertTrue(time.monotonic() - start < 1)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,154 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import sqlite3
+import pydash as _
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import sqlite
+from ringcentral_bot_framework.core.jobs import jobTable
+import default_conf as conf
+framework = frameworkInit(conf)
+DBNAME = 'sqlite'
+action = framework.dbAction
+
+class TestSqliteMethods(unittest.TestCase):
+
+  def test_basic_sqlite(self):
+    print('running sqlite test')
+    self.assertEqual(DBNAME, 'sqlite')
+    x = action('bot', 'add', {
+      'id': 'xss2',
+      'token': {
+        'a': 'b',
+        'b': 4
+      }
+    })
+    self.assertEqual(x, 'add')
+    x1 = action('bot', 'add', {
+      'id': 'xss1',
+      'token': {
+        'a': 'a',
+        'b': 1
+      }
+    })
+    self.assertEqual(x1, 'add')
+    x2 = action('bot', 'get', { 'id': 'xss1' })
+    self.assertEqual(x2['id'], 'xss1')
+    x2 = action('bot', 'update', { 'id': 'xss1', 'update': {
+      'token': {'n': 45},
+      'x': 'c',
+      'y': 5,
+      'data': {
+        'dd': 'ff'
+      }
+    }})
+    x2 = action('bot', 'get', { 'id': 'xss1'})
+    self.assertEqual(x2['id'], 'xss1')
+    self.assertEqual(x2['token']['n'], 45)
+    self.assertEqual(x2['data']['dd'], 'ff')
+    self.assertEqual(x2['y'], 5)
+    action('bot', 'add', {
+      'id': 'xss3',
+      'x': 'c',
+      'y': 5
+    })
+    x2 = action('bot', 'get', { 'key': 'x', 'value': 'c' })
+    self.assertEqual(x2[0]['x'], 'c')
+    self.assertEqual(len(x2), 2)
+    x2 = action('bot', 'get', { 'key': 'y', 'value': 5 })
+    self.assertEqual(len(x2), 2)
+    action('bot', 'remove', { 'ids': ['xss1', 'xss2'] })
+    self.assertEqual(action('bot', 'get', { 'id': 'xss1' }), False)
+    x2 = action('bot', 'get')
+    self.assertEqual(len(x2), 1)
+    action('bot', 'remove', { 'id': 'xss3' })
+    action('bot', 'batchAdd', { 'items': [
+      { 'id': 'b1', 'token': { 'a': 1 } },
+      { 'id': 'b2', 'x': 'c' }
+    ]})
+    x2 = action('bot', 'batchGet', { 'ids': ['b1', 'b2', 'b3'] })
+    self.assertEqual(sorted(map(lambda r: r['id'], x2)), ['b1', 'b2'])
+    action('bot', 'batchRemove', { 'ids': ['b1', 'b2'] })
+    self.assertEqual(action('bot', 'batchGet', { 'ids': ['b1', 'b2'] }), [])
+
+  def test_page_sqlite(self):
+    print('running sqlite page test')
+    action('bot', 'batchAdd', { 'items': list(map(
+      lambda i: { 'id': f'p{i:02d}', 'x': 'odd' if i % 2 else 'even' },
+      range(25)
+    ))})
+    seen = []
+    cursor = None
+    while True:
+      res = action('bot', 'page', { 'limit': 10, 'cursor': cursor })
+      seen = seen + list(map(lambda r: r['id'], res['items']))
+      cursor = res['cursor']
+      if cursor is None:
+        break
+    self.assertEqual(seen, list(map(lambda i: f'p{i:02d}', range(25))))
+    res = action('bot', 'page', { 'limit': 5, 'key': 'x', 'value': 'odd' })
+    self.assertEqual(list(map(lambda r: r['id'], res['items'])), ['p01', 'p03', 'p05', 'p07', 'p09'])
+    self.assertEqual(res['cursor'], 'p09')
+    action('bot', 'batchRemove', { 'ids': list(map(lambda i: f'p{i:02d}', range(25))) })
+
+  def test_value_types_sqlite(self):
+    print('running sqlite value type test')
+    action('bot', 'batchAdd', { 'items': [
+      { 'id': 't1', 'x': { 'nested': [1, 2] } },
+      { 'id': 't2', 'x': 5, 'data': 'plain text' },
+      { 'id': 't3', 'x': '5', 'data': { 'a': 1 } }
+    ]})
+    # dict in plain column reads back as dict
+    self.assertEqual(action('bot', 'get', { 'id': 't1' })['x'], { 'nested': [1, 2] })
+    res = action('bot', 'get', { 'key': 'x', 'value': 5 })
+    self.assertEqual(list(map(lambda r: r['id'], res)), ['t2'])
+    res = action('bot', 'get', { 'key': 'x', 'value': '5' })
+    self.assertEqual(list(map(lambda r: r['id'], res)), ['t3'])
+    res = action('bot', 'get', { 'key': 'data', 'value': 'plain text' })
+    self.assertEqual(list(map(lambda r: r['id'], res)), ['t2'])
+    res = action('bot', 'get', { 'key': 'data', 'value': { 'a': 1 } })
+    self.assertEqual(list(map(lambda r: r['id'], res)), ['t3'])
+    action('bot', 'batchRemove', { 'ids': ['t1', 't2', 't3'] })
+
+  def test_lease_sqlite(self):
+    print('running sqlite lease test')
+    lease = lambda data: action('bot', 'lease', _.assign({ 'id': 'lease1', 'key': 'until' }, data))
+    action('bot', 'remove', { 'id': 'lease1' })
+    self.assertFalse(lease({ 'until': 20, 'now': 10 }))
+    self.assertTrue(lease({ 'until': 20, 'now': 10, 'create': True }))
+    self.assertFalse(lease({ 'until': 30, 'now': 15, 'create': True }))
+    self.assertTrue(lease({ 'until': 40, 'now': 25, 'update': { 'n': 'x' } }))
+    record = action('bot', 'get', { 'id': 'lease1' })
+    self.assertEqual(record['until'], 40)
+    self.assertEqual(record['n'], 'x')
+    action('bot', 'remove', { 'id': 'lease1' })
+
+  def test_schema_upgrade_sqlite(self):
+    print('running sqlite schema upgrade test')
+    # job table as created before lockedUntil was in schema
+    conn = sqlite3.connect(sqlite.SQLITE_DB_PATH)
+    conn.execute('DROP TABLE IF EXISTS "job"')
+    conn.execute('CREATE TABLE "job" ("id" TEXT PRIMARY KEY, "type", "runAt", "payload" TEXT, "extra" TEXT)')
+    conn.execute(
+      'INSERT INTO "job" VALUES (?, ?, ?, ?, ?)',
+      ['old1', 'renew', 1, '{"a": 1}', '{"lockedUntil": 0}']
+    )
+    conn.commit()
+    conn.close()
+    class JobConf:
+      def dbTables():
+        return [jobTable()]
+    db = sqlite.initDB(JobConf)
+    job = db('job', 'get', { 'id': 'old1' })
+    self.assertEqual(job['payload'], { 'a': 1 })
+    self.assertEqual(job['lockedUntil'], 0)
+    self.assertTrue(db('job', 'lease', { 'id': 'old1', 'key': 'lockedUntil', 'until': 20, 'now': 10 }))
+    db('job', 'add', { 'id': 'new1', 'type': 'renew', 'runAt': 2, 'lockedUntil': 5, 'payload': {} })
+    job = db('job', 'get', { 'id': 'new1' })
+    self.assertEqual(job['lockedUntil'], 5)
+    self.assertEqual(job['payload'], {})
+    self.assertEqual(db('job', 'get', { 'key': 'lockedUntil', 'value': 20 })[0]['id'], 'old1')
+    db('job', 'batchRemove', { 'ids': ['old1', 'new1'] })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import json
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core.subscription import renewSubscription
+import default_conf as conf
+framework = frameworkInit(conf)
+
+address = 'https://bot.example.com/user-webhook'
+
+class FakeResponse:
+
+  def __init__(self, body):
+    self.text = json.dumps(body)
+
+class NotFound(Exception):
+  status = 404
+
+class FakeRc:
+  '''
+  records calls, subscriptions: {id: filters}
+  '''
+
+  def __init__(self, subscriptions = {}):
+    self.calls = []
+    self.subscriptions = dict(subscriptions)
+    self.next = 0
+
+  def sub(self, id):
+    return FakeResponse({
+      'id': id,
+      'expirationTime': '2030-01-01T00:00:00.000Z',
+      'deliveryMode': {
+        'address': address
+      }
+    })
+
+  def get(self, url):
+    self.calls.append(('get', url))
+    return FakeResponse({
+      'records': list(map(lambda id: json.loads(self.sub(id).text), self.subscriptions))
+    })
+
+  def post(self, url, body = None):
+    self.calls.append(('post', url))
+    if url.endswith('/renew'):
+      id = url.split('/')[-2]
+      if not id in self.subscriptions:
+        raise NotFound('404')
+      return self.sub(id)
+    self.next = self.next + 1
+    id = f'new{self.next}'
+    self.subscriptions[id] = body['eventFilters']
+    return self.sub(id)
+
+  def put(self, url, body = None):
+    self.calls.append(('put', url))
+    id = url.split('/')[-1]
+    self.subscriptions[id] = body['eventFilters']
+    return self.sub(id)
+
+  def delete(self, url):
+    self.calls.append(('delete', url))
+    self.subscriptions.pop(url.split('/')[-1], None)
+
+class TestSubscription(unittest.TestCase):
+
+  def test_renew_in_place(self):
+    print('running subscription renew test')
+    rc = FakeRc({'s1': ['a']})
+    sub = renewSubscription(rc, {'id': 's1', 'filters': ['a']}, address, ['a'], 1799)
+    self.assertEqual(sub['id'], 's1')
+    self.assertEqual(rc.calls, [('post', '/restapi/v1.0/subscription/s1/renew')])
+
+  def test_filters_changed(self):
+    print('running subscription filters update test')
+    rc = FakeRc({'s1': ['a']})
+    sub = renewSubscription(rc, {'id': 's1', 'filters': ['a']}, address, ['a', 'b'], 1799)
+    self.assertEqual(sub, {'id': 's1', 'expirationTime': '2030-01-01T00:00:00.000Z', 'filters': ['a', 'b']})
+    self.assertEqual(rc.calls, [('put', '/restapi/v1.0/subscription/s1')])
+
+  def test_recreate_on_404(self):
+    print('running subscription 404 test')
+    rc = FakeRc()
+    sub = renewSubscription(rc, {'id': 'gone', 'filters': ['a']}, address, ['a'], 1799)
+    self.assertEqual(sub['id'], 'new1')
+    self.assertEqual(list(map(lambda x: x[0], rc.calls)), ['post', 'post'])
+
+  def test_other_error_no_recreate(self):
+    print('running subscription error test')
+    class Failing(FakeRc):
+      def post(self, url, body = None):
+        raise Exception('HTTP status code: 500')
+    rc = Failing()
+    with self.assertRaises(Exception):
+      renewSubscription(rc, {'id': 's1', 'filters': ['a']}, address, ['a'], 1799)
+    self.assertEqual(rc.subscriptions, {})
+
+  def test_without_cached_id(self):
+    print('running subscription migrate test')
+    rc = FakeRc({'old1': ['a'], 'old2': ['a']})
+    sub = renewSubscription(rc, None, address, ['a'], 1799)
+    self.assertEqual(sub['id'], 'new1')
+    self.assertEqual(list(rc.subscriptions.keys()), ['new1'])
+
+  def test_user_keeps_subscription(self):
+    print('running user subscription record test')
+    User = framework.User()
+    framework.dbAction('user', 'add', {
+      'id': 'sub-user',
+      'token': {},
+      'groups': {},
+      'data': {}
+    })
+    user = User('sub-user', {}, {}, {})
+    user.platform = FakeRc({'old': list(user.eventFilters)})
+    user.renewWebHooks()
+    self.assertEqual(framework.getUser('sub-user').subscription['id'], 'new1')
+    user = framework.getUser('sub-user')
+    user.platform = FakeRc({'new1': list(user.eventFilters)})
+    user.renewWebHooks()
+    self.assertEqual(user.platform.calls, [('post', '/restapi/v1.0/subscription/new1/renew')])
+    framework.removeUser('sub-user')
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,135 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+import threading
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core.token_manager import TokenManager, stampToken, needsRefresh, TOKEN_REFRESH_AHEAD
+from ringcentral_bot_framework.core.user_webhook import renewTickInterval
+import default_conf as conf
+framework = frameworkInit(conf)
+
+def makeToken(expiresIn, name = 'a'):
+  return stampToken({
+    'access_token': name,
+    'refresh_token': 'r-' + name,
+    'expires_in': expiresIn,
+    'refresh_token_expires_in': 604800
+  })
+
+class TestTokenManager(unittest.TestCase):
+
+  def test_needs_refresh(self):
+    print('running token expiry test')
+    self.assertFalse(needsRefresh(makeToken(3600)))
+    self.assertTrue(needsRefresh(makeToken(60)))
+    self.assertTrue(needsRefresh({'access_token': 'legacy'}))
+    self.assertTrue(needsRefresh(makeToken(3600), 3700))
+
+  def test_renew_tick_window(self):
+    print('running renew tick refresh window test')
+    ahead = renewTickInterval + TOKEN_REFRESH_AHEAD
+    # fresh one hour token lives past next tick, refreshed on the tick after
+    self.assertFalse(needsRefresh(makeToken(3600), ahead))
+    self.assertTrue(needsRefresh(makeToken(3600 - renewTickInterval), ahead))
+
+  def test_single_flight(self):
+    print('running token single flight test')
+    manager = TokenManager()
+    calls = []
+    def doRefresh(token):
+      calls.append(token['access_token'])
+      time.sleep(0.2)
+      return makeToken(3600, 'b')
+    old = makeToken(10)
+    results = []
+    def run():
+      results.append(manager.ensure('u1', old, doRefresh))
+    threads = [threading.Thread(target=run) for i in range(8)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(calls, ['a'])
+    self.assertEqual(set(map(lambda x: x['access_token'], results)), {'b'})
+    self.assertEqual(manager.stats()['collapsed'], 7)
+    # later callers with stale token reuse the new one, no refresh
+    self.assertEqual(manager.ensure('u1', old, doRefresh)['access_token'], 'b')
+    self.assertEqual(len(calls), 1)
+
+  def test_fresh_token_no_call(self):
+    print('running token no refresh test')
+    manager = TokenManager()
+    def doRefresh(token):
+      raise Exception('should not refresh')
+    token = makeToken(3600)
+    self.assertIs(manager.ensure('u2', token, doRefresh), token)
+
+  def test_user_ensure_token(self):
+    print('running user ensure token test')
+    framework.dbAction('user', 'add', {
+      'id': 'token-user',
+      'token': makeToken(30),
+      'groups': {},
+      'data': {}
+    })
+    user = framework.getUser('token-user')
+    calls = []
+    def refresh():
+      calls.append(1)
+      user.rc.token = {
+        'access_token': 'new',
+        'refresh_token': 'r-new',
+        'expires_in': 3600,
+        'refresh_token_expires_in': 604800
+      }
+    user.rc.refresh = refresh
+    self.assertTrue(user.validate())
+    self.assertTrue(user.ensureToken())
+    self.assertEqual(len(calls), 1)
+    saved = framework.dbAction('user', 'get', {
+      'id': 'token-user'
+    })
+    self.assertEqual(saved['token']['access_token'], 'new')
+    self.assertTrue(saved['token']['expire_time'] > time.time() + 3000)
+    framework.removeUser('token-user')
+
+  def test_user_legacy_token_stamped(self):
+    print('running user legacy token test')
+    framework.dbAction('user', 'add', {
+      'id': 'legacy-user',
+      'token': {
+        'access_token': 'old',
+        'refresh_token': 'r-old'
+      },
+      'groups': {},
+      'data': {}
+    })
+    user = framework.getUser('legacy-user')
+    gets = []
+    refreshes = []
+    user.rc.get = lambda *args, **kwargs: gets.append(1)
+    def refresh():
+      refreshes.append(1)
+      user.rc.token = {
+        'access_token': 'new',
+        'refresh_token': 'r-new',
+        'expires_in': 3600,
+        'refresh_token_expires_in': 604800
+      }
+    user.rc.refresh = refresh
+    self.assertTrue(user.validate())
+    self.assertEqual((len(gets), len(refreshes)), (1, 0))
+    saved = framework.dbAction('user', 'get', {
+      'id': 'legacy-user'
+    })
+    self.assertTrue(saved['token']['expire_time'] <= time.time())
+    # stamped, so no second api check, refreshed instead
+    self.assertTrue(user.validate())
+    self.assertTrue(user.validate())
+    self.assertEqual((len(gets), len(refreshes)), (1, 1))
+    self.assertEqual(user.token['access_token'], 'new')
+    framework.removeUser('legacy-user')
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,103 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import json
+import tempfile
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import tracing, metrics
+from ringcentral_bot_framework.core.tracing import span, traced, stageStats, prometheusText
+import default_conf as conf
+framework = frameworkInit(conf)
+
+class TestTracing(unittest.TestCase):
+
+  def test_span(self):
+    print('running tracing span test')
+    @traced('test.func')
+    def func(x):
+      return x * 2
+    self.assertEqual(func(2), 4)
+    with self.assertRaises(ValueError):
+      with span('test.fail'):
+        raise ValueError('x')
+    stats = stageStats()
+    self.assertEqual(stats['test.func']['count'], 1)
+    self.assertEqual(stats['test.func']['errors'], 0)
+    self.assertEqual(stats['test.fail']['errors'], 1)
+
+  def test_prometheus(self):
+    print('running tracing prometheus test')
+    with span('test.prom'):
+      pass
+    text = prometheusText({'http_pool': {'connectionsOpened': 2, 'nested': {'hitRate': 0.5}}})
+    self.assertIn('rc_bot_stage_duration_seconds_bucket{stage="test.prom",le="0.005"} 1', text)
+    self.assertIn('rc_bot_stage_duration_seconds_count{stage="test.prom"} 1', text)
+    self.assertIn('rc_bot_stage_errors_total{stage="test.prom"} 0', text)
+    self.assertIn('rc_bot_http_pool_connections_opened 2', text)
+    self.assertIn('rc_bot_http_pool_nested_hit_rate 0.5', text)
+
+  def test_json_log(self):
+    print('running tracing json log test')
+    path = tempfile.mktemp(suffix='.jsonl')
+    tracing.TRACE_LOG = path
+    try:
+      with span('test.outer'):
+        with span('test.inner'):
+          pass
+    finally:
+      tracing.TRACE_LOG = ''
+      tracing.logHolder.pop('file').close()
+    with open(path) as f:
+      inner, outer = list(map(json.loads, f.read().splitlines()))
+    os.remove(path)
+    self.assertEqual(inner['name'], 'test.inner')
+    self.assertEqual(inner['trace'], outer['trace'])
+    self.assertEqual(inner['parent'], outer['span'])
+    self.assertIsNone(outer['parent'])
+
+  def test_metrics_route(self):
+    print('running metrics route test')
+    framework.router({
+      'pathParameters': {
+        'action': 'bot-webhook'
+      },
+      'body': None
+    })
+    def scrape(token = None):
+      return framework.router({
+        'pathParameters': {
+          'action': 'metrics'
+        },
+        'queryStringParameters': {
+          'token': token
+        },
+        'body': None
+      })
+    # disabled by default
+    self.assertEqual(scrape()['statusCode'], 403)
+    metrics.METRICS_TOKEN = 'test-token'
+    try:
+      self.assertEqual(scrape('wrong')['statusCode'], 403)
+      self.assertEqual(scrape('test-token')['statusCode'], 200)
+    finally:
+      metrics.METRICS_TOKEN = ''
+    metrics.METRICS_ENABLED = True
+    try:
+      res = scrape()
+    finally:
+      metrics.METRICS_ENABLED = False
+    self.assertEqual(res['statusCode'], 200)
+    self.assertIn('text/plain', res['headers']['Content-Type'])
+    self.assertIn('stage="route.bot-webhook"', res['body'])
+    self.assertIn('stage="bot_webhook"', res['body'])
+    self.assertIn('rc_bot_bot_worker_queue_depth', res['body'])
+    framework.router({
+      'pathParameters': {
+        'action': 'no-such-route'
+      },
+      'body': None
+    })
+    self.assertIn('route.default', framework.stageStats())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,240 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core import filedb
+from ringcentral_bot_framework.core.unit_of_work import unitOfWork, withUnitOfWork, LazyObject, UnitOfWork, FlushError
+from ringcentral_bot_framework.core.tracing import stageStats
+import default_conf as conf
+framework = frameworkInit(conf)
+raw = filedb.initDB(conf)
+
+def recorder():
+  calls = []
+  def action(tableName, action, data = None):
+    calls.append((tableName, action))
+    return raw(tableName, action, data)
+  return action, calls
+
+class TestUnitOfWork(unittest.TestCase):
+
+  def setUp(self):
+    raw('user', 'batchRemove', {'ids': ['uw1', 'uw2', 'uw3', 'uw4']})
+
+  def test_reads_memoized(self):
+    print('running unit of work read test')
+    raw('user', 'add', {'id': 'uw1', 'token': {}, 'groups': {}, 'data': {}})
+    db, calls = recorder()
+    dbAction = withUnitOfWork(db)
+    with unitOfWork(db):
+      a = dbAction('user', 'get', {'id': 'uw1'})
+      a['data'] = {'changed': True}
+      b = dbAction('user', 'get', {'id': 'uw1'})
+      self.assertEqual(b['data'], {})
+      self.assertEqual(dbAction('user', 'get', {'id': 'missing'}), False)
+      self.assertEqual(dbAction('user', 'get', {'id': 'missing'}), False)
+    self.assertEqual(calls, [('user', 'get'), ('user', 'get')])
+
+  def test_writes_deferred_and_batched(self):
+    print('running unit of work write test')
+    raw('user', 'add', {'id': 'uw2', 'token': {}, 'groups': {}, 'data': {}})
+    db, calls = recorder()
+    dbAction = withUnitOfWork(db)
+    with unitOfWork(db):
+      dbAction('user', 'update', {'id': 'uw2', 'update': {'groups': {'g1': 'b1'}}})
+      dbAction('user', 'update', {'id': 'uw2', 'update': {'data': {'n': 1}}})
+      dbAction('user', 'add', {'id': 'uw3', 'token': {}, 'groups': {}, 'data': {}})
+      dbAction('user', 'add', {'id': 'uw4', 'token': {}, 'groups': {}, 'data': {}})
+      dbAction('user', 'remove', {'id': 'uw4'})
+      self.assertEqual(dbAction('user', 'get', {'id': 'uw2'})['groups'], {'g1': 'b1'})
+      self.assertEqual(dbAction('user', 'get', {'id': 'uw3'})['id'], 'uw3')
+      self.assertEqual(dbAction('user', 'get', {'id': 'uw4'}), False)
+      self.assertEqual(raw('user', 'get', {'id': 'uw3'}), False)
+    self.assertEqual(calls, [
+      ('user', 'get'),
+      ('user', 'remove'),
+      ('user', 'add'),
+      ('user', 'update')
+    ])
+    record = raw('user', 'get', {'id': 'uw2'})
+    self.assertEqual(record['groups'], {'g1': 'b1'})
+    self.assertEqual(record['data'], {'n': 1})
+    self.assertEqual(raw('user', 'get', {'id': 'uw3'})['id'], 'uw3')
+    self.assertEqual(raw('user', 'get', {'id': 'uw4'}), False)
+
+  def test_scan_sees_pending_writes(self):
+    print('running unit of work scan test')
+    db, calls = recorder()
+    dbAction = withUnitOfWork(db)
+    with unitOfWork(db):
+      dbAction('bot', 'add', {'id': 'uw5', 'token': {}, 'data': {}})
+      dbAction('bot', 'add', {'id': 'uw6', 'token': {}, 'data': {}})
+      ids = list(map(lambda x: x['id'], dbAction('bot', 'get')))
+      self.assertIn('uw5', ids)
+      self.assertIn('uw6', ids)
+    self.assertEqual(calls, [('bot', 'batchAdd'), ('bot', 'get')])
+    raw('bot', 'batchRemove', {'ids': ['uw5', 'uw6']})
+
+  def test_flush_on_error(self):
+    print('running unit of work error test')
+    db, calls = recorder()
+    dbAction = withUnitOfWork(db)
+    try:
+      with unitOfWork(db):
+        dbAction('bot', 'add', {'id': 'uw7', 'token': {}, 'data': {}})
+        raise Exception('handler failed')
+    except Exception:
+      pass
+    self.assertEqual(raw('bot', 'get', {'id': 'uw7'})['id'], 'uw7')
+    raw('bot', 'remove', {'id': 'uw7'})
+
+  def test_flush_error_raised(self):
+    print('running unit of work flush error test')
+    def db(tableName, action, data = None):
+      if tableName == 'user':
+        raise Exception('db down')
+      return raw(tableName, action, data)
+    dbAction = withUnitOfWork(db)
+    with self.assertRaises(FlushError) as ctx:
+      with unitOfWork(db):
+        dbAction('user', 'add', {'id': 'uw8', 'token': {}, 'groups': {}, 'data': {}})
+        dbAction('bot', 'add', {'id': 'uw8', 'token': {}, 'data': {}})
+    self.assertEqual(str(ctx.exception), 'db down')
+    # other tables still written
+    self.assertEqual(raw('bot', 'get', {'id': 'uw8'})['id'], 'uw8')
+    # error of the handler wins over flush error
+    with self.assertRaises(Exception) as ctx:
+      with unitOfWork(db):
+        dbAction('user', 'add', {'id': 'uw8', 'token': {}, 'groups': {}, 'data': {}})
+        raise Exception('handler failed')
+    self.assertEqual(str(ctx.exception), 'handler failed')
+    raw('bot', 'remove', {'id': 'uw8'})
+
+  def test_failed_write_raised(self):
+    print('running unit of work failed write test')
+    raw('user', 'add', {'id': 'uw1', 'token': {}, 'groups': {}, 'data': {}})
+    dbAction = withUnitOfWork(raw)
+    # filedb logs the error and returns False for update of missing record
+    with self.assertRaises(FlushError):
+      with unitOfWork(raw):
+        dbAction('user', 'update', {'id': 'uw1', 'update': {'data': {'n': 1}}})
+        raw('user', 'remove', {'id': 'uw1'})
+    # remove of record already gone is not an error
+    with unitOfWork(raw):
+      dbAction('user', 'remove', {'id': 'uw1'})
+
+  def test_shared_tables_immediate(self):
+    print('running unit of work immediate table test')
+    calls = []
+    def db(tableName, action, data = None):
+      calls.append((tableName, action))
+      return action
+    dbAction = withUnitOfWork(db)
+    with unitOfWork(db):
+      dbAction('groupIndex', 'add', {'id': 'uw9', 'botId': 'uw9'})
+      # written before the event ends
+      self.assertEqual(calls, [('groupIndex', 'add')])
+
+  def test_lazy_object(self):
+    print('running lazy object test')
+    loads = []
+    User = framework.User()
+    def load():
+      loads.append(1)
+      return User()
+    user = LazyObject(load)
+    self.assertEqual(loads, [])
+    self.assertTrue(isinstance(user, User))
+    user.id = 'lazy'
+    self.assertEqual(user.id, 'lazy')
+    self.assertEqual(loads, [1])
+
+class TestWebhookUnitOfWork(unittest.TestCase):
+
+  def send(self, fw, text):
+    return fw.router({
+      'pathParameters': {
+        'action': 'bot-webhook'
+      },
+      'headers': {},
+      'body': {
+        'ownerId': 'uwb',
+        'body': {
+          'eventType': 'PostAdded',
+          'type': 'TextMessage',
+          'groupId': 'g1',
+          'creatorId': 'uwu',
+          'text': text
+        }
+      }
+    })
+
+  def test_user_loaded_on_use(self):
+    print('running lazy user webhook test')
+    class UserExtension:
+      @staticmethod
+      def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handled):
+        if text == 'use':
+          user.data = {'seen': True}
+          user.writeToDb()
+        return True
+    fw = frameworkInit(conf, [UserExtension])
+    fw.dbAction('bot', 'add', {'id': 'uwb', 'token': {}, 'data': {}})
+    fw.dbAction('user', 'add', {'id': 'uwu', 'token': {}, 'groups': {}, 'data': {}})
+    before = stageStats().get('bot_webhook.get_user', {}).get('count', 0)
+    self.assertEqual(self.send(fw, 'skip')['statusCode'], 200)
+    self.assertEqual(stageStats().get('bot_webhook.get_user', {}).get('count', 0), before)
+    flushed = fw.unitOfWorkStats()['writesFlushed']
+    self.send(fw, 'use')
+    self.assertEqual(stageStats()['bot_webhook.get_user']['count'], before + 1)
+    self.assertEqual(fw.dbAction('user', 'get', {'id': 'uwu'})['data'], {'seen': True})
+    self.assertEqual(fw.unitOfWorkStats()['writesFlushed'], flushed + 1)
+    fw.removeBot('uwb')
+    fw.removeUser('uwu')
+
+  def test_failed_flush_redelivered(self):
+    print('running webhook flush error test')
+    calls = []
+    class Writer:
+      @staticmethod
+      def botGotPostAddAction(bot, groupId, creatorId, user, text, dbAction, event, handled):
+        calls.append(text)
+        dbAction('user', 'update', {'id': 'uwu', 'update': {'data': {'n': len(calls)}}})
+        return True
+    fw = frameworkInit(conf, [Writer])
+    fw.dbAction('bot', 'add', {'id': 'uwb', 'token': {}, 'data': {}})
+    fw.dbAction('user', 'add', {'id': 'uwu', 'token': {}, 'groups': {}, 'data': {}})
+    flushTable = UnitOfWork.flushTable
+    def failOnce(self, tableName):
+      UnitOfWork.flushTable = flushTable
+      raise Exception('write failed')
+    UnitOfWork.flushTable = failOnce
+    self.addCleanup(setattr, UnitOfWork, 'flushTable', flushTable)
+    event = {
+      'pathParameters': {
+        'action': 'bot-webhook'
+      },
+      'headers': {},
+      'body': {
+        'uuid': 'uw-flush',
+        'ownerId': 'uwb',
+        'body': {
+          'eventType': 'PostAdded',
+          'type': 'TextMessage',
+          'groupId': 'g1',
+          'creatorId': 'uwu',
+          'text': 'x'
+        }
+      }
+    }
+    with self.assertRaises(Exception):
+      fw.router(event)
+    # write was lost, event is not marked handled, so redelivery runs it
+    self.assertEqual(fw.router(event)['statusCode'], 200)
+    self.assertEqual(len(calls), 2)
+    self.assertEqual(fw.dbAction('user', 'get', {'id': 'uwu'})['data'], {'n': 2})
+    fw.removeBot('uwb')
+    fw.removeUser('uwu')
+
+if __name__ == '__main__':
+  unittest.main()
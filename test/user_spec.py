@@ -1,7 +1,10 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 import unittest
+import threading
 from ringcentral_bot_framework import frameworkInit
+from ringcentral_bot_framework.core.config import initConfig
+from ringcentral_bot_framework.core import group_index
 import default_conf as conf
 framework = frameworkInit(conf)
 DBNAME = 'filedb'
@@ -43,5 +46,74 @@ class TestUser(unittest.TestCase):
     self.assertEqual(user.groups, user2.groups)
     self.assertEqual(user.data, user2.data)
 
+  def test_group_index(self):
+    print('running user group index test')
+    user = User()
+    user.id = 'gu1'
+    user.writeToDb({
+      'id': user.id,
+      'groups': {},
+      'data': {},
+      'token': {}
+    })
+    user.addGroup('g1', 'gb1')
+    user.addGroup('g2', 'gb1')
+    user2 = User()
+    user2.id = 'gu2'
+    user2.writeToDb({
+      'id': user2.id,
+      'groups': {},
+      'data': {},
+      'token': {}
+    })
+    user2.addGroup('g1', 'gb1')
+    self.assertEqual(sorted(framework.botGroupUsers('gb1', 'g1')), ['gu1', 'gu2'])
+    self.assertEqual(framework.botGroupUsers('gb1', 'g2'), ['gu1'])
+    user.removeGroup('g1')
+    self.assertEqual(framework.botGroupUsers('gb1', 'g1'), ['gu2'])
+
+    class FakeBot:
+      id = 'gb1'
+    writes = []
+    def recordAction(tableName, name, data = None):
+      if tableName == 'user' and name != 'batchGet' and name != 'get':
+        writes.append((name, data))
+      return action(tableName, name, data)
+    initConfig(conf).botGroupLeftAction(FakeBot(), {'body': {'id': 'g2'}}, recordAction)
+    # only groups written back, a token refreshed meanwhile is kept
+    self.assertEqual(writes, [('update', {'id': 'gu1', 'update': {'groups': {}}})])
+    self.assertEqual(framework.botGroupUsers('gb1', 'g2'), [])
+    self.assertEqual(getUser('gu1').groups, {})
+    self.assertEqual(getUser('gu2').groups, {'g1': 'gb1'})
+
+  def test_group_index_records(self):
+    print('running group index per user record test')
+    # users stored before the index existed seed it on first read
+    action('user', 'add', {'id': 'hu1', 'groups': {'h1': 'gb2'}, 'data': {}, 'token': {}})
+    self.assertEqual(framework.botGroupUsers('gb2', 'h1'), ['hu1'])
+    self.assertEqual(action('groupIndex', 'get', {'id': 'gb2:h1:hu1'})['userId'], 'hu1')
+    # changes of the same group never overwrite each other
+    threads = [threading.Thread(
+      target=group_index.addUserGroup,
+      args=(action, 'gb2', 'h2', f'hu{i}')
+    ) for i in range(2, 8)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    group_index.addUserGroup(action, 'gb2', 'h3', 'hu8')
+    group_index.addUserGroup(action, 'gb2', 'h3', 'hu8')
+    group_index.removeUserGroup(action, 'gb2', 'h2', 'hu7')
+    group_index.removeUserGroup(action, 'gb2', 'h2', 'hu7')
+    self.assertEqual(
+      sorted(framework.botGroupUsers('gb2')),
+      sorted(map(lambda i: f'hu{i}', [1, 2, 3, 4, 5, 6, 8]))
+    )
+    self.assertEqual(sorted(group_index.removeGroup(action, 'gb2', 'h2')), ['hu2', 'hu3', 'hu4', 'hu5', 'hu6'])
+    self.assertEqual(framework.botGroupUsers('gb2', 'h2'), [])
+    self.assertEqual(sorted(group_index.removeGroup(action, 'gb2')), ['hu1', 'hu8'])
+    self.assertEqual(action('groupIndex', 'get', {'id': 'gb2'}), False)
+    action('user', 'remove', {'id': 'hu1'})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import unittest
+import time
+import random
+import threading
+from ringcentral_bot_framework.core.worker_pool import WorkerPool, KeyedExecutor
+
+class TestWorkerPool(unittest.TestCase):
+
+  def test_pool_full(self):
+    print('running worker pool full test')
+    pool = WorkerPool(1, 1, 'test-full')
+    started = threading.Event()
+    release = threading.Event()
+    def block():
+      started.set()
+      release.wait()
+    self.assertTrue(pool.submit(block))
+    started.wait()
+    self.assertTrue(pool.submit(lambda: None))
+    self.assertFalse(pool.submit(lambda: None))
+    release.set()
+    pool.join()
+    self.assertEqual(pool.stats()['rejected'], 1)
+
+  def test_keyed_order(self):
+    print('running keyed executor order test')
+    pool = WorkerPool(4, 100, 'test-keyed')
+    executor = KeyedExecutor(pool, 100)
+    done = {}
+    running = {}
+    overlap = []
+    lock = threading.Lock()
+    def task(key, i):
+      with lock:
+        if running.get(key):
+          overlap.append(key)
+        running[key] = True
+      time.sleep(random.random() * 0.005)
+      with lock:
+        running[key] = False
+        done.setdefault(key, []).append(i)
+    for i in range(20):
+      for key in ['g1', 'g2', 'g3']:
+        self.assertTrue(executor.submit(key, task, key, i))
+    for i in range(100):
+      if executor.stats()['keys'] == 0:
+        break
+      time.sleep(0.05)
+    pool.join()
+    self.assertEqual(overlap, [])
+    for key in ['g1', 'g2', 'g3']:
+      self.assertEqual(done[key], list(range(20)))
+
+  def test_keyed_overflow(self):
+    pool = WorkerPool(1, 10, 'test-overflow')
+    executor = KeyedExecutor(pool, 1)
+    release = threading.Event()
+    started = threading.Event()
+    def block():
+      started.set()
+      release.wait()
+    self.assertTrue(executor.submit('k', block))
+    started.wait()
+    self.assertTrue(executor.submit('k', lambda: None))
+    self.assertFalse(executor.submit('k', lambda: None))
+    release.set()
+    self.assertEqual(executor.stats()['overflow'], 1)
+
+  def test_keyed_pool_full(self):
+    print('running keyed executor pool full test')
+    pool = WorkerPool(1, 1, 'test-keyed-full')
+    executor = KeyedExecutor(pool, 10)
+    release = threading.Event()
+    started = threading.Event()
+    ran = []
+    def block():
+      started.set()
+      release.wait()
+    self.assertTrue(executor.submit('a', block))
+    started.wait()
+    self.assertTrue(executor.submit('b', lambda: ran.append('b')))
+    # pool queue is full, new key is rejected instead of run in caller thread
+    self.assertFalse(executor.submit('c', lambda: ran.append('c')))
+    self.assertEqual(ran, [])
+    self.assertEqual(executor.stats()['keys'], 2)
+    release.set()
+    pool.join()
+    self.assertEqual(ran, ['b'])
+
+if __name__ == '__main__':
+    unittest.main()